@@ -4,6 +4,7 @@ from os import path
 from dotenv import load_dotenv
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from sqlalchemy import event
 
 # Load environment variables
 load_dotenv()
@@ -17,35 +18,81 @@ def create_app():
 
     # Database configuration
     app.config['SECRET_KEY'] = 'dfahdsjfheal'
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_NAME}'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', f'sqlite:///{DB_NAME}')
+    # How long a write waits for another writer's lock before failing with "database is locked"
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+    # Generation job queue configuration
+    app.config['JOB_BACKEND'] = os.getenv('JOB_BACKEND', 'local')  # 'local' (threads) or 'process'
+    app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 2))
+    app.config['JOB_QUEUE_DEPTH'] = int(os.getenv('JOB_QUEUE_DEPTH', 8))
+    # Import the video and ML stacks and create the API clients as each worker starts, instead of in its first job
+    app.config['PRELOAD_WORKERS'] = os.getenv('PRELOAD_WORKERS', '0') == '1'
+    # Load and warm up the Whisper models (WHISPER_MODEL / WHISPER_MODELS) as each worker starts
+    app.config['WHISPER_WARMUP'] = os.getenv('WHISPER_WARMUP', '0') == '1'
+    # Transcode the gameplay sources into 1080x1920 proxies at startup instead of on first use
+    app.config['PREBUILD_GAMEPLAY_PROXIES'] = os.getenv('PREBUILD_GAMEPLAY_PROXIES', '0') == '1'
+    # Keep the listings of the index page's subreddits warm so /get_story answers from memory
+    app.config['STORY_REFRESHER'] = os.getenv('STORY_REFRESHER', '1') == '1'
+    # Seconds between sweeps of generated_files for the disk quota and age limit; 0 disables them
+    app.config['ARTIFACT_SWEEP_INTERVAL'] = float(os.getenv('ARTIFACT_SWEEP_INTERVAL', 300))
 
     # Initialize SQLAlchemy and Flask-Migrate
     db.init_app(app)
 
+    from .jobs import init_jobs
+    init_jobs(app)
+
+    if app.config['PREBUILD_GAMEPLAY_PROXIES']:
+        from .gameplay_proxies import prebuild_proxies_in_background
+        prebuild_proxies_in_background()
+
+    if app.config['STORY_REFRESHER']:
+        from .reddit_scraper import story_cache
+        story_cache.start_refresher()
+
+    if app.config['ARTIFACT_SWEEP_INTERVAL'] > 0:
+        from .artifact_store import artifact_store
+        artifact_store.start_sweeper(app.config['ARTIFACT_SWEEP_INTERVAL'])
+
     from .auth import auth
     app.register_blueprint(auth, url_prefix='/')
     from .views import views
     app.register_blueprint(views)
 
 
-    from .models import User
+    from .models import upgrade_schema
 
     with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', _sqlite_pragmas(app.config['SQLITE_BUSY_TIMEOUT_MS']))
         db.create_all()
+        upgrade_schema()
 
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
     login_manager.init_app(app)
 
-    @login_manager.user_loader
-    def load_user(id):
-        return User.query.get(int(id))
+    from .user_cache import load_user
+    login_manager.user_loader(load_user)
 
 
     # Import and register blueprints
     return app
 
 
+def _sqlite_pragmas(busy_timeout_ms):
+    def configure(connection, connection_record):
+        cursor = connection.cursor()
+        # WAL lets requests read while render workers write, and writers wait for each
+        # other's locks instead of failing straight away
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        cursor.close()
+    return configure
+
+
 def create_database(app):
     if not path.exists('website/' + DB_NAME):
         db.create_all(app=app)
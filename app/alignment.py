@@ -0,0 +1,186 @@
+import numpy as np
+from app import audio_assets
+
+SAMPLE_RATE = audio_assets.WHISPER_SAMPLE_RATE
+FRAME_SECONDS = 0.02  # 20 ms analysis frames
+MIN_PAUSE_SECONDS = 0.15  # shorter dips in energy are treated as part of the speech
+MIN_SPEECH_SECONDS = 0.06  # shorter bursts of energy are treated as noise
+
+# Extra weight given to a word followed by punctuation, since TTS voices pause there
+PUNCTUATION_WEIGHTS = {',': 1.5, ';': 2.0, ':': 2.0, '.': 3.0, '!': 3.0, '?': 3.0}
+SENTENCE_ENDS = '.!?'
+# Seconds of pause, beyond a typical one, that matching a sentence end to a pause this many
+# seconds away from where the words' weights place it costs
+DRIFT_PENALTY = 0.05
+
+
+def _frame_energy(samples):
+    frame_length = int(SAMPLE_RATE * FRAME_SECONDS)
+    frame_count = len(samples) // frame_length
+    frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+    return np.sqrt(np.mean(frames ** 2, axis=1))
+
+
+def _fill_runs(mask, value, max_frames):
+    """Flips runs of `value` shorter than max_frames that lie between runs of the other value."""
+    mask = mask.copy()
+    edges = np.flatnonzero(np.diff(mask.astype(np.int8))) + 1
+    bounds = np.concatenate(([0], edges, [len(mask)]))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if mask[start] == value and end - start < max_frames and start > 0 and end < len(mask):
+            mask[start:end] = not value
+    return mask
+
+
+def detect_speech_regions(samples):
+    """
+    Finds the voiced regions of a narration from its short-time energy.
+
+    Args:
+        samples (np.ndarray): 16 kHz mono float32 samples.
+
+    Returns:
+        List[Tuple[float, float]]: Start and end times, in seconds, of each voiced region.
+    """
+    energy = _frame_energy(samples)
+    if not len(energy) or not energy.max():
+        return []
+
+    # TTS output has a near-silent noise floor, so a threshold between the floor
+    # and typical speech energy separates pauses cleanly.
+    floor = np.percentile(energy, 10)
+    speech = np.percentile(energy, 90)
+    voiced = energy > floor + 0.1 * (speech - floor)
+
+    voiced = _fill_runs(voiced, False, int(MIN_PAUSE_SECONDS / FRAME_SECONDS))
+    voiced = _fill_runs(voiced, True, int(MIN_SPEECH_SECONDS / FRAME_SECONDS))
+
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], voiced.astype(np.int8), [0]))))
+    return [(float(start * FRAME_SECONDS), float(end * FRAME_SECONDS)) for start, end in zip(edges[::2], edges[1::2])]
+
+
+def _word_weight(word, pause_follows=True):
+    letters = sum(c.isalnum() for c in word)
+    return max(letters, 1) + (PUNCTUATION_WEIGHTS.get(word[-1], 0) if pause_follows else 0)
+
+
+def _spread_words(regions, words):
+    """
+    Lays words out over the voiced regions in proportion to their weights. The pause after
+    the last word lies outside the regions, so its punctuation adds no weight.
+    """
+    region_starts = np.array([start for start, _ in regions])
+    region_lengths = np.array([end - start for start, end in regions])
+    voiced_offsets = np.concatenate(([0], np.cumsum(region_lengths)))
+
+    weights = np.array([_word_weight(word) for word in words[:-1]] + [_word_weight(words[-1], pause_follows=False)],
+                       dtype=np.float64)
+    boundaries = np.concatenate(([0], np.cumsum(weights))) / weights.sum() * voiced_offsets[-1]
+
+    # Map positions on the voiced-only timeline back to times in the audio
+    region_index = np.clip(np.searchsorted(voiced_offsets, boundaries, side='right') - 1, 0, len(regions) - 1)
+    times = region_starts[region_index] + (boundaries - voiced_offsets[region_index])
+
+    # A word ending exactly on a region boundary should end with that region, not
+    # at the start of the next one.
+    ends = times[1:].copy()
+    at_boundary = np.isin(boundaries[1:], voiced_offsets[1:-1])
+    ends[at_boundary] = (region_starts + region_lengths)[region_index[1:][at_boundary] - 1]
+
+    return list(zip(times[:-1].tolist(), ends.tolist(), words))
+
+
+def _sentence_anchors(regions, words):
+    """
+    Matches the sentence ends of the script to pauses in the audio, so errors in the
+    weight-based layout don't carry over from one sentence into the next.
+
+    A sentence end is matched to a pause, in order, when the pause is longer than a typical
+    one by more than DRIFT_PENALTY times the distance between the two; ends without such a
+    pause are left to the layout.
+
+    Returns:
+        List[Tuple[int, int]]: Index of the last word of each anchored sentence and of the
+        last region it is spoken in.
+    """
+    ends = [i for i, word in enumerate(words[:-1]) if word[-1] in SENTENCE_ENDS]
+    if not ends or len(regions) < 2:
+        return []
+
+    pauses = np.array([next_start - end for (_, end), (next_start, _) in zip(regions[:-1], regions[1:])])
+    region_lengths = np.array([end - start for start, end in regions])
+    # Positions on the voiced-only timeline: where each pause falls and where the weights put each sentence end
+    pause_positions = np.cumsum(region_lengths)[:-1]
+    weights = np.cumsum([_word_weight(word) for word in words])
+    end_positions = weights[ends] / weights[-1] * region_lengths.sum()
+    scores = (pauses - np.median(pauses))[None, :] - DRIFT_PENALTY * np.abs(end_positions[:, None] - pause_positions[None, :])
+
+    # Best monotone matching of sentence ends to pauses, where either may go unmatched
+    best = np.zeros((len(ends) + 1, len(pauses) + 1))
+    for i in range(1, len(ends) + 1):
+        for j in range(1, len(pauses) + 1):
+            best[i, j] = max(best[i - 1, j], best[i, j - 1], best[i - 1, j - 1] + scores[i - 1, j - 1])
+
+    anchors = []
+    i, j = len(ends), len(pauses)
+    while i and j:
+        if best[i, j] == best[i - 1, j]:
+            i -= 1
+        elif best[i, j] == best[i, j - 1]:
+            j -= 1
+        else:
+            anchors.append((ends[i - 1], j - 1))
+            i, j = i - 1, j - 1
+    return anchors[::-1]
+
+
+def align_words(samples, words):
+    """
+    Assigns a start and end time to each word of a known script.
+
+    Sentence ends are first matched to the longer pauses of the narration. Within each
+    sentence, words are laid out over the voiced regions of the audio in proportion to
+    their length, so pauses in the narration are skipped rather than spread across
+    neighbouring words.
+
+    Args:
+        samples (np.ndarray): 16 kHz mono float32 samples of the narration.
+        words (List[str]): The script, split into words.
+
+    Returns:
+        List[Tuple[float, float, str]]: Start time, end time and text of each word.
+    """
+    regions = detect_speech_regions(samples)
+    if not regions or not words:
+        return []
+
+    timed_words = []
+    first_word = first_region = 0
+    for last_word, last_region in _sentence_anchors(regions, words) + [(len(words) - 1, len(regions) - 1)]:
+        timed_words += _spread_words(regions[first_region:last_region + 1], words[first_word:last_word + 1])
+        first_word, first_region = last_word + 1, last_region + 1
+    return timed_words
+
+
+def align_subtitles(audio, script, words_per_chunk=3):
+    """
+    Produces subtitle chunks for narration whose exact text is already known, without
+    running a full transcription.
+
+    Args:
+        audio (str | np.ndarray): Path to the narration audio, or 16 kHz mono float32 samples.
+        script (str): The text that was sent to text-to-speech.
+        words_per_chunk (int): Number of words shown at a time.
+
+    Returns:
+        List[Tuple[float, float, List[str]]]: Start time, end time and words of each subtitle,
+        in the same form as generate_subtitles().
+    """
+    samples = audio_assets.load(audio).for_whisper() if isinstance(audio, str) else audio
+    timed_words = align_words(samples, script.split())
+
+    subtitles = []
+    for i in range(0, len(timed_words), words_per_chunk):
+        chunk = timed_words[i:i + words_per_chunk]
+        subtitles.append((chunk[0][0], chunk[-1][1], [word for _, _, word in chunk]))
+    return subtitles
@@ -0,0 +1,75 @@
+import os
+from datetime import datetime, timezone
+from flask import current_app, request
+from werkzeug.datastructures import ContentRange
+from werkzeug.http import is_resource_modified
+from werkzeug.wsgi import wrap_file
+
+# Artifact names are unique and their content never changes, so clients may cache them
+ARTIFACT_CACHE_SECONDS = int(os.getenv('ARTIFACT_CACHE_SECONDS', 24 * 3600))
+READ_CHUNK_BYTES = 256 * 1024
+
+
+def _read_range(f, length):
+    """Yields length bytes from the file's current position, then closes it."""
+    try:
+        while length > 0:
+            chunk = f.read(min(READ_CHUNK_BYTES, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _if_range_matches(artifact, last_modified):
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == artifact.etag
+    if if_range.date is not None:
+        return if_range.date >= last_modified
+    return True
+
+
+def artifact_response(artifact):
+    """
+    Builds the response for a GET or HEAD of an artifact, answering conditional requests
+    with 304 and single Range requests with 206.
+
+    The file is handed to the server through wsgi.file_wrapper whenever the body runs to the
+    end of the file (full downloads and the open-ended ranges players use to seek), so
+    servers that implement it, like gunicorn, send it with sendfile() from the requested
+    offset. Ranges that stop short of the end are streamed in chunks instead.
+    """
+    last_modified = datetime.fromtimestamp(int(artifact.modified), tz=timezone.utc)
+    response = current_app.response_class(mimetype=artifact.content_type, direct_passthrough=True)
+    response.set_etag(artifact.etag)
+    response.last_modified = last_modified
+    response.accept_ranges = 'bytes'
+    response.cache_control.private = True
+    response.cache_control.max_age = ARTIFACT_CACHE_SECONDS
+
+    if not is_resource_modified(request.environ, etag=artifact.etag, last_modified=last_modified):
+        response.status_code = 304
+        return response
+
+    start, stop = 0, artifact.size
+    if request.range is not None and _if_range_matches(artifact, last_modified):
+        bounds = request.range.range_for_length(artifact.size)
+        if bounds is None:
+            response.status_code = 416
+            response.content_range = ContentRange('bytes', None, None, artifact.size)
+            return response
+        start, stop = bounds
+        response.status_code = 206
+        response.content_range = ContentRange('bytes', start, stop, artifact.size)
+
+    response.content_length = stop - start
+    if request.method == 'HEAD':
+        return response
+
+    f = open(artifact.path, 'rb')
+    f.seek(start)
+    response.response = wrap_file(request.environ, f) if stop == artifact.size else _read_range(f, stop - start)
+    return response
@@ -0,0 +1,232 @@
+import os
+import time
+import logging
+import mimetypes
+import threading
+from app import metrics
+
+ARTIFACT_DIR = os.getenv('ARTIFACT_DIR', './generated_files')
+# Disk space the artifacts may take before the least recently used are evicted
+ARTIFACT_QUOTA_BYTES = int(os.getenv('ARTIFACT_QUOTA_BYTES', 5 * 2**30))
+# Artifacts not accessed for this long are evicted regardless of the quota
+ARTIFACT_MAX_AGE = float(os.getenv('ARTIFACT_MAX_AGE', 7 * 24 * 3600))
+# Serving an artifact records the access at most this often, to keep range requests cheap
+TOUCH_INTERVAL = 60
+# Kinds of file the app writes to the store (see Artifact.kind); other files there are never evicted
+ARTIFACT_KINDS = ('speech', 'profile', 'tiktok')
+
+
+class Artifact:
+    """
+    Metadata of one generated file, read from the file system so every worker process
+    sees the same thing.
+
+    Attributes:
+        name (str): File name, unique within the store.
+        path (str): Absolute path.
+        kind (str): What the file is, from its name: 'speech', 'profile', 'tiktok', ...
+        content_type (str): MIME type, from the extension.
+        size (int): Size in bytes.
+        modified (float): When the file was written.
+        last_access (float): When the file was last written, served or reused.
+    """
+
+    def __init__(self, name, path, stat):
+        self.name = name
+        self.path = path
+        self.kind = name.split('_', 1)[0]
+        self.content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.size = stat.st_size
+        self.modified = stat.st_mtime
+        self.last_access = max(stat.st_atime, stat.st_mtime)
+        self._mtime_ns = stat.st_mtime_ns
+
+    @property
+    def etag(self):
+        # Artifacts are never rewritten in place, so size and write time identify the content
+        return f"{self._mtime_ns:x}-{self.size:x}"
+
+
+class ArtifactStore:
+    """
+    The generated files (narration, profile pictures, videos) in one directory, kept under
+    a disk quota.
+
+    Access times are stored as the files' atime, so recency survives restarts and is shared
+    between processes, while mtime (and with it the ETag) stays that of the write. Only the
+    kinds of file the app writes (ARTIFACT_KINDS) are managed: cache subdirectories such as
+    the TTS cache and gameplay proxies manage their own size, and other files (e.g. the
+    tracked placeholder.txt) are left alone.
+
+    `in_use()` returns the names of artifacts that must not be evicted; by default, those
+    the in-flight jobs need. `retained()` returns those kept despite the quota until they
+    expire; by default, those finished drafts need to be promoted.
+    """
+
+    def __init__(self, directory=ARTIFACT_DIR, quota_bytes=ARTIFACT_QUOTA_BYTES, max_age=ARTIFACT_MAX_AGE,
+                 in_use=None, retained=None):
+        self.directory = os.path.abspath(directory)
+        self.quota_bytes = quota_bytes
+        self.max_age = max_age
+        self.in_use = in_use or self._in_flight_artifacts
+        self.retained = retained or self._draft_artifacts
+        self.total_bytes = 0
+        self._sweep_lock = threading.Lock()
+        self._sweeper = None
+
+    def path(self, name):
+        """Returns the path a new artifact called name is written to."""
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, name)
+
+    def get(self, name):
+        """Returns the artifact called name, or None if there is none."""
+        if not name or name != os.path.basename(name) or name.startswith('.') or '.tmp' in name:
+            return None
+        path = os.path.join(self.directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+        return Artifact(name, path, stat)
+
+    def touch(self, artifact_or_path):
+        """Records that an artifact was used, keeping its write time."""
+        if isinstance(artifact_or_path, Artifact):
+            artifact = artifact_or_path
+            if time.time() - artifact.last_access < TOUCH_INTERVAL:
+                return
+            path, mtime_ns = artifact.path, artifact._mtime_ns
+        else:
+            path = artifact_or_path
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                return
+        try:
+            os.utime(path, ns=(time.time_ns(), mtime_ns))
+        except OSError:
+            pass
+
+    def artifacts(self):
+        """Returns every artifact of ARTIFACT_KINDS in the store, least recently used first."""
+        found = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return found
+        for entry in entries:
+            if entry.name.split('_', 1)[0] not in ARTIFACT_KINDS or '.tmp' in entry.name:
+                continue
+            try:
+                if entry.is_file(follow_symlinks=False):
+                    found.append(Artifact(entry.name, entry.path, entry.stat(follow_symlinks=False)))
+            except OSError:
+                continue
+        found.sort(key=lambda artifact: artifact.last_access)
+        return found
+
+    def sweep(self):
+        """
+        Evicts artifacts not accessed for max_age seconds, then the least recently used ones
+        until the store fits its quota. Artifacts in use are never evicted, and retained ones
+        only once they expire.
+
+        Returns:
+            List[str]: Names of the evicted artifacts.
+        """
+        with self._sweep_lock:
+            artifacts = self.artifacts()
+            total = sum(artifact.size for artifact in artifacts)
+            protected = self.in_use()
+            retained = self.retained()
+            cutoff = time.time() - self.max_age
+            evicted = []
+            for artifact in artifacts:
+                expired = artifact.last_access < cutoff
+                if not expired and total <= self.quota_bytes:
+                    break
+                if artifact.name in protected or (not expired and artifact.name in retained):
+                    continue
+                try:
+                    os.remove(artifact.path)
+                except OSError as e:
+                    logging.warning(f"Could not evict artifact {artifact.name}: {e}")
+                    continue
+                total -= artifact.size
+                evicted.append(artifact.name)
+                metrics.inc('artifact_evictions_total', reason='age' if expired else 'quota', kind=artifact.kind)
+            self.total_bytes = total
+        if total > self.quota_bytes:
+            logging.warning(f"Artifact store is {total - self.quota_bytes} bytes over quota; the rest is in use or retained")
+        return evicted
+
+    def _in_flight_artifacts(self):
+        """
+        Names of the artifacts the queued and running jobs may need: those their arguments
+        refer to (a profile picture, or a draft's narration when it is promoted), and
+        everything written or used since the oldest of them was queued, which covers what
+        they produce.
+        """
+        from app.jobs import job_queue
+        jobs = job_queue.in_flight()
+        if not jobs:
+            return set()
+        names = {os.path.basename(path) for job in jobs for path in _paths_in(job.args)}
+        since = min(job.created_at for job in jobs)
+        names.update(artifact.name for artifact in self.artifacts() if artifact.last_access >= since)
+        return names
+
+    def _draft_artifacts(self):
+        """
+        Names of the artifacts of finished drafts that have not been promoted yet (or whose
+        promotion failed): the narration, profile picture and draft video the final render
+        starts from.
+        """
+        from app.jobs import job_queue, FAILED
+        names = set()
+        for job in job_queue.done():
+            result = job.result
+            if not isinstance(result, dict) or not result.get('draft'):
+                continue
+            if job.promoted_to is not None:
+                promotion = job_queue.get(job.promoted_to)
+                if promotion is None or promotion.state != FAILED:
+                    continue
+            paths = list(_paths_in(result.get('artifacts'))) + [result.get('video_url') or '']
+            names.update(os.path.basename(path) for path in paths)
+        return names
+
+    def start_sweeper(self, interval):
+        """Starts a background thread that sweeps every interval seconds. Starting it again does nothing."""
+        if self._sweeper is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.sweep()
+                except Exception:
+                    logging.exception("Artifact sweep failed")
+                time.sleep(interval)
+
+        self._sweeper = threading.Thread(target=run, name='artifact-sweeper', daemon=True)
+        self._sweeper.start()
+
+
+def _paths_in(value):
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _paths_in(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _paths_in(item)
+
+
+artifact_store = ArtifactStore()
+metrics.gauge('artifact_store_bytes', 'Size of the generated artifacts as of the last sweep.',
+              lambda: artifact_store.total_bytes)
@@ -0,0 +1,124 @@
+import os
+import uuid
+import threading
+import subprocess
+from collections import OrderedDict
+import numpy as np
+from imageio_ffmpeg import get_ffmpeg_exe
+from moviepy.audio.AudioClip import AudioArrayClip
+from app import metrics
+
+# Narration is kept at the rate the TTS API produces raw PCM at, so it is never resampled
+# between synthesis and compositing
+NARRATION_SAMPLE_RATE = 24000
+# Whisper (and the aligner) take 16 kHz mono float32 samples
+WHISPER_SAMPLE_RATE = 16000
+AUDIO_ASSET_CACHE_SIZE = int(os.getenv('AUDIO_ASSET_CACHE_SIZE', 16))
+
+_assets = OrderedDict()  # (path, mtime, size) -> AudioAsset
+_assets_lock = threading.Lock()
+
+
+class AudioAsset:
+    """
+    Decoded narration: mono float32 samples in [-1, 1], shared by everything that needs the
+    audio of one file so it is decoded only once.
+
+    Attributes:
+        samples (np.ndarray): Read-only mono float32 samples.
+        sample_rate (int): Samples per second.
+    """
+
+    def __init__(self, samples, sample_rate=NARRATION_SAMPLE_RATE):
+        samples = np.ascontiguousarray(samples, dtype=np.float32)
+        samples.flags.writeable = False
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self._whisper_samples = None
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.sample_rate
+
+    def for_whisper(self):
+        """Returns the samples resampled to 16 kHz, as Whisper and the aligner expect."""
+        if self._whisper_samples is None:
+            if self.sample_rate == WHISPER_SAMPLE_RATE:
+                self._whisper_samples = self.samples
+            else:
+                # Linear interpolation is enough here: TTS speech has little energy near
+                # the 8 kHz Nyquist limit, and both consumers only look at speech content.
+                count = int(round(len(self.samples) * WHISPER_SAMPLE_RATE / self.sample_rate))
+                positions = np.arange(count) * (self.sample_rate / WHISPER_SAMPLE_RATE)
+                resampled = np.interp(positions, np.arange(len(self.samples)), self.samples).astype(np.float32)
+                resampled.flags.writeable = False
+                self._whisper_samples = resampled
+        return self._whisper_samples
+
+    def clip(self):
+        """Returns an array-backed moviepy audio clip of the samples."""
+        # moviepy writes every frame as stereo, so present the mono buffer as two channels;
+        # broadcast_to shares the memory instead of copying it
+        return AudioArrayClip(np.broadcast_to(self.samples[:, None], (len(self.samples), 2)), fps=self.sample_rate)
+
+
+def pcm16_to_samples(data):
+    """Converts raw 16-bit little-endian mono PCM to float32 samples."""
+    return np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768.0
+
+
+def decode(path, sample_rate=NARRATION_SAMPLE_RATE):
+    """Decodes an audio file to mono float32 samples with one ffmpeg process."""
+    command = [get_ffmpeg_exe(), '-loglevel', 'error', '-i', path,
+               '-f', 'f32le', '-ac', '1', '-ar', str(sample_rate), '-']
+    result = subprocess.run(command, capture_output=True, check=True)
+    return AudioAsset(np.frombuffer(result.stdout, dtype='<f4'), sample_rate)
+
+
+def encode(asset, path):
+    """Encodes an asset to the audio file at path; the format follows the file extension."""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp{os.path.splitext(path)[1]}"
+    command = [get_ffmpeg_exe(), '-y', '-loglevel', 'error',
+               '-f', 'f32le', '-ac', '1', '-ar', str(asset.sample_rate), '-i', '-', tmp_path]
+    try:
+        subprocess.run(command, input=asset.samples.tobytes(), capture_output=True, check=True)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _key(path):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def register(path, asset):
+    """Records the decoded audio of a file that was just written, so it is never decoded."""
+    key = _key(path)
+    with _assets_lock:
+        _assets[key] = asset
+        _assets.move_to_end(key)
+        while len(_assets) > AUDIO_ASSET_CACHE_SIZE:
+            _assets.popitem(last=False)
+
+
+def load(path):
+    """
+    Returns the decoded audio of a file, decoding it on first use.
+
+    Assets are cached by path, modification time and size, so a file is decoded at most
+    once per process however many stages need it.
+    """
+    key = _key(path)
+    with _assets_lock:
+        asset = _assets.get(key)
+        if asset is not None:
+            _assets.move_to_end(key)
+    metrics.inc('cache_requests_total', cache='audio_assets', result='miss' if asset is None else 'hit')
+    if asset is not None:
+        return asset
+    with metrics.span('audio_decode'):
+        asset = decode(path)
+    register(path, asset)
+    return asset
@@ -0,0 +1,32 @@
+import os
+import json
+import hashlib
+from app.disk_cache import DiskCache
+
+TTS_CACHE_DIR = os.getenv('TTS_CACHE_DIR', './generated_files/tts_cache')
+TTS_CACHE_MAX_BYTES = int(os.getenv('TTS_CACHE_MAX_BYTES', 512 * 2**20))
+
+
+def normalize_text(text):
+    """Collapses whitespace so formatting-only edits don't change the cache key."""
+    return ' '.join(text.split())
+
+
+def cache_key(text, voice, format, model):
+    """
+    Returns the content address of a piece of synthesized speech.
+
+    Args:
+        text (str): The text that is spoken.
+        voice (str): TTS voice name.
+        format (str): Audio format, e.g. "mp3".
+        model (str): TTS model name.
+
+    Returns:
+        str: Hex SHA-256 digest of the normalized request.
+    """
+    payload = json.dumps([normalize_text(text), voice, format, model])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+audio_cache = DiskCache(TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES)
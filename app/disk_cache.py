@@ -0,0 +1,119 @@
+import os
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+
+
+class DiskCache:
+    """
+    Size-bounded, content-addressed on-disk cache of binary blobs.
+
+    Entries are stored as <directory>/<key[:2]>/<key>.<format> and evicted least recently
+    used first once the total size exceeds max_bytes. The recency index is kept in memory
+    and rebuilt from file modification times on startup.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = None  # path -> size, least recently used first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key, format):
+        return os.path.join(self.directory, key[:2], f"{key}.{format}")
+
+    def _load_index(self):
+        if self._entries is not None:
+            return
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, path, stat.st_size))
+        files.sort()
+        self._entries = OrderedDict((path, size) for _, path, size in files)
+        self._total_bytes = sum(self._entries.values())
+
+    def get(self, key, format):
+        """
+        Returns the cached data for key, or None on a miss.
+        """
+        path = self._path(key, format)
+        with self._lock:
+            self._load_index()
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                self.misses += 1
+                self._forget(path)
+                return None
+
+            self.hits += 1
+            if path not in self._entries:
+                # Written by another worker process sharing the directory
+                self._entries[path] = len(data)
+                self._total_bytes += len(data)
+            self._entries.move_to_end(path)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, format, data):
+        """
+        Stores data under key and evicts least recently used entries beyond max_bytes.
+        """
+        path = self._path(key, format)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary name first so readers never see a partial file
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._load_index()
+            self._forget(path)
+            self._entries[path] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _forget(self, path):
+        size = self._entries.pop(path, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(path)
+            except OSError as e:
+                logging.warning(f"Could not evict cached file {path}: {e}")
+
+    def stats(self):
+        """Returns hit/miss/eviction counters and the current cache size."""
+        with self._lock:
+            self._load_index()
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+            }
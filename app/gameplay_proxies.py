@@ -0,0 +1,110 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+import subprocess
+import uuid
+from pathlib import Path
+from imageio_ffmpeg import get_ffmpeg_exe
+
+GAMEPLAY_FILES = {
+    'subway-surfers': "source_files/subway-surfers.mp4",
+    'gta': "source_files/gta-video.mp4",
+    'minecraft': "source_files/minecraft.mp4",
+}
+
+PROXY_DIR = os.getenv('GAMEPLAY_PROXY_DIR', './generated_files/proxies')
+
+# Settings every proxy is normalized to; changing any of them changes the proxy key
+PROXY_WIDTH = 1080
+PROXY_HEIGHT = 1920
+PROXY_FPS = int(os.getenv('GAMEPLAY_PROXY_FPS', 30))
+PROXY_CODEC = 'libx264'
+PROXY_CRF = int(os.getenv('GAMEPLAY_PROXY_CRF', 18))
+
+_build_locks = {}
+_build_locks_lock = threading.Lock()
+
+
+def _proxy_path(video_path):
+    stat = os.stat(video_path)
+    settings = [os.path.abspath(video_path), stat.st_mtime_ns, stat.st_size,
+                PROXY_WIDTH, PROXY_HEIGHT, PROXY_FPS, PROXY_CODEC, PROXY_CRF]
+    key = hashlib.sha256(json.dumps(settings).encode('utf-8')).hexdigest()[:16]
+    return Path(PROXY_DIR) / f"{Path(video_path).stem}_{key}.mp4"
+
+
+def _build_lock(path):
+    with _build_locks_lock:
+        return _build_locks.setdefault(path, threading.Lock())
+
+
+def normalize_filter(width, height, fps):
+    """Returns the ffmpeg filter that center-crops a video to width:height, scales it and sets its fps."""
+    return (
+        f"crop='min(iw,ih*{width}/{height})':'min(ih,iw*{height}/{width})',"
+        f"scale={width}:{height},setsar=1,fps={fps}"
+    )
+
+
+def build_proxy(video_path, proxy_path):
+    """
+    Transcodes a gameplay video into a center-cropped 9:16, 1080x1920 proxy at PROXY_FPS.
+
+    The gameplay audio is never used in the final video, so the proxy has none. A keyframe
+    every second keeps seeking into the proxy cheap.
+    """
+    proxy_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = proxy_path.with_name(f"{proxy_path.stem}.{uuid.uuid4().hex}.tmp.mp4")
+    video_filter = normalize_filter(PROXY_WIDTH, PROXY_HEIGHT, PROXY_FPS)
+    command = [
+        get_ffmpeg_exe(), '-y', '-loglevel', 'error', '-i', video_path,
+        '-vf', video_filter, '-an',
+        '-c:v', PROXY_CODEC, '-preset', 'medium', '-crf', str(PROXY_CRF),
+        '-g', str(PROXY_FPS), '-pix_fmt', 'yuv420p', '-movflags', '+faststart',
+        str(tmp_path),
+    ]
+    try:
+        subprocess.run(command, check=True, capture_output=True)
+        os.replace(tmp_path, proxy_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def get_proxy(video_path):
+    """
+    Returns the path of the normalized proxy for a gameplay video, building it on first use.
+
+    Args:
+        video_path (str): Path to the raw gameplay video.
+
+    Returns:
+        str: Path to the proxy, or None if it could not be built.
+    """
+    try:
+        proxy_path = _proxy_path(video_path)
+        if proxy_path.exists():
+            return str(proxy_path)
+
+        with _build_lock(str(proxy_path)):
+            if not proxy_path.exists():
+                logging.info(f"Building gameplay proxy for {video_path}")
+                build_proxy(video_path, proxy_path)
+        return str(proxy_path)
+    except (OSError, subprocess.CalledProcessError) as e:
+        logging.error(f"Error building gameplay proxy for {video_path}: {e}")
+        return None
+
+
+def build_all_proxies():
+    """Builds proxies for every gameplay source that exists and isn't built yet."""
+    for video_path in GAMEPLAY_FILES.values():
+        if os.path.exists(video_path):
+            get_proxy(video_path)
+
+
+def prebuild_proxies_in_background():
+    """Starts building all gameplay proxies on a background thread."""
+    threading.Thread(target=build_all_proxies, name='proxy-builder', daemon=True).start()
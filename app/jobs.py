@@ -0,0 +1,387 @@
+import time
+import uuid
+import logging
+import threading
+import multiprocessing
+from functools import partial
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from flask_login import current_user
+from flask_socketio import emit, join_room
+from app.socketio_instance import socketio
+from app.whisper_models import model_stats, record_worker_stats
+from app import metrics
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Lifecycle messages sent from the worker side back to the queue; everything
+# else that passes through a sink is a progress event for the job's room.
+_JOB_STARTED = 'job_started'
+_JOB_DONE = 'job_done'
+_JOB_FAILED = 'job_failed'
+_JOB_METRICS = 'job_metrics'
+
+# Number of progress events kept per job so late joiners can catch up
+MAX_JOB_EVENTS = 200
+
+_context = threading.local()
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its configured depth."""
+
+
+class Job:
+    def __init__(self, job_id, owner=None, on_done=None):
+        self.id = job_id
+        self.owner = owner
+        self.on_done = on_done
+        self.args = ()
+        # ID of the job rendering the final video, once a draft has been promoted
+        self.promoted_to = None
+        self.state = QUEUED
+        self.result = None
+        self.error = None
+        self.events = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'state': self.state,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class _QueueSink:
+    """Picklable sink that forwards worker-process messages through a manager queue."""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def __call__(self, job_id, event, payload):
+        self.queue.put((job_id, event, payload))
+
+
+def current_job_id():
+    """Returns the ID of the job running on this thread, or None outside a job."""
+    return getattr(_context, 'job_id', None)
+
+
+def emit_progress(event, payload):
+    """
+    Sends a progress event to the Socket.IO room of the job running on this thread.
+
+    Outside of a job (e.g. when a stage is called directly) the event is only logged,
+    so progress never leaks to unrelated clients.
+
+    Args:
+        event (str): Socket.IO event name, e.g. 'log_update'.
+        payload (dict): Event payload.
+    """
+    job_id = current_job_id()
+    if job_id is None:
+        logging.info(f"{event}: {payload}")
+        return
+    _context.sink(job_id, event, payload)
+
+
+def bind_job(func):
+    """
+    Wraps func so that, when it runs on another thread, its progress events still go to the
+    job running on this thread.
+    """
+    job_id = current_job_id()
+    sink = getattr(_context, 'sink', None)
+
+    def run(*args, **kwargs):
+        previous = (current_job_id(), getattr(_context, 'sink', None))
+        _context.job_id, _context.sink = job_id, sink
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _context.job_id, _context.sink = previous
+    return run
+
+
+def _send_metrics(job_id, sink):
+    # Metrics recorded in a worker process are added to the main process's before the job ends
+    if isinstance(sink, _QueueSink):
+        sink(job_id, _JOB_METRICS, {'metrics': metrics.take_delta(), 'worker': model_stats()})
+
+
+def _prime():
+    # Runs on a worker right after the pool starts it, which makes the pool run the initializer there
+    return model_stats()
+
+
+def _record_primed(future):
+    error = future.exception()
+    if error is not None:
+        logging.warning(f"Could not start a job worker: {error}")
+    else:
+        record_worker_stats(future.result())
+
+
+def _execute(job_id, func, args, sink):
+    """Runs one job on a worker thread or process, reporting its lifecycle through the sink."""
+    _context.job_id = job_id
+    _context.sink = sink
+    sink(job_id, _JOB_STARTED, None)
+    try:
+        result = func(*args)
+    except Exception as e:
+        logging.exception(f"Job {job_id} failed")
+        _send_metrics(job_id, sink)
+        sink(job_id, _JOB_FAILED, str(e))
+    else:
+        _send_metrics(job_id, sink)
+        sink(job_id, _JOB_DONE, result)
+    finally:
+        _context.job_id = None
+        _context.sink = None
+
+
+class JobQueue:
+    """
+    Bounded job queue backed by a pool of workers.
+
+    The 'local' backend runs jobs on threads inside this process, which needs no
+    external services and is what tests and development use. The 'process' backend
+    runs jobs in a pool of worker processes and relays their progress back here so
+    it can be emitted to the job's Socket.IO room.
+    """
+
+    def __init__(self, backend='local', workers=2, max_depth=8, max_history=500, initializer=None):
+        self.backend = backend
+        self.initializer = initializer
+        self.workers = workers
+        self.max_depth = max_depth
+        self.max_history = max_history
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._sink = None
+
+    def configure(self, backend=None, workers=None, max_depth=None, max_history=None, initializer=None):
+        if self._executor is not None:
+            raise RuntimeError("Job queue is already running.")
+        if backend is not None:
+            self.backend = backend
+        if workers is not None:
+            self.workers = workers
+        if max_depth is not None:
+            self.max_depth = max_depth
+        if max_history is not None:
+            self.max_history = max_history
+        if initializer is not None:
+            self.initializer = initializer
+
+    def _start(self):
+        if self.backend == 'local':
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job-worker',
+                                            initializer=self.initializer)
+            self._sink = self._handle_event
+        elif self.backend == 'process':
+            manager = multiprocessing.Manager()
+            channel = manager.Queue()
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer)
+            self._sink = _QueueSink(channel)
+            threading.Thread(target=self._relay, args=(channel,), daemon=True).start()
+        else:
+            raise ValueError(f"Unknown job backend: {self.backend}")
+
+    def _relay(self, channel):
+        # One bad event must not stop the relay: jobs would never leave the queue, which
+        # would stay full and turn every later submit away.
+        while True:
+            try:
+                job_id, event, payload = channel.get()
+            except (EOFError, OSError):
+                return  # The manager has shut down with the interpreter
+            try:
+                self._handle_event(job_id, event, payload)
+            except Exception:
+                logging.exception(f"Could not handle {event} event of job {job_id}")
+
+    def start(self):
+        """
+        Starts the workers now rather than on the first submit, and has each of them run the
+        initializer straight away, so the first job doesn't wait for it. Starting them again
+        does nothing.
+        """
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._start()
+            # Submitted back to back, each task goes to a new worker until there are `workers` of them
+            for _ in range(self.workers):
+                self._executor.submit(_prime).add_done_callback(_record_primed)
+
+    def pending(self):
+        """Returns the number of jobs waiting for a worker."""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.state == QUEUED)
+
+    def running(self):
+        """Returns the number of jobs currently being processed."""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.state == RUNNING)
+
+    def in_flight(self):
+        """Returns the jobs that are queued or running."""
+        with self._lock:
+            return [job for job in self._jobs.values() if not job.finished]
+
+    def done(self):
+        """Returns the jobs that finished successfully and are still in the history."""
+        with self._lock:
+            return [job for job in self._jobs.values() if job.state == DONE]
+
+    def submit(self, func, *args, owner=None, on_done=None):
+        """
+        Enqueues a job and returns immediately.
+
+        Args:
+            func (callable): Module-level function to run; must be picklable for the process backend.
+            *args: Picklable arguments for func.
+            owner (str): Optional ID of the user the job belongs to.
+            on_done (callable): Optional callback, called with the Job in this process once
+                it has finished successfully.
+
+        Returns:
+            Job: The queued job.
+
+        Raises:
+            QueueFullError: If max_depth jobs are already waiting.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._start()
+            queued = sum(1 for job in self._jobs.values() if job.state == QUEUED)
+            if queued >= self.max_depth:
+                raise QueueFullError(f"Job queue is full ({queued} jobs waiting).")
+            job = Job(uuid.uuid4().hex, owner=owner, on_done=on_done)
+            job.args = args
+            self._jobs[job.id] = job
+            self._prune()
+
+        future = self._executor.submit(_execute, job.id, func, args, self._sink)
+        future.add_done_callback(lambda f, job_id=job.id: self._check_future(job_id, f))
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def _check_future(self, job_id, future):
+        # Catches failures that happen before the job can report them itself,
+        # such as a worker process dying or arguments failing to pickle.
+        error = future.exception()
+        if error is not None:
+            self._handle_event(job_id, _JOB_FAILED, str(error))
+
+    def _handle_event(self, job_id, event, payload):
+        if event == _JOB_METRICS:
+            metrics.merge(payload['metrics'])
+            record_worker_stats(payload['worker'])
+            return
+
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return
+
+        if event == _JOB_STARTED:
+            job.state = RUNNING
+            job.started_at = time.time()
+            return
+
+        if event == _JOB_DONE:
+            job.state = DONE
+            job.result = payload
+            job.finished_at = time.time()
+            metrics.inc('jobs_total', state=DONE)
+            if job.on_done is not None:
+                try:
+                    job.on_done(job)
+                except Exception:
+                    logging.exception(f"on_done callback of job {job_id} failed")
+            event, payload = 'process_complete', dict(payload or {}, job_id=job_id)
+        elif event == _JOB_FAILED:
+            job.state = FAILED
+            job.error = payload
+            job.finished_at = time.time()
+            metrics.inc('jobs_total', state=FAILED)
+            event, payload = 'job_failed', {'job_id': job_id, 'error': payload}
+
+        job.events.append((event, payload))
+        del job.events[:-MAX_JOB_EVENTS]
+        socketio.emit(event, payload, to=job_id)
+
+
+job_queue = JobQueue()
+metrics.gauge('jobs_queued', 'Jobs waiting for a worker.', job_queue.pending)
+metrics.gauge('jobs_in_flight', 'Jobs being processed.', job_queue.running)
+
+
+def _initialize_worker(preload, whisper_warmup):
+    # Runs once in each worker thread or process as the pool starts it. A failing initializer
+    # breaks the whole pool, so errors are only logged and the first job that needs the
+    # dependency loads it instead.
+    try:
+        if preload:
+            from app.pipeline import preload
+            preload()
+        if whisper_warmup:
+            from app.whisper_models import warm_up
+            warm_up()
+    except Exception:
+        logging.exception("Could not preload a job worker")
+
+
+def init_jobs(app):
+    """
+    Configures the job queue from the app config. When workers preload or warm up, they are
+    started right away so that happens before the first request; otherwise on the first submit.
+    """
+    initializer = None
+    if app.config['PRELOAD_WORKERS'] or app.config['WHISPER_WARMUP']:
+        initializer = partial(_initialize_worker, app.config['PRELOAD_WORKERS'], app.config['WHISPER_WARMUP'])
+
+    job_queue.configure(
+        backend=app.config['JOB_BACKEND'],
+        workers=app.config['JOB_WORKERS'],
+        max_depth=app.config['JOB_QUEUE_DEPTH'],
+        initializer=initializer,
+    )
+    if initializer is not None:
+        job_queue.start()
+
+
+@socketio.on('join_job')
+def on_join_job(data):
+    """Subscribes the signed-in client to one of its jobs' rooms and replays the events it missed."""
+    job = job_queue.get((data or {}).get('job_id'))
+    if job is None or not current_user.is_authenticated or job.owner != current_user.get_id():
+        return
+    join_room(job.id)
+    for event, payload in list(job.events):
+        emit(event, payload)
@@ -0,0 +1,140 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the stage duration histogram buckets
+SPAN_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., count, sum]
+_gauges = {}  # name -> (help, callable)
+_help = {
+    'pipeline_stage_seconds': 'Time spent in each pipeline stage.',
+    'pipeline_errors_total': 'Pipeline stages that raised an error.',
+    'cache_requests_total': 'Cache lookups by cache and result.',
+    'retries_total': 'Retried requests to external services.',
+    'jobs_total': 'Finished jobs by final state.',
+    'artifact_evictions_total': 'Generated files removed to stay under the disk quota or age limit.',
+}
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Adds value to a counter."""
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Records one observation in a histogram."""
+    key = (name, _labels(labels))
+    with _lock:
+        entry = _histograms.setdefault(key, [0] * (len(SPAN_BUCKETS) + 2))
+        for i, bound in enumerate(SPAN_BUCKETS):
+            if value <= bound:
+                entry[i] += 1
+        entry[-2] += 1
+        entry[-1] += value
+
+
+def gauge(name, help, func):
+    """
+    Registers a gauge whose value is read from func when metrics are collected. func returns
+    either a number, or a list of (labels dict, number) pairs for a gauge with labels.
+    """
+    _gauges[name] = (help, func)
+
+
+@contextmanager
+def span(stage):
+    """
+    Times a pipeline stage into pipeline_stage_seconds, and counts it in
+    pipeline_errors_total if it raises.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc('pipeline_errors_total', stage=stage)
+        raise
+    finally:
+        observe('pipeline_stage_seconds', time.perf_counter() - start, stage=stage)
+
+
+def take_delta():
+    """
+    Returns and resets the counters and histograms recorded so far. Worker processes
+    send these to the main process, which adds them to its own with merge().
+    """
+    global _counters, _histograms
+    with _lock:
+        delta = {'counters': list(_counters.items()), 'histograms': list(_histograms.items())}
+        _counters, _histograms = {}, {}
+    return delta
+
+
+def merge(delta):
+    """Adds counters and histograms recorded in another process."""
+    with _lock:
+        for key, value in delta['counters']:
+            _counters[key] = _counters.get(key, 0) + value
+        for key, values in delta['histograms']:
+            entry = _histograms.setdefault(key, [0] * (len(SPAN_BUCKETS) + 2))
+            for i, value in enumerate(values):
+                entry[i] += value
+
+
+def _format_labels(labels, **extra):
+    pairs = list(labels) + sorted(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render_prometheus():
+    """Returns all metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(_histograms.items())
+
+    def header(name, kind, help=None):
+        lines.append(f"# HELP {name} {help or _help.get(name, name)}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    previous = None
+    for (name, labels), value in counters:
+        if name != previous:
+            header(name, 'counter')
+            previous = name
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    previous = None
+    for (name, labels), entry in histograms:
+        if name != previous:
+            header(name, 'histogram')
+            previous = name
+        for bound, count in zip(SPAN_BUCKETS, entry):
+            lines.append(f"{name}_bucket{_format_labels(labels, le=bound)} {count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, le='+Inf')} {entry[-2]}")
+        lines.append(f"{name}_count{_format_labels(labels)} {entry[-2]}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {entry[-1]:.6f}")
+
+    for name, (help, func) in sorted(_gauges.items()):
+        value = func()
+        if isinstance(value, list):
+            if not value:
+                continue
+            header(name, 'gauge', help)
+            lines.extend(f"{name}{_format_labels(_labels(labels))} {item}" for labels, item in value)
+        else:
+            header(name, 'gauge', help)
+            lines.append(f"{name} {value}")
+
+    return '\n'.join(lines) + '\n'
@@ -1,16 +1,55 @@
 from . import db
 import json
 from flask_login import UserMixin
+from sqlalchemy import inspect, text
 from sqlalchemy.sql import func
 
-# Model for story that contains id, user id, story (data), and changed story (gptdata)
+# Model for story that contains id, user id, story (data), and changed story (gptdata),
+# plus the metadata of the render that produced it
 class Story(db.Model):
+    __table_args__ = (
+        # Per-user history, newest first; also serves plain user_id lookups
+        db.Index('ix_story_user_id_date', 'user_id', 'date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     data = db.Column(db.String(10000))
     title = db.Column(db.String(10000))
     gptdata = db.Column(db.String(10000))
     date = db.Column(db.DateTime(timezone = True), default=func.now())
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    job_id = db.Column(db.String(32), index=True)
+    product = db.Column(db.String(200))
+    gameplay = db.Column(db.String(50))
+    voice = db.Column(db.String(50))
+    draft = db.Column(db.Boolean, default=False)
+    video_url = db.Column(db.String(500))
+    title_duration = db.Column(db.Float)
+    story_duration = db.Column(db.Float)
+    render_seconds = db.Column(db.Float)
+    # JSON: per-stage start/end times, and the audio/background paths the render used
+    stage_timings = db.Column(db.Text)
+    artifacts = db.Column(db.Text)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'story_text': self.data,
+            'modified_story': self.gptdata,
+            'date': self.date.isoformat() if self.date else None,
+            'job_id': self.job_id,
+            'product': self.product,
+            'gameplay': self.gameplay,
+            'voice': self.voice,
+            'draft': self.draft,
+            'video_url': self.video_url,
+            'title_duration': self.title_duration,
+            'story_duration': self.story_duration,
+            'render_seconds': self.render_seconds,
+            'stage_timings': json.loads(self.stage_timings) if self.stage_timings else None,
+            'artifacts': json.loads(self.artifacts) if self.artifacts else None,
+        }
 
 # Model for user that contains id, email, name, and password
 class User(db.Model, UserMixin):
@@ -18,4 +57,23 @@ class User(db.Model, UserMixin):
     email = db.Column(db.String(150), unique=True)
     password = db.Column(db.String(150))
     first_name = db.Column(db.String(150))
-    stories = db.relationship('Story')
\ No newline at end of file
+    stories = db.relationship('Story')
+
+
+def upgrade_schema():
+    """
+    Brings tables created by an older version up to date: create_all() only creates missing
+    tables, so columns and indexes added to existing models are added here.
+    """
+    inspector = inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
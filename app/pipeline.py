@@ -0,0 +1,227 @@
+import os
+import logging
+from functools import partial
+from app.text_to_speech import text_to_speech
+from app.video_processing import adjust_video_for_tiktok, overlay_text_on_video, generate_subtitles
+from app.story_rewriter import rework_story_with_product, get_client
+from app.jobs import emit_progress, current_job_id
+from app.render_context import RenderContext
+from app.whisper_models import model_stats, import_whisper
+from app.gameplay_proxies import GAMEPLAY_FILES, get_proxy
+from app.stages import Stage, run_stages
+from app.render import Background
+from app import audio_assets
+
+
+def preload():
+    """
+    Imports the dependencies that are otherwise loaded lazily by the stage that first needs
+    them (Whisper and torch, the OpenAI client), so a render worker can pay for them as it
+    starts rather than in its first job. Importing this module already loads the video stack.
+
+    Client errors (e.g. a missing API key) are only logged here: a failing pool initializer
+    would take the whole pool down, while the stage that needs the client reports them.
+    """
+    import_whisper()
+    try:
+        get_client()
+    except Exception as e:
+        logging.warning(f"Could not create the OpenAI client while preloading: {e}")
+
+def generate_video(params):
+    """
+    Runs the full generation pipeline for one /generate job: story rewrite, text-to-speech,
+    video adjustment, subtitles and overlay.
+
+    The steps run as a graph of stages, so independent ones overlap: the title is narrated
+    and the gameplay proxy prepared while the story is rewritten, and subtitles are made
+    while the background is chosen.
+
+    Args:
+        params (dict): Form values from /generate ('gameplay', 'voice', 'title', 'story_text',
+            'product', 'username') plus the saved 'profile_pic_path', and optionally 'draft'
+            and 'draft_seconds' for a low-resolution preview.
+
+    Returns:
+        dict: The reworked story, audio paths and the URL of the generated video.
+    """
+    with RenderContext(job_id=current_job_id()) as context:
+        return _generate_video(params, context)
+
+
+def _narrate(text, voice):
+    """Synthesizes speech and reads its duration from the decoded samples, for every later stage to use."""
+    path = text_to_speech(text, voice=voice)
+    if not path:
+        raise ValueError("Error: Audio paths for title or story are None.")
+    return path, audio_assets.load(path).duration
+
+
+def _narrate_story(voice, rewrite):
+    return _narrate(rewrite, voice)
+
+
+def _background(video_file, proxy, tts_title, tts_story):
+    # Runs after the gameplay stage has built the proxy, which adjust_video_for_tiktok picks up.
+    # The background runs under the title and then the story.
+    emit_progress('log_update', {'log': "Log: Adjusting video for TikTok..."})
+    adjusted_video = adjust_video_for_tiktok(video_file, tts_title[1] + tts_story[1])
+    if not adjusted_video:
+        raise ValueError("Error: Video adjustment failed.")
+    return adjusted_video
+
+
+def _subtitles(rewrite, tts_story):
+    emit_progress('log_update', {'log': "Log: Generating subtitles..."})
+    subtitles = generate_subtitles(tts_story[0], script=rewrite)
+    if not subtitles:
+        raise ValueError("Error: subtitle creation failed.")
+    return subtitles
+
+
+def _artifacts(params, rewrite, tts_title, tts_story, background, subtitles):
+    """Collects everything a render needs into a plain, JSON-serializable dict."""
+    return {
+        'title': params['title'], 'story': rewrite, 'username': params['username'],
+        'profile_pic_path': params['profile_pic_path'],
+        'title_audio_path': tts_title[0], 'title_duration': tts_title[1],
+        'story_audio_path': tts_story[0], 'story_duration': tts_story[1],
+        'background': vars(background), 'subtitles': subtitles,
+    }
+
+
+def _generate_video(params, context):
+    title = params['title']
+    voice = params['voice']
+
+    video_file = GAMEPLAY_FILES.get(params['gameplay'])
+    if not video_file:
+        raise ValueError("Invalid gameplay type selected.")
+    emit_progress('log_update', {'log': f"Log: Video file selected: {video_file}"})
+
+    def render(rewrite, tts_title, tts_story, background, subtitles):
+        artifacts = _artifacts(params, rewrite, tts_title, tts_story, background, subtitles)
+        return artifacts, _render_artifacts(artifacts, context, params.get('draft', False), params.get('draft_seconds'))
+
+    stages = [
+        # Call the OpenAI API to rework the story with the product
+        Stage('rewrite', partial(rework_story_with_product, params['story_text'], params['product'])),
+        # Builds the gameplay proxy, if needed, while the story is rewritten and narrated
+        Stage('gameplay', partial(get_proxy, video_file)),
+        Stage('tts_title', partial(_narrate, title, voice)),
+        Stage('tts_story', partial(_narrate_story, voice), ['rewrite']),
+        Stage('background', partial(_background, video_file), ['gameplay', 'tts_title', 'tts_story']),
+        Stage('subtitles', _subtitles, ['rewrite', 'tts_story']),
+        Stage('render', render, ['rewrite', 'tts_title', 'tts_story', 'background', 'subtitles']),
+    ]
+    run = run_stages(stages)
+    critical_path = run.critical_path(stages)
+    emit_progress('log_update', {'log': f"Log: Critical path: {' -> '.join(critical_path)}"})
+
+    artifacts, tiktok_video = run.results['render']
+    result = _video_result(artifacts, tiktok_video, params.get('draft', False))
+    # Per-stage start/end times and the chain of stages that set the job's wall time
+    result.update(stage_timings=run.timings(), critical_path=critical_path)
+    return result
+
+
+def generate_batch(params):
+    """
+    Generates every variant of one story in a single job, doing shared work once: one
+    rewrite per product, one title narration per voice, one story narration and subtitle
+    track per (product, voice) and one proxy per gameplay. Only the renders are per variant.
+
+    Args:
+        params (dict): 'title', 'story_text', 'username' and 'profile_pic_path', plus
+            'variants', a list of dicts with 'product', 'gameplay' and 'voice'.
+
+    Returns:
+        dict: 'videos', each variant's parameters with its 'video_url', and the stage
+        timings and critical path of the batch.
+    """
+    variants = params['variants']
+    for variant in variants:
+        if variant['gameplay'] not in GAMEPLAY_FILES:
+            raise ValueError("Invalid gameplay type selected.")
+
+    stages = {}
+
+    def add(name, func, depends_on=()):
+        # Variants that share a piece of work share its stage
+        if name not in stages:
+            stages[name] = Stage(name, func, depends_on)
+        return name
+
+    def render(variant, rewrite, tts_title, tts_story, background, subtitles):
+        # Each render has its own context, since the subtitle timeline is per render
+        with RenderContext(job_id=current_job_id()) as context:
+            artifacts = _artifacts(params, rewrite, tts_title, tts_story, background, subtitles)
+            video_url = _video_result(artifacts, _render_artifacts(artifacts, context), draft=False)['video_url']
+        emit_progress('log_update', {'log': f"Log: Variant {variant} done: {video_url}"})
+        return video_url
+
+    renders = []
+    for variant in variants:
+        product, gameplay, voice = variant['product'], variant['gameplay'], variant['voice']
+        video_file = GAMEPLAY_FILES[gameplay]
+        rewrite = add(f"rewrite:{product}", partial(rework_story_with_product, params['story_text'], product))
+        proxy = add(f"gameplay:{gameplay}", partial(get_proxy, video_file))
+        tts_title = add(f"tts_title:{voice}", partial(_narrate, params['title'], voice))
+        tts_story = add(f"tts_story:{product}:{voice}", partial(_narrate_story, voice), [rewrite])
+        subtitles = add(f"subtitles:{product}:{voice}", _subtitles, [rewrite, tts_story])
+        background = add(f"background:{product}:{gameplay}:{voice}", partial(_background, video_file),
+                         [proxy, tts_title, tts_story])
+        renders.append(add(f"render:{product}:{gameplay}:{voice}", partial(render, variant),
+                           [rewrite, tts_title, tts_story, background, subtitles]))
+
+    stages = list(stages.values())
+    run = run_stages(stages)
+    critical_path = run.critical_path(stages)
+    emit_progress('log_update', {'log': f"Log: Critical path: {' -> '.join(critical_path)}"})
+
+    videos = [dict(variant, video_url=run.results[name]) for variant, name in zip(variants, renders)]
+    return {'title': params['title'], 'videos': videos,
+            'stage_timings': run.timings(), 'critical_path': critical_path,
+            'worker_stats': model_stats()}
+
+
+def promote_video(artifacts):
+    """
+    Renders the final video for a draft from the draft's artifacts (narration, subtitles,
+    background and overlay inputs), so only the encode runs again.
+
+    Args:
+        artifacts (dict): The 'artifacts' of a draft generate_video() result.
+
+    Returns:
+        dict: The same fields as generate_video().
+    """
+    with RenderContext(job_id=current_job_id()) as context:
+        return _video_result(artifacts, _render_artifacts(artifacts, context, draft=False), draft=False)
+
+
+def _render_artifacts(artifacts, context, draft=False, draft_seconds=None):
+    emit_progress('log_update', {'log': f"Log: Starting overlay of text on video{' (draft)' if draft else ''}..."})
+    tiktok_video = overlay_text_on_video(Background(**artifacts['background']), artifacts['title_audio_path'],
+                                         artifacts['story_audio_path'], artifacts['title'], artifacts['story'],
+                                         artifacts['subtitles'], artifacts['username'], artifacts['profile_pic_path'],
+                                         context=context, title_duration=artifacts['title_duration'],
+                                         story_duration=artifacts['story_duration'],
+                                         draft=draft, draft_seconds=draft_seconds)
+    if not tiktok_video:
+        raise ValueError("Error: Video overlay failed.")
+    return tiktok_video
+
+
+def _video_result(artifacts, tiktok_video, draft):
+    # Root-relative, served by views.serve_generated_file; workers have no app context for url_for()
+    video_url = f"/generated_files/{os.path.basename(tiktok_video)}"
+    emit_progress('video_generated', {'video_url': video_url})
+
+    return {'full_story': artifacts['story'], 'title': artifacts['title'],
+            'story_audio_path': artifacts['story_audio_path'], 'title_audio_path': artifacts['title_audio_path'],
+            'video_url': video_url, 'draft': draft,
+            # Everything the final render needs, so a draft can be promoted without redoing TTS or subtitles
+            'artifacts': artifacts,
+            # Load time and memory of this worker's Whisper models, for sizing workers
+            'worker_stats': model_stats()}
@@ -1,25 +1,194 @@
-import praw
+import time
 import random
 import logging
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from app import metrics, story_corpus
+from app.metrics import span
 
-reddit = praw.Reddit(
-    user_agent=True,
-    client_id=os.getenv('REDDIT_CLIENT_ID'),
-    client_secret=os.getenv('REDDIT_CLIENT_SECRET')
-)
+reddit = None  # Created on first use; importing praw takes a noticeable part of startup
+_reddit_lock = threading.Lock()
 
-def scrape_reddit_story(subreddit_name):
-    try:
-        subreddit = reddit.subreddit(subreddit_name)
-        posts = list(subreddit.hot(limit=100))
-        stories = [post for post in posts if post.is_self and post.selftext]
+# How long a subreddit's listing is served from memory before it is fetched again
+STORY_CACHE_TTL = float(os.getenv('STORY_CACHE_TTL', 600))
+# Subreddits the background refresher keeps warm (the ones offered on the index page)
+STORY_REFRESH_SUBREDDITS = [name for name in os.getenv('STORY_REFRESH_SUBREDDITS', 'stories,confession,nosleep').split(',') if name]
+# Listings are refreshed once this fraction of the TTL has passed, so they never expire while in use
+STORY_REFRESH_AT = 0.8
+# Users whose served stories are remembered; the least recently active are forgotten first
+STORY_SEEN_USERS = int(os.getenv('STORY_SEEN_USERS', 10000))
+LISTING_LIMIT = 100
+
+
+def get_reddit():
+    """Returns the shared PRAW client, importing praw and creating it on first use."""
+    global reddit
+    if reddit is None:
+        with _reddit_lock:
+            if reddit is None:
+                import praw
+                reddit = praw.Reddit(
+                    user_agent=True,
+                    client_id=os.getenv('REDDIT_CLIENT_ID'),
+                    client_secret=os.getenv('REDDIT_CLIENT_SECRET')
+                )
+    return reddit
+
+
+class _LazyReddit:
+    """Listing source that defers creating the PRAW client until a listing is fetched."""
+
+    def subreddit(self, name):
+        return get_reddit().subreddit(name)
+
+
+class SubredditCache:
+    """
+    Keeps the text posts of each subreddit's hot listing in memory for `ttl` seconds, and
+    picks stories from them without serving the same one twice to the same user.
+
+    `source` is anything with PRAW's `subreddit(name).hot(limit=...)`, so a fake can stand
+    in for praw.Reddit. Only one fetch per subreddit runs at a time; concurrent callers
+    wait for it instead of starting their own. Each fetched listing is also passed to
+    `on_fetch(subreddit, stories)`, if given.
+    """
+
+    def __init__(self, source, ttl=STORY_CACHE_TTL, clock=time.monotonic, on_fetch=None):
+        self.source = source
+        self.on_fetch = on_fetch
+        self.ttl = ttl
+        self.clock = clock
+        self._listings = {}  # subreddit -> (fetched_at, [(id, title, selftext)])
+        self._fetch_locks = {}
+        self._seen = OrderedDict()  # user -> {subreddit: set of story ids}
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._stop = threading.Event()
+
+    def _fetch_lock(self, subreddit_name):
+        with self._lock:
+            return self._fetch_locks.setdefault(subreddit_name, threading.Lock())
+
+    def _fresh(self, entry, age=None):
+        return entry is not None and self.clock() - entry[0] < (self.ttl if age is None else age)
+
+    def fetch(self, subreddit_name):
+        """Fetches a subreddit's hot listing, stores its text posts and returns them."""
+        with span('scrape'):
+            posts = list(self.source.subreddit(subreddit_name).hot(limit=LISTING_LIMIT))
+        stories = [(post.id, post.title, post.selftext) for post in posts if post.is_self and post.selftext]
+        with self._lock:
+            self._listings[subreddit_name] = (self.clock(), stories)
+        if self.on_fetch:
+            self.on_fetch(subreddit_name, stories)
+        return stories
+
+    def stories(self, subreddit_name):
+        """
+        Returns the text posts of a subreddit, fetching its listing if it is missing or has
+        expired. If the fetch fails, an expired listing is still served.
+        """
+        entry = self._listings.get(subreddit_name)
+        if self._fresh(entry):
+            metrics.inc('cache_requests_total', cache='subreddit_listings', result='hit')
+            return entry[1]
+        metrics.inc('cache_requests_total', cache='subreddit_listings', result='miss')
 
+        with self._fetch_lock(subreddit_name):
+            entry = self._listings.get(subreddit_name)
+            if self._fresh(entry):
+                return entry[1]
+            try:
+                return self.fetch(subreddit_name)
+            except Exception:
+                if entry is None:
+                    raise
+                logging.warning(f"Serving an expired listing for /r/{subreddit_name}", exc_info=True)
+                return entry[1]
+
+    def pick(self, subreddit_name, user=None):
+        """
+        Returns a random (title, selftext) from a subreddit that `user` has not been served
+        yet. Once a user has seen every story in the listing, they start over.
+        """
+        stories = self.stories(subreddit_name)
         if not stories:
             raise ValueError(f"No text-based stories found in /r/{subreddit_name}")
+        if user is None:
+            _, title, selftext = random.choice(stories)
+            return title, selftext
+
+        with self._lock:
+            seen = self._seen.setdefault(user, {})
+            self._seen.move_to_end(user)
+            while len(self._seen) > STORY_SEEN_USERS:
+                self._seen.popitem(last=False)
+            served = seen.setdefault(subreddit_name, set())
+            unseen = [story for story in stories if story[0] not in served]
+            if not unseen:
+                served.clear()
+                unseen = stories
+            story_id, title, selftext = random.choice(unseen)
+            served.add(story_id)
+        return title, selftext
+
+    def refresh(self, subreddit_names, max_workers=None):
+        """
+        Fetches the listings of the given subreddits concurrently, skipping those that are
+        not yet due. Errors are logged and leave the previous listing in place.
+        """
+        due = [name for name in subreddit_names
+               if not self._fresh(self._listings.get(name), self.ttl * STORY_REFRESH_AT)]
+
+        def refresh_one(name):
+            try:
+                with self._fetch_lock(name):
+                    self.fetch(name)
+            except Exception as e:
+                logging.error(f"Error refreshing listing for /r/{name}: {e}")
+
+        if due:
+            with ThreadPoolExecutor(max_workers=max_workers or len(due), thread_name_prefix='story-refresh') as executor:
+                list(executor.map(refresh_one, due))
+
+    def start_refresher(self, subreddit_names=None):
+        """
+        Starts a background thread that keeps the given subreddits' listings warm, fetching
+        them concurrently before they expire. Starting it again does nothing.
+        """
+        names = list(subreddit_names or STORY_REFRESH_SUBREDDITS)
+        if self._refresher is not None or not names:
+            return
+
+        def run():
+            while not self._stop.is_set():
+                self.refresh(names)
+                self._stop.wait(max(self.ttl * (1 - STORY_REFRESH_AT) / 2, 1))
 
-        selected_story = random.choice(stories)
-        return selected_story.title, selected_story.selftext
+        self._refresher = threading.Thread(target=run, name='story-refresher', daemon=True)
+        self._refresher.start()
+
+    def stop_refresher(self):
+        self._stop.set()
+        if self._refresher is not None:
+            self._refresher.join()
+            self._refresher = None
+        self._stop.clear()
+
+
+# Every listing fetched is kept in the story corpus, so it can be searched later
+story_cache = SubredditCache(_LazyReddit(), on_fetch=story_corpus.ingest_listing)
+
+
+def scrape_reddit_story(subreddit_name, user=None):
+    """
+    Returns the title and text of a random self-post from a subreddit, served from the
+    listing cache. `user` identifies who asked, so they are not served the same story twice.
+    """
+    try:
+        return story_cache.pick(subreddit_name, user)
     except Exception as e:
         logging.error(f"Error scraping subreddit /r/{subreddit_name}: {e}")
         return None, None
@@ -0,0 +1,492 @@
+import os
+import math
+import numpy as np
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+# moviepy.editor is avoided: it also imports every effect and IPython's display machinery
+from moviepy.video.io.VideoFileClip import VideoFileClip
+from moviepy.video.VideoClip import ImageClip
+from moviepy.video.compositing.CompositeVideoClip import CompositeVideoClip
+from moviepy.audio.AudioClip import CompositeAudioClip
+from moviepy.video.fx.crop import crop
+from moviepy.video.fx.resize import resize
+from PIL import Image
+from proglog import ProgressBarLogger
+from imageio_ffmpeg import get_ffmpeg_exe
+from app.gameplay_proxies import normalize_filter
+from app.render_context import RenderContext
+from app import audio_assets
+from app.jobs import emit_progress, current_job_id
+from app.metrics import span
+
+OUTPUT_WIDTH = 1080
+OUTPUT_HEIGHT = 1920
+
+# 'moviepy' composites frames in Python and is the reference; 'ffmpeg' runs one native filter graph
+RENDER_BACKEND = os.getenv('RENDER_BACKEND', 'moviepy')
+# Number of time segments rendered in parallel processes; 1 renders in a single pass
+RENDER_SEGMENTS = int(os.getenv('RENDER_SEGMENTS', 1))
+# Segment boundaries are placed where the background reaches a multiple of this many seconds of
+# its source, the keyframe interval of the proxies
+SEGMENT_ALIGNMENT = 1.0
+
+# Draft previews: quarter the pixels, fewer frames and the fastest x264 preset
+DRAFT_WIDTH = 540
+DRAFT_HEIGHT = 960
+DRAFT_FPS = int(os.getenv('DRAFT_FPS', 15))
+DRAFT_PRESET = 'ultrafast'
+
+
+class EncodeProgress:
+    """Reports how far an encode is to the running job as whole-percent 'encode_progress' events."""
+
+    def __init__(self):
+        self.percent = -1
+
+    def update(self, fraction):
+        percent = max(0, min(100, int(fraction * 100)))
+        # Segment renders run in pool processes outside any job; they have no one to tell
+        if percent > self.percent and current_job_id() is not None:
+            self.percent = percent
+            emit_progress('encode_progress', {'percent': percent})
+
+
+class _MoviepyProgress(ProgressBarLogger):
+    """Bridges moviepy's frame progress bar ('t') to an EncodeProgress."""
+
+    def __init__(self, progress):
+        super().__init__()
+        self.progress = progress
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if bar == 't' and attr == 'index' and self.bars[bar]['total']:
+            self.progress.update(value / self.bars[bar]['total'])
+
+
+def loop_clip(video, duration, start_offset=0):
+    """
+    Plays a clip from start_offset for the given duration, wrapping around to its start
+    whenever it runs out. Output time t maps to (start_offset + t) mod the clip's duration,
+    so no copies of the clip are made however long the output is.
+
+    Args:
+        video (VideoClip): The clip to loop.
+        duration (float): Duration of the output clip.
+        start_offset (float): Time in the source clip where playback starts.
+
+    Returns:
+        VideoClip: The time-mapped clip.
+    """
+    # Stop a frame short of the end, where ffmpeg may not return a frame
+    loop_duration = video.duration - 1.0 / video.fps
+    return video.fl_time(lambda t: (start_offset + t) % loop_duration, apply_to=['mask', 'audio']).set_duration(duration)
+
+
+class Background:
+    """
+    A gameplay video and where playback starts in it. Playback wraps around to the start
+    of the source when it runs out.
+
+    Attributes:
+        path (str): Video file, either a normalized proxy or the raw source.
+        start_offset (float): Time in the source where playback starts.
+        source_duration (float): Duration of the source video.
+        fps (float): Frame rate of the source video.
+        normalized (bool): Whether the file is already cropped and resized to w x h.
+        w (int): Output width.
+        h (int): Output height.
+    """
+
+    def __init__(self, path, start_offset, source_duration, fps, normalized, w=OUTPUT_WIDTH, h=OUTPUT_HEIGHT):
+        self.path = path
+        self.start_offset = start_offset
+        self.source_duration = source_duration
+        self.fps = fps
+        self.normalized = normalized
+        self.w = w
+        self.h = h
+
+    def loops(self, duration):
+        return self.start_offset + duration > self.source_duration
+
+    def shifted(self, seconds):
+        """Returns the background as it is `seconds` into playback."""
+        start_offset = self.start_offset + seconds
+        if start_offset >= self.source_duration:
+            start_offset %= self.source_duration
+        return Background(self.path, start_offset, self.source_duration, self.fps, self.normalized, self.w, self.h)
+
+    def scaled(self, w, h):
+        """Returns the background rendered at another output size."""
+        normalized = self.normalized and (w, h) == (self.w, self.h)
+        return Background(self.path, self.start_offset, self.source_duration, self.fps, normalized, w, h)
+
+    def clip(self, duration, context=None):
+        """
+        Returns a moviepy clip of the background, cropped and resized to w x h. The source
+        file is closed with `context`, if given.
+        """
+        video = VideoFileClip(self.path, audio=False)
+        if not self.normalized and video.w * self.h == video.h * self.w:
+            # Already the output's aspect ratio (e.g. a proxy for a draft): let ffmpeg scale it while decoding
+            video.close()
+            video = VideoFileClip(self.path, audio=False, target_resolution=(self.h, self.w))
+        if context is not None:
+            context.track(video)
+        if (video.w, video.h) != (self.w, self.h):
+            # Determine the aspect ratio for TikTok (9:16)
+            target_aspect_ratio = self.w / self.h
+            video_aspect_ratio = video.w / video.h
+
+            # Crop or pad the video to fit the target aspect ratio
+            if video_aspect_ratio > target_aspect_ratio:
+                # Video is wider than target, crop the sides
+                new_width = int(target_aspect_ratio * video.h)
+                crop_x = (video.w - new_width) // 2
+                video = video.fx(crop, x1=crop_x, width=new_width)
+            else:
+                # Video is taller than target, crop the top and bottom
+                new_height = int(video.w / target_aspect_ratio)
+                crop_y = (video.h - new_height) // 2
+                video = video.fx(crop, y1=crop_y, height=new_height)
+
+            # Resize to TikTok's preferred resolution (1080x1920 for portrait)
+            video = video.fx(resize, newsize=(self.w, self.h))
+
+        if self.loops(duration):
+            return loop_clip(video, duration, self.start_offset)
+        return video.subclip(self.start_offset, self.start_offset + duration)
+
+
+class Timeline:
+    """
+    Everything a render backend needs to produce a video: the background, image layers shown
+    over it during time windows, and the audio tracks.
+
+    Attributes:
+        background (Background): The gameplay background.
+        duration (float): Duration of the video.
+        layers (List[Tuple[float, float, np.ndarray, object]]): Start and end time, RGBA frame
+            and position of each image layer, in drawing order. The position is either
+            'center' or the (x, y) of the top-left corner.
+        audio (List[Tuple[str, float, float]]): Path, start time and duration of each audio track.
+        fps (float): Output frame rate.
+        preset (str): x264 preset the video is encoded with.
+    """
+
+    def __init__(self, background, duration, layers, audio, fps=None, preset='medium'):
+        self.background = background
+        self.duration = duration
+        self.layers = layers
+        self.audio = audio
+        self.fps = fps or background.fps
+        self.preset = preset
+
+    @property
+    def size(self):
+        return (self.background.w, self.background.h)
+
+    def segment(self, start, end):
+        """
+        Returns the silent part of the timeline between start and end, with times relative to start.
+        """
+        layers = [(max(layer_start, start) - start, min(layer_end, end) - start, frame, position)
+                  for layer_start, layer_end, frame, position in self.layers
+                  if layer_start < end and layer_end > start]
+        return Timeline(self.background.shifted(start), end - start, layers, [], self.fps, self.preset)
+
+    def trimmed(self, duration):
+        """Returns the first `duration` seconds of the timeline, with audio."""
+        if duration >= self.duration:
+            return self
+        timeline = self.segment(0, duration)
+        timeline.audio = [(path, start, min(length, duration - start))
+                          for path, start, length in self.audio if start < duration]
+        return timeline
+
+    def scaled(self, w, h, fps=None, preset=None):
+        """
+        Returns the timeline rendered at another size, with every layer resized and moved to match.
+        """
+        scale_x = w / self.background.w
+        scale_y = h / self.background.h
+        resized = {}  # id of a frame -> resized frame, so shared frames stay shared
+        layers = []
+        for start, end, frame, position in self.layers:
+            if id(frame) not in resized:
+                image = Image.fromarray(frame)
+                size = (max(1, round(image.width * scale_x)), max(1, round(image.height * scale_y)))
+                resized[id(frame)] = np.asarray(image.resize(size, Image.LANCZOS))
+            if position != 'center':
+                position = (round(position[0] * scale_x), round(position[1] * scale_y))
+            layers.append((start, end, resized[id(frame)], position))
+        return Timeline(self.background.scaled(w, h), self.duration, layers, self.audio,
+                        fps or self.fps, preset or self.preset)
+
+
+def draft_timeline(timeline, seconds=None):
+    """
+    Returns a cheap preview of the timeline: DRAFT_WIDTH x DRAFT_HEIGHT at DRAFT_FPS, encoded
+    with DRAFT_PRESET, and limited to the first `seconds` if given.
+    """
+    if seconds:
+        timeline = timeline.trimmed(seconds)
+    return timeline.scaled(DRAFT_WIDTH, DRAFT_HEIGHT, fps=min(DRAFT_FPS, timeline.fps), preset=DRAFT_PRESET)
+
+
+def render_moviepy(timeline, output_file, context):
+    """Renders the timeline by compositing every frame with moviepy."""
+    # Narration comes from the decoded buffers shared with the earlier stages
+    assets = [audio_assets.load(path) for path, _, _ in timeline.audio]
+    audio_clips = [context.track(asset.clip()).set_start(start).set_duration(duration)
+                   for asset, (_, start, duration) in zip(assets, timeline.audio)]
+    clips = [timeline.background.clip(timeline.duration, context)]
+    for start, end, frame, position in timeline.layers:
+        clips.append(ImageClip(frame, transparent=True).set_position(position)
+                     .set_start(start).set_duration(end - start))
+
+    final_video = CompositeVideoClip(clips, size=timeline.size).set_duration(timeline.duration)
+    if audio_clips:
+        final_video = final_video.set_audio(CompositeAudioClip(audio_clips).set_duration(timeline.duration))
+    # Keep moviepy's temporary audio out of the working directory, where renders would share it
+    final_video.write_videofile(output_file, fps=timeline.fps, codec='libx264', preset=timeline.preset, audio_codec='aac',
+                                logger=_MoviepyProgress(EncodeProgress()),
+                                audio=bool(audio_clips), audio_fps=max([asset.sample_rate for asset in assets], default=44100),
+                                temp_audiofile=context.temp_path('audio.m4a'))
+    return output_file
+
+
+def _write_images(timeline, directory):
+    """Writes each distinct layer frame to a PNG; returns the paths and where each is used."""
+    images = []  # (path, [(start, end, x, y)]) per distinct frame
+    by_frame = {}
+
+    for start, end, frame, position in timeline.layers:
+        # Identical captions share one cached frame, so each distinct image is decoded once
+        key = id(frame)
+        if key not in by_frame:
+            path = os.path.join(directory, f"layer_{len(images)}.png")
+            Image.fromarray(frame).save(path)
+            by_frame[key] = len(images)
+            images.append((path, []))
+        x, y = ('(W-w)/2', '(H-h)/2') if position == 'center' else position
+        images[by_frame[key]][1].append((start, end, x, y))
+    return images
+
+
+def _audio_filters(input_indexes, audio):
+    """Returns filters that place each audio track at its start time and mix them into [aout]."""
+    filters = []
+    for n, (index, (_, start, duration)) in enumerate(zip(input_indexes, audio)):
+        delay_ms = int(round(start * 1000))
+        filters.append(f"[{index}:a]aformat=sample_rates=44100:channel_layouts=stereo,"
+                       f"atrim=duration={duration:.3f},adelay={delay_ms}|{delay_ms}[a{n}]")
+    inputs = ''.join(f"[a{n}]" for n in range(len(audio)))
+    filters.append(f"{inputs}amix=inputs={len(audio)}:duration=longest:normalize=0[aout]")
+    return filters
+
+
+def _write_filter_script(filters, directory):
+    script_path = os.path.join(directory, 'filter_graph.txt')
+    with open(script_path, 'w') as f:
+        f.write(';\n'.join(filters))
+    return script_path
+
+
+def _run_ffmpeg(command, duration=None):
+    """Runs ffmpeg; with the output's duration, reports encode progress as it goes."""
+    if duration is None:
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()[-2000:]}")
+        return
+
+    progress = EncodeProgress()
+    with tempfile.TemporaryFile(mode='w+') as errors:
+        # -progress writes key=value lines, including the encoded time, to stdout
+        process = subprocess.Popen([command[0], '-progress', 'pipe:1', '-nostats', *command[1:]],
+                                   stdout=subprocess.PIPE, stderr=errors, text=True)
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            if key in ('out_time_us', 'out_time_ms') and value.isdigit():
+                progress.update(int(value) / 1e6 / duration)
+        if process.wait() != 0:
+            errors.seek(0)
+            raise RuntimeError(f"ffmpeg failed: {errors.read().strip()[-2000:]}")
+    progress.update(1)
+
+
+def build_ffmpeg_command(timeline, output_file, directory):
+    """
+    Translates the timeline into a single ffmpeg invocation and its filter graph script.
+
+    Returns:
+        List[str]: The ffmpeg command line.
+    """
+    background = timeline.background
+    duration = timeline.duration
+    fps = timeline.fps
+    inputs = []
+    filters = []
+
+    def add_input(*args):
+        inputs.extend(args)
+        return inputs.count('-i') - 1
+
+    # Background: seek to the start offset and, if the output outlasts the rest of the
+    # source, continue with the source looped from its start.
+    add_input('-ss', f"{background.start_offset:.3f}", '-i', background.path)
+    normalize = '' if background.normalized else normalize_filter(background.w, background.h, fps) + ','
+    if background.loops(duration):
+        add_input('-stream_loop', '-1', '-i', background.path)
+        filters.append(f"[0:v]{normalize}setpts=PTS-STARTPTS[bg0]")
+        filters.append(f"[1:v]{normalize}setpts=PTS-STARTPTS[bg1]")
+        filters.append("[bg0][bg1]concat=n=2:v=1:a=0[bgcat]")
+        filters.append(f"[bgcat]trim=duration={duration:.3f},setpts=PTS-STARTPTS,fps={fps}[v0]")
+    else:
+        filters.append(f"[0:v]{normalize}trim=duration={duration:.3f},setpts=PTS-STARTPTS,fps={fps}[v0]")
+
+    audio_indexes = [add_input('-i', path) for path, _, _ in timeline.audio]
+
+    # Layers: one single-frame input per distinct image, split when it is used several times.
+    # A single frame is repeated by overlay after it ends, and 'enable' limits when it shows.
+    current = 'v0'
+    layer = 0
+    for image_number, (path, uses) in enumerate(_write_images(timeline, directory)):
+        image_index = add_input('-i', path)
+        label = f"img{image_number}"
+        if len(uses) > 1:
+            outputs = ''.join(f"[{label}_{n}]" for n in range(len(uses)))
+            filters.append(f"[{image_index}:v]split={len(uses)}{outputs}")
+            sources = [f"{label}_{n}" for n in range(len(uses))]
+        else:
+            filters.append(f"[{image_index}:v]null[{label}_0]")
+            sources = [f"{label}_0"]
+        for source, (start, end, x, y) in zip(sources, uses):
+            layer += 1
+            filters.append(f"[{current}][{source}]overlay=x={x}:y={y}:"
+                           f"enable='between(t,{start:.3f},{end:.3f})'[v{layer}]")
+            current = f"v{layer}"
+    filters.append(f"[{current}]format=yuv420p[vout]")
+
+    outputs = ['-map', '[vout]']
+    if timeline.audio:
+        filters += _audio_filters(audio_indexes, timeline.audio)
+        outputs += ['-map', '[aout]', '-c:a', 'aac']
+
+    return [
+        get_ffmpeg_exe(), '-y', '-loglevel', 'error', *inputs,
+        '-filter_complex_script', _write_filter_script(filters, directory),
+        *outputs,
+        '-c:v', 'libx264', '-preset', timeline.preset, '-crf', '23', '-r', str(fps),
+        '-t', f"{duration:.3f}", '-movflags', '+faststart',
+        output_file,
+    ]
+
+
+def render_ffmpeg(timeline, output_file, context):
+    """Renders the timeline natively with one ffmpeg filter graph."""
+    directory = tempfile.mkdtemp(dir=context.directory)
+    _run_ffmpeg(build_ffmpeg_command(timeline, output_file, directory), timeline.duration)
+    return output_file
+
+
+RENDER_BACKENDS = {
+    'moviepy': render_moviepy,
+    'ffmpeg': render_ffmpeg,
+}
+
+
+def segment_boundaries(timeline, segments):
+    """
+    Splits the timeline into at most `segments` parts of roughly equal length.
+
+    The background starts at a random offset in its source, so each boundary is moved back
+    to where the background reaches a keyframe of the proxy (a multiple of SEGMENT_ALIGNMENT
+    seconds in source time), then forward to the next whole output frame. Every segment's
+    background then starts within a frame of a keyframe, which is cheap to seek to.
+
+    Returns:
+        List[float]: Boundary times, starting with 0 and ending with the timeline's duration.
+    """
+    frame = 1.0 / timeline.fps
+    background = timeline.background
+    step = max(SEGMENT_ALIGNMENT, timeline.duration / segments)
+    boundaries = [0.0]
+    for n in range(1, segments):
+        t = n * step
+        source_time = (background.start_offset + t) % background.source_duration
+        t -= source_time % SEGMENT_ALIGNMENT
+        # Rounding down could land just before the keyframe and seek from the one before it
+        t = math.ceil(t / frame - 1e-6) * frame
+        if boundaries[-1] < t < timeline.duration:
+            boundaries.append(t)
+    boundaries.append(timeline.duration)
+    return boundaries
+
+
+def _render_segment(backend, timeline, output_file):
+    # Runs in a pool process, which has its own context for the segment
+    with RenderContext() as context:
+        return RENDER_BACKENDS[backend](timeline, output_file, context)
+
+
+def render_segmented(timeline, output_file, backend, segments, context):
+    """
+    Renders the timeline as parallel time segments, one process each, then joins them with an
+    ffmpeg concat stream copy and muxes the audio once over the whole video, so there are no
+    seams in the sound.
+    """
+    boundaries = segment_boundaries(timeline, segments)
+    directory = tempfile.mkdtemp(dir=context.directory)
+    segment_files = [os.path.join(directory, f"segment_{n}.mp4") for n in range(len(boundaries) - 1)]
+    parts = [timeline.segment(start, end) for start, end in zip(boundaries[:-1], boundaries[1:])]
+
+    with ProcessPoolExecutor(max_workers=min(len(parts), os.cpu_count() or 1)) as executor:
+        futures = [executor.submit(_render_segment, backend, part, path) for part, path in zip(parts, segment_files)]
+        # Segments render outside the job, so progress is counted in finished segments
+        progress = EncodeProgress()
+        for done, future in enumerate(as_completed(futures), 1):
+            future.result()
+            progress.update(done / len(futures))
+
+    list_path = os.path.join(directory, 'segments.txt')
+    with open(list_path, 'w') as f:
+        f.writelines(f"file '{path}'\n" for path in segment_files)
+
+    inputs = ['-f', 'concat', '-safe', '0', '-i', list_path]
+    outputs = ['-map', '0:v', '-c:v', 'copy']
+    if timeline.audio:
+        for path, _, _ in timeline.audio:
+            inputs += ['-i', path]
+        filters = _audio_filters(range(1, len(timeline.audio) + 1), timeline.audio)
+        outputs += ['-filter_complex_script', _write_filter_script(filters, directory),
+                    '-map', '[aout]', '-c:a', 'aac']
+
+    _run_ffmpeg([get_ffmpeg_exe(), '-y', '-loglevel', 'error', *inputs, *outputs,
+                 '-t', f"{timeline.duration:.3f}", '-movflags', '+faststart', output_file])
+    return output_file
+
+
+def render(timeline, output_file, backend=None, segments=None, context=None):
+    """
+    Renders a timeline to an MP4 file with the given backend (RENDER_BACKEND by default),
+    split into `segments` parallel parts (RENDER_SEGMENTS by default).
+
+    Temporary files and clips belong to `context`; without one, the render gets its own.
+
+    Returns:
+        str: The output file.
+    """
+    backend = backend or RENDER_BACKEND
+    segments = segments or RENDER_SEGMENTS
+    if backend not in RENDER_BACKENDS:
+        raise ValueError(f"Unknown render backend: {backend}")
+    if context is None:
+        with RenderContext() as context:
+            return render(timeline, output_file, backend, segments, context)
+    with span('encode'):
+        if segments > 1:
+            return render_segmented(timeline, output_file, backend, segments, context)
+        return RENDER_BACKENDS[backend](timeline, output_file, context)
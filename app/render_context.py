@@ -0,0 +1,70 @@
+import os
+import shutil
+import logging
+import tempfile
+
+# Subtitles end this much earlier than their chunk so consecutive captions don't overlap
+SUBTITLE_END_TRIM = 0.1
+
+
+class RenderContext:
+    """
+    Owns the state of one render: the subtitle timeline, a private working directory for
+    temporary files and the clips opened along the way.
+
+    Nothing is shared between contexts, so several renders can run at once in one process.
+    Use it as a context manager; closing it closes the clips and deletes the working directory.
+    """
+
+    def __init__(self, job_id=None):
+        self.job_id = job_id
+        self.subtitle_end_time = 0
+        self.subtitles = []  # (start, end, text) as scheduled, relative to the story audio
+        self._directory = None
+        self._clips = []
+
+    @property
+    def directory(self):
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(prefix=f"render_{self.job_id or 'local'}_")
+        return self._directory
+
+    def temp_path(self, name):
+        """Returns the path of a temporary file in this render's working directory."""
+        return os.path.join(self.directory, name)
+
+    def track(self, clip):
+        """Registers a clip to be closed with the context, and returns it."""
+        self._clips.append(clip)
+        return clip
+
+    def schedule_subtitle(self, start, end, text=''):
+        """
+        Places the next subtitle on this render's timeline: it starts no earlier than the
+        previous one ended, and ends SUBTITLE_END_TRIM early to avoid overlapping the next.
+
+        Returns:
+            Tuple[float, float]: The scheduled start and end time.
+        """
+        start = max(start, self.subtitle_end_time)
+        end -= SUBTITLE_END_TRIM
+        self.subtitle_end_time = end
+        self.subtitles.append((start, end, text))
+        return start, end
+
+    def close(self):
+        for clip in self._clips:
+            try:
+                clip.close()
+            except Exception as e:
+                logging.warning(f"Error closing clip: {e}")
+        self._clips = []
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
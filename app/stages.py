@@ -0,0 +1,95 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from app.jobs import bind_job
+
+# Threads per job for running independent stages at the same time
+PIPELINE_STAGE_WORKERS = int(os.getenv('PIPELINE_STAGE_WORKERS', 4))
+
+
+class Stage:
+    """
+    One step of a pipeline. The function is called with the results of the stages it
+    depends on, as positional arguments in the order of depends_on.
+    """
+
+    def __init__(self, name, func, depends_on=()):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+
+
+class StageRun:
+    """Results and timings of one run of a stage graph."""
+
+    def __init__(self):
+        self.results = {}
+        self.started = {}
+        self.finished = {}
+        self.origin = time.perf_counter()
+
+    def timings(self):
+        """Returns each stage's start and end time in seconds since the run started."""
+        return {name: {'start': round(self.started[name] - self.origin, 3),
+                       'end': round(self.finished[name] - self.origin, 3)}
+                for name in self.finished}
+
+    def critical_path(self, stages):
+        """
+        Returns the chain of stages that determined the run's wall time: starting from the
+        stage that finished last, each step goes back to the dependency that finished last.
+        """
+        by_name = {stage.name: stage for stage in stages}
+        name = max(self.finished, key=self.finished.get)
+        path = [name]
+        while by_name[name].depends_on:
+            name = max(by_name[name].depends_on, key=self.finished.get)
+            path.append(name)
+        return path[::-1]
+
+
+def run_stages(stages, max_workers=None):
+    """
+    Runs a graph of stages, each as soon as the stages it depends on have finished, so
+    independent stages overlap.
+
+    Args:
+        stages (List[Stage]): The stages, in any order; names must be unique.
+        max_workers (int): Stages run at the same time. Defaults to PIPELINE_STAGE_WORKERS.
+
+    Returns:
+        StageRun: Results, timings and critical path of the run.
+
+    Raises:
+        Exception: The first exception raised by a stage; stages not yet started are skipped.
+    """
+    pending = {stage.name: stage for stage in stages}
+    run = StageRun()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers or PIPELINE_STAGE_WORKERS, thread_name_prefix='stage') as executor:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if all(dependency in run.results for dependency in stage.depends_on):
+                    del pending[name]
+                    run.started[name] = time.perf_counter()
+                    args = [run.results[dependency] for dependency in stage.depends_on]
+                    running[executor.submit(bind_job(stage.func), *args)] = name
+
+            if not running:
+                raise ValueError(f"Stages with unmet dependencies: {sorted(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                run.finished[name] = time.perf_counter()
+                error = future.exception()
+                if error is not None:
+                    logging.error(f"Stage {name} failed: {error}")
+                    for other in running:
+                        other.cancel()
+                    raise error
+                run.results[name] = future.result()
+
+    return run
@@ -0,0 +1,166 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from app.metrics import span
+
+CORPUS_PATH = os.getenv('STORY_CORPUS_PATH', './instance/story_corpus.db')
+# Typical narration pace of the TTS voices, used to estimate how long a story runs
+NARRATION_WORDS_PER_SECOND = float(os.getenv('NARRATION_WORDS_PER_SECOND', 2.6))
+# A story matches a target duration if its estimate is within this fraction of it
+DURATION_TOLERANCE = 0.25
+MAX_SEARCH_RESULTS = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS corpus_story (
+    id INTEGER PRIMARY KEY,
+    content_hash TEXT NOT NULL UNIQUE,
+    reddit_id TEXT,
+    subreddit TEXT NOT NULL,
+    title TEXT NOT NULL,
+    body TEXT NOT NULL,
+    word_count INTEGER NOT NULL,
+    narration_seconds REAL NOT NULL,
+    added_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS corpus_story_subreddit_length ON corpus_story (subreddit, narration_seconds);
+CREATE INDEX IF NOT EXISTS corpus_story_length ON corpus_story (narration_seconds);
+CREATE VIRTUAL TABLE IF NOT EXISTS corpus_story_fts USING fts5(
+    title, body, content='corpus_story', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS corpus_story_ai AFTER INSERT ON corpus_story BEGIN
+    INSERT INTO corpus_story_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS corpus_story_ad AFTER DELETE ON corpus_story BEGIN
+    INSERT INTO corpus_story_fts (corpus_story_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+END;
+"""
+
+_COLUMNS = "s.id, s.subreddit, s.title, s.body, s.word_count, s.narration_seconds"
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def connect(path=None):
+    """Returns this thread's connection to the corpus, creating the database on first use."""
+    path = os.path.abspath(path or CORPUS_PATH)
+    connections = _local.__dict__.setdefault('connections', {})
+    connection = connections.get(path)
+    if connection is None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection = sqlite3.connect(path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        # WAL lets searches run while the refresher ingests
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        with _schema_lock:
+            if path not in _schema_ready:
+                connection.executescript(SCHEMA)
+                _schema_ready.add(path)
+        connections[path] = connection
+    return connection
+
+
+def content_hash(title, body):
+    """Hashes a story's text with case and whitespace normalized, so reposts dedupe."""
+    text = ' '.join(f"{title}\n{body}".lower().split())
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def word_count(text):
+    return len(text.split())
+
+
+def estimate_narration_seconds(title, body):
+    """Estimates how long the title and story take to narrate."""
+    return round((word_count(title) + word_count(body)) / NARRATION_WORDS_PER_SECOND, 1)
+
+
+def ingest(subreddit, stories, path=None):
+    """
+    Adds scraped stories to the corpus in one transaction. Stories whose text is already in
+    the corpus are skipped.
+
+    Args:
+        subreddit (str): Subreddit the stories came from.
+        stories (Iterable[Tuple[str, str, str]]): (reddit_id, title, body) of each story.
+
+    Returns:
+        int: Number of stories added.
+    """
+    now = time.time()
+    rows = [(content_hash(title, body), reddit_id, subreddit, title, body,
+             word_count(body), estimate_narration_seconds(title, body), now)
+            for reddit_id, title, body in stories if title and body]
+    connection = connect(path)
+    with span('corpus_ingest'), connection:
+        cursor = connection.executemany(
+            "INSERT OR IGNORE INTO corpus_story "
+            "(content_hash, reddit_id, subreddit, title, body, word_count, narration_seconds, added_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return cursor.rowcount
+
+
+def _match_query(keywords):
+    """Turns free text into an FTS5 query that matches all of its words, as prefixes."""
+    terms = re.findall(r"\w+", keywords)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search(keywords=None, subreddit=None, target_seconds=None, tolerance=DURATION_TOLERANCE,
+           limit=20, offset=0, path=None):
+    """
+    Finds stories in the corpus.
+
+    Args:
+        keywords (str): Words that must all appear in the title or body.
+        subreddit (str): Only stories from this subreddit.
+        target_seconds (float): Only stories whose estimated narration is within `tolerance`
+            of this many seconds; without keywords, the closest come first.
+        limit (int): Maximum number of stories returned, up to MAX_SEARCH_RESULTS.
+        offset (int): Number of matching stories to skip.
+
+    Returns:
+        List[dict]: Matching stories, best match first.
+    """
+    where, params, order = [], [], ['s.id DESC']
+    source = "corpus_story s"
+    match = _match_query(keywords) if keywords else ''
+    if match:
+        source = "corpus_story_fts JOIN corpus_story s ON s.id = corpus_story_fts.rowid"
+        where.append("corpus_story_fts MATCH ?")
+        params.append(match)
+        order.insert(0, 'bm25(corpus_story_fts)')
+    if subreddit:
+        where.append("s.subreddit = ?")
+        params.append(subreddit)
+    if target_seconds:
+        where.append("s.narration_seconds BETWEEN ? AND ?")
+        params += [target_seconds * (1 - tolerance), target_seconds * (1 + tolerance)]
+        order.insert(len(order) - 1, 'abs(s.narration_seconds - ?)')
+
+    sql = f"SELECT {_COLUMNS} FROM {source}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY " + ", ".join(order) + " LIMIT ? OFFSET ?"
+    if target_seconds:
+        params.append(target_seconds)
+    params += [max(1, min(limit, MAX_SEARCH_RESULTS)), max(0, offset)]
+
+    with span('corpus_search'):
+        rows = connect(path).execute(sql, params).fetchall()
+    return [dict(row) for row in rows]
+
+
+def ingest_listing(subreddit, stories):
+    """Adds a freshly fetched subreddit listing to the corpus, logging instead of raising."""
+    try:
+        added = ingest(subreddit, stories)
+        if added:
+            logging.info(f"Added {added} stories from /r/{subreddit} to the corpus")
+    except sqlite3.Error as e:
+        logging.error(f"Error adding /r/{subreddit} to the story corpus: {e}")
@@ -0,0 +1,64 @@
+import json
+from flask import current_app
+from app import db
+from app.models import Story
+
+
+def story_recorder(user_id, params, promoted_from=None):
+    """
+    Returns an on_done callback for a generation job that commits a Story row for every
+    video the job produced, with its render metadata.
+
+    Args:
+        user_id (str): ID of the user who queued the job, or None.
+        params (dict): The job's request parameters.
+        promoted_from (str): For a promotion, the ID of the draft's job; the draft's
+            story text, product, gameplay and voice are copied from its row.
+    """
+    app = current_app._get_current_object()
+
+    def record(job):
+        with app.app_context():
+            record_job(job, user_id, params, promoted_from)
+    return record
+
+
+def record_job(job, user_id, params, promoted_from=None):
+    result = job.result or {}
+    fields = {
+        'user_id': int(user_id) if user_id else None,
+        'job_id': job.id,
+        'title': result.get('title') or params.get('title'),
+        'data': params.get('story_text'),
+        'product': params.get('product'),
+        'gameplay': params.get('gameplay'),
+        'voice': params.get('voice'),
+        'render_seconds': job.finished_at - job.started_at if job.started_at else None,
+        'stage_timings': json.dumps(result['stage_timings']) if result.get('stage_timings') else None,
+    }
+    if promoted_from:
+        draft = Story.query.filter_by(job_id=promoted_from).first()
+        if draft is not None:
+            fields.update(data=draft.data, product=draft.product, gameplay=draft.gameplay, voice=draft.voice)
+
+    if 'videos' in result:
+        # A batch: one row per variant
+        stories = [Story(**dict(fields, product=video['product'], gameplay=video['gameplay'],
+                                voice=video['voice'], video_url=video['video_url']))
+                   for video in result['videos']]
+    else:
+        artifacts = result.get('artifacts') or {}
+        stories = [Story(**fields, gptdata=result.get('full_story'), video_url=result.get('video_url'),
+                         draft=bool(result.get('draft')), title_duration=artifacts.get('title_duration'),
+                         story_duration=artifacts.get('story_duration'),
+                         artifacts=json.dumps(artifacts) if artifacts else None)]
+
+    db.session.add_all(stories)
+    db.session.commit()
+    return stories
+
+
+def user_stories(user_id, page=1, per_page=20):
+    """Returns one page of a user's stories, newest first."""
+    query = db.select(Story).filter_by(user_id=int(user_id)).order_by(Story.date.desc(), Story.id.desc())
+    return db.paginate(query, page=page, per_page=per_page, max_per_page=50, error_out=False)
@@ -1,22 +1,43 @@
 import os
-from openai import OpenAI
+import json
+import hashlib
 import logging
+import threading
+from app.audio_cache import normalize_text
+from app.disk_cache import DiskCache
+from app import metrics
 
-client = OpenAI(api_key=os.getenv('OpenAI_API_KEY'))
+REWRITE_MODEL = os.getenv('REWRITE_MODEL', "gpt-4")
+# Bump whenever the prompt below changes so stale rewrites aren't served from the cache
+PROMPT_VERSION = 1
 
-def rework_story_with_product(story_text, product):
-    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-    """
-    Sends the story and product info to the OpenAI API to rewrite the story, 
-    subtly including the product in a natural way using the chat API.
-    
-    Args:
-        story_text (str): Original Reddit story text.
-        product (str): The product to integrate into the story.
-    
-    Returns:
-        str: The story reworked with subtle product placement.
-    """
+REWRITE_CACHE_DIR = os.getenv('REWRITE_CACHE_DIR', './generated_files/rewrite_cache')
+REWRITE_CACHE_MAX_BYTES = int(os.getenv('REWRITE_CACHE_MAX_BYTES', 32 * 2**20))
+
+client = None  # Created on first use; importing openai takes a noticeable part of startup
+_client_lock = threading.Lock()
+rewrite_cache = DiskCache(REWRITE_CACHE_DIR, REWRITE_CACHE_MAX_BYTES)
+
+
+def get_client():
+    """Returns the shared OpenAI client, importing openai and creating it on first use."""
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                from openai import OpenAI
+                client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    return client
+
+
+def _cache_key(story_text, product):
+    # Normalized because forms resubmit the previewed rewrite with CRLF line breaks
+    story_hash = hashlib.sha256(normalize_text(story_text).encode('utf-8')).hexdigest()
+    payload = json.dumps([story_hash, product.strip(), REWRITE_MODEL, PROMPT_VERSION])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _build_messages(story_text, product):
     prompt = (
     f"Rewrite the following story to subtly incorporate the product '{product}' in a way that preserves the original voice, tone, and style of the storyteller. "
     "The product should be naturally woven into the narrative without sounding promotional or forced. The storytelling style and personal tone must be kept intact. "
@@ -25,19 +46,71 @@ def rework_story_with_product(story_text, product):
     "Here's the original story:\n\n"
     f"{story_text}\n\n"
     )
+    return [
+        {"role": "system", "content": "You are a creative writing assistant."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def get_cached_rewrite(story_text, product):
+    """
+    Returns the cached rewrite of story_text for product, or None.
 
+    A story that is itself a cached rewrite for the product maps to itself, so /generate
+    reuses the text the user already previewed through /modify_story.
+    """
+    cached = rewrite_cache.get(_cache_key(story_text, product), 'txt')
+    return cached.decode('utf-8') if cached is not None else None
+
+
+def _store_rewrite(story_text, product, reworked_story):
+    rewrite_cache.put(_cache_key(story_text, product), 'txt', reworked_story.encode('utf-8'))
+    rewrite_cache.put(_cache_key(reworked_story, product), 'txt', reworked_story.encode('utf-8'))
+
+
+def rework_story_with_product(story_text, product, on_token=None):
+    """
+    Sends the story and product info to the OpenAI API to rewrite the story,
+    subtly including the product in a natural way using the chat API.
+
+    Rewrites are cached by (story hash, product, model, prompt version).
+
+    Args:
+        story_text (str): Original Reddit story text.
+        product (str): The product to integrate into the story.
+        on_token (callable): Optional callback that receives the text as it streams in.
+
+    Returns:
+        str: The story reworked with subtle product placement.
+    """
+    cached = get_cached_rewrite(story_text, product)
+    metrics.inc('cache_requests_total', cache='rewrite', result='miss' if cached is None else 'hit')
+    if cached is not None:
+        if on_token:
+            on_token(cached)
+        return cached
 
     try:
-        response = client.chat.completions.create(model="gpt-4",  # Using the chat model
-        messages=[
-            {"role": "system", "content": "You are a creative writing assistant."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7,
-        max_tokens=1000)
-
-        # Extract the reworked story from the chat response
-        reworked_story = response.choices[0].message.content
+        with metrics.span('rewrite'):
+            response = get_client().chat.completions.create(model=REWRITE_MODEL,  # Using the chat model
+            messages=_build_messages(story_text, product),
+            temperature=0.7,
+            max_tokens=1000,
+            stream=on_token is not None)
+
+            if on_token is None:
+                # Extract the reworked story from the chat response
+                reworked_story = response.choices[0].message.content
+            else:
+                parts = []
+                for chunk in response:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                        on_token(delta)
+                reworked_story = ''.join(parts)
+
+        _store_rewrite(story_text, product, reworked_story)
         return reworked_story
 
     except Exception as e:
@@ -0,0 +1,102 @@
+import os
+import logging
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from moviepy.video.VideoClip import ImageClip
+
+# Bold sans fonts tried in order; the first one Pillow can find is used
+SUBTITLE_FONTS = [os.getenv('SUBTITLE_FONT'), 'Arial Bold.ttf', 'Arial-Bold.ttf', 'arialbd.ttf', 'DejaVuSans-Bold.ttf']
+SUBTITLE_CACHE_SIZE = int(os.getenv('SUBTITLE_CACHE_SIZE', 2048))
+
+
+@lru_cache(maxsize=None)
+def load_font(fontsize):
+    """Returns the subtitle font at the given size, loading each size only once."""
+    for name in SUBTITLE_FONTS:
+        if not name:
+            continue
+        try:
+            return ImageFont.truetype(name, fontsize)
+        except OSError:
+            continue
+    logging.warning("No bold TrueType font found for subtitles, using Pillow's default font")
+    return ImageFont.load_default(fontsize)
+
+
+def _wrap_words(words, font, max_width, stroke_width):
+    lines = []
+    current = []
+    for word in words:
+        candidate = ' '.join(current + [word])
+        if current and font.getlength(candidate) + 2 * stroke_width > max_width:
+            lines.append(' '.join(current))
+            current = [word]
+        else:
+            current.append(word)
+    if current:
+        lines.append(' '.join(current))
+    return lines
+
+
+@lru_cache(maxsize=SUBTITLE_CACHE_SIZE)
+def render_line(line, fontsize, color, stroke_color, stroke_width):
+    """
+    Rasterizes one line of text into a tightly sized RGBA image.
+
+    Returns:
+        PIL.Image.Image: The rendered line. Treat it as read-only; it is shared through the cache.
+    """
+    font = load_font(fontsize)
+    ascent, descent = font.getmetrics()
+    width = int(np.ceil(font.getlength(line))) + 2 * stroke_width
+    height = ascent + descent + 2 * stroke_width
+    image = Image.new('RGBA', (max(width, 1), height), (0, 0, 0, 0))
+    ImageDraw.Draw(image).text((stroke_width, stroke_width), line, font=font, fill=color,
+                               stroke_width=stroke_width, stroke_fill=stroke_color)
+    return image
+
+
+@lru_cache(maxsize=SUBTITLE_CACHE_SIZE)
+def render_caption(text, fontsize=72, width=880, color='white', stroke_color='black', stroke_width=1):
+    """
+    Rasterizes a subtitle caption, wrapped to the given width with centered lines, like
+    TextClip's 'caption' method but without starting ImageMagick.
+
+    Args:
+        text (str): Caption text.
+        fontsize (int): Font size in pixels.
+        width (int): Width of the caption box; lines are wrapped to fit it.
+        color (str): Text color.
+        stroke_color (str): Outline color.
+        stroke_width (int): Outline width in pixels.
+
+    Returns:
+        np.ndarray: Read-only HxWx4 RGBA frame of the caption.
+    """
+    font = load_font(fontsize)
+    lines = _wrap_words(text.split(), font, width, stroke_width) or ['']
+    line_images = [render_line(line, fontsize, color, stroke_color, stroke_width) for line in lines]
+
+    caption = Image.new('RGBA', (width, sum(image.height for image in line_images)), (0, 0, 0, 0))
+    y = 0
+    for image in line_images:
+        caption.alpha_composite(image, ((width - image.width) // 2 if image.width < width else 0, y))
+        y += image.height
+
+    frame = np.asarray(caption)
+    frame.flags.writeable = False
+    return frame
+
+
+def subtitle_clip(text, fontsize=72, width=880, color='white', stroke_color='black', stroke_width=1):
+    """
+    Returns an ImageClip of a rendered caption, with its transparency as the clip's mask.
+    """
+    frame = render_caption(text, fontsize, width, color, stroke_color, stroke_width)
+    return ImageClip(frame, transparent=True)
+
+
+def cache_info():
+    """Returns hit/miss statistics of the line and caption image caches."""
+    return {'lines': render_line.cache_info()._asdict(), 'captions': render_caption.cache_info()._asdict()}
@@ -1,35 +1,155 @@
 import os
+import re
+import hashlib
 import requests
-import uuid
+import threading
 from pathlib import Path
 import textwrap
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from app.audio_cache import audio_cache, cache_key
+from app import audio_assets
+from app.artifact_store import artifact_store
+from app import metrics
 
-def text_to_speech(input_text, voice="alloy", format="mp3"):
-    max_length = 4096
-    audio_chunks = []
+TTS_API_URL = os.getenv('TTS_API_URL', "https://api.openai.com/v1/audio/speech")
+TTS_CONCURRENCY = int(os.getenv('TTS_CONCURRENCY', 4))
+TTS_TIMEOUT = float(os.getenv('TTS_TIMEOUT', 120))
+TTS_RETRIES = int(os.getenv('TTS_RETRIES', 4))
 
-    # Split the text into smaller chunks
-    if len(input_text) > max_length:
-        text_parts = textwrap.wrap(input_text, max_length, break_long_words=False)
-    else:
-        text_parts = [input_text]
+MAX_CHUNK_LENGTH = 4096
+
+TTS_MODEL = "tts-1"
+
+# Whitespace after a sentence end: terminal punctuation, optionally followed by a closing quote or
+# bracket, which stays with its sentence
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+|(?<=[.!?]["\')\]])\s+')
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session():
+    """Returns the process-wide pooled session used for speech requests."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=TTS_RETRIES,
+                    backoff_factor=0.5,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=['POST'],
+                    respect_retry_after_header=True,
+                )
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=TTS_CONCURRENCY, max_retries=retry)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def _pack_sentences(text, max_length):
+    chunks = []
+    current = ''
+    for sentence in _SENTENCE_END.split(text):
+        pieces = [sentence] if len(sentence) <= max_length else textwrap.wrap(sentence, max_length, break_long_words=False)
+        for piece in pieces:
+            if current and len(current) + 1 + len(piece) > max_length:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_text(input_text, max_length=MAX_CHUNK_LENGTH):
+    """
+    Splits text into chunks of at most max_length characters: one or more per paragraph,
+    packing whole sentences.
+
+    Chunks never span paragraphs, even when the whole text would fit in one, so editing one
+    paragraph leaves the other chunks (and their cached audio) unchanged. Sentences longer
+    than max_length are wrapped at word boundaries instead.
 
-    for part in text_parts:
-        response = requests.post(
-            "https://api.openai.com/v1/audio/speech",
+    Args:
+        input_text (str): Text to split.
+        max_length (int): Maximum length of each chunk.
+
+    Returns:
+        List[str]: The chunks, in order.
+    """
+    chunks = []
+    for paragraph in input_text.splitlines():
+        if paragraph.strip():
+            chunks.extend(_pack_sentences(paragraph.strip(), max_length))
+    return chunks or [input_text]
+
+
+def synthesize_chunk(part, voice="alloy", format="mp3", model=TTS_MODEL):
+    """
+    Synthesizes one chunk of text, retrying with backoff on 429 and 5xx responses.
+
+    Returns:
+        bytes: The encoded audio, or 24 kHz 16-bit mono samples for format "pcm".
+    """
+    key = cache_key(part, voice, format, model)
+    cached = audio_cache.get(key, format)
+    metrics.inc('cache_requests_total', cache='tts', result='miss' if cached is None else 'hit')
+    if cached is not None:
+        return cached
+
+    with metrics.span('tts_chunk'):
+        response = _get_session().post(
+            TTS_API_URL,
             headers={
                 "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}",
                 "Content-Type": "application/json"
             },
-            json={"model": "tts-1", "input": part, "voice": voice, "response_format": format}
+            json={"model": model, "input": part, "voice": voice, "response_format": format},
+            timeout=TTS_TIMEOUT,
         )
-        audio_chunks.append(response.content)
+        retries = getattr(response.raw, 'retries', None)
+        if retries is not None and retries.history:
+            metrics.inc('retries_total', len(retries.history), service='tts')
+        response.raise_for_status()
+    audio_cache.put(key, format, response.content)
+    return response.content
+
 
-    combined_audio_path = Path(f"./generated_files/speech_{uuid.uuid4()}.{format}")
-    combined_audio_path.parent.mkdir(parents=True, exist_ok=True)
+def text_to_speech(input_text, voice="alloy", format="mp3"):
+    """
+    Narrates text and writes it to an audio file in the given format.
+
+    Chunks are synthesized as raw PCM and joined at the sample level, then encoded once.
+    The decoded narration is registered with audio_assets, so later stages get the samples
+    without decoding the file again.
+
+    Returns:
+        str: Path of the narration file.
+    """
+    # Split the text into smaller chunks at sentence boundaries
+    text_parts = split_text(input_text)
 
-    with open(combined_audio_path, "wb") as f:
-        for chunk in audio_chunks:
-            f.write(chunk)
+    # Synthesize the chunks concurrently; map() keeps them in their original order
+    with ThreadPoolExecutor(max_workers=min(TTS_CONCURRENCY, len(text_parts))) as executor:
+        audio_chunks = list(executor.map(lambda part: synthesize_chunk(part, voice=voice, format='pcm'), text_parts))
+
+    # Name the output after its content so identical narrations share one file
+    digest = hashlib.sha256(b''.join(audio_chunks)).hexdigest()[:32]
+    combined_audio_path = Path(artifact_store.path(f"speech_{digest}.{format}"))
+
+    asset = audio_assets.AudioAsset(np.concatenate([audio_assets.pcm16_to_samples(chunk) for chunk in audio_chunks]))
+    if not combined_audio_path.exists():
+        audio_assets.encode(asset, str(combined_audio_path))
+    else:
+        # Reused by this job, so it is not evicted as unused
+        artifact_store.touch(str(combined_audio_path))
+    audio_assets.register(str(combined_audio_path), asset)
 
     return str(combined_audio_path)
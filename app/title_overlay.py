@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from PIL import Image, ImageOps
+import numpy as np
+from app.subtitle_renderer import render_line, render_caption
+
+ROUNDED_RECTANGLE_PATH = "./app/static/rounded_rectangle.png"
+DEFAULT_PROFILE_PIC_PATH = "./app/static/profpic.png"
+
+PROFPIC_HEIGHT = 140
+PADDING = 20
+USERNAME_FONTSIZE = 24
+TITLE_FONTSIZE = 28
+
+_avatars = OrderedDict()  # profile picture digest -> resized avatar
+_overlays = OrderedDict()  # (title, username, profile picture digest) -> overlay frame
+_cache_lock = threading.Lock()
+MAX_AVATARS = 256
+MAX_OVERLAYS = 128
+
+
+def _cache_get(cache, key):
+    with _cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+
+def _cache_put(cache, key, value, max_size):
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_size:
+            cache.popitem(last=False)
+
+
+@lru_cache(maxsize=1)
+def _load_background():
+    return Image.open(ROUNDED_RECTANGLE_PATH).convert('RGBA')
+
+
+def file_digest(path):
+    """Returns the SHA-256 digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _decode_avatar(digest, path):
+    avatar = _cache_get(_avatars, digest)
+    if avatar is None:
+        # Center-cropped to a square, so a very wide upload can't push the title out of the box
+        image = Image.open(path).convert('RGBA')
+        avatar = ImageOps.fit(image, (PROFPIC_HEIGHT, PROFPIC_HEIGHT), Image.LANCZOS)
+        _cache_put(_avatars, digest, avatar, MAX_AVATARS)
+    return avatar
+
+
+def load_avatar(profile_pic_path):
+    """
+    Returns the decoded profile picture, center-cropped to a square and resized to
+    PROFPIC_HEIGHT, and its content digest.
+
+    Avatars are cached by content, so the same user's picture is decoded once however many
+    times it is uploaded. Falls back to the default picture if the upload can't be read.
+    """
+    for path in (profile_pic_path, DEFAULT_PROFILE_PIC_PATH):
+        if not path:
+            continue
+        try:
+            digest = file_digest(path)
+            return _decode_avatar(digest, path), digest
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not load profile picture {path}: {e}")
+    raise ValueError("Profpic creation failed.")
+
+
+def _render_overlay(text, username, avatar):
+    background = _load_background()
+    overlay = background.copy()
+
+    # Profile picture, centered vertically in the box with padding on the left
+    profpic_y = (overlay.height - PROFPIC_HEIGHT) // 2
+    overlay.alpha_composite(avatar, (PADDING, profpic_y))
+
+    # Username to the right of the profile picture
+    username_x = PADDING + avatar.width + PADDING
+    username_image = render_line(f"@{username}", USERNAME_FONTSIZE, 'black', 'black', 0)
+    overlay.alpha_composite(username_image, (username_x, profpic_y))
+
+    # Title under the username, wrapped to the space left in the box
+    available_width = overlay.width - avatar.width - 3 * PADDING
+    title_frame = render_caption(text, TITLE_FONTSIZE, available_width, 'black', 'black', 0)
+    title_image = Image.fromarray(title_frame)
+    title_y = profpic_y + username_image.height + PADDING // 2
+    # The title may run past the bottom of the box, as it always has; clip it to the box
+    title_image = title_image.crop((0, 0, title_image.width, max(1, min(title_image.height, overlay.height - title_y))))
+    overlay.alpha_composite(title_image, (username_x, title_y))
+
+    frame = np.asarray(overlay)
+    frame.flags.writeable = False
+    return frame
+
+
+def render_title_overlay(text, username, profile_pic_path):
+    """
+    Flattens the title overlay (rounded box, profile picture, username and title) into a
+    single RGBA image the size of the box.
+
+    Results are cached by (title, username, profile picture digest).
+
+    Args:
+        text (str): The main title text.
+        username (str): The username to display.
+        profile_pic_path (str): Path to the uploaded profile picture.
+
+    Returns:
+        np.ndarray: Read-only HxWx4 RGBA frame of the overlay.
+    """
+    avatar, digest = load_avatar(profile_pic_path)
+    key = (text, username, digest)
+    frame = _cache_get(_overlays, key)
+    if frame is None:
+        frame = _render_overlay(text, username, avatar)
+        _cache_put(_overlays, key, frame, MAX_OVERLAYS)
+    return frame
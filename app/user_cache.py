@@ -0,0 +1,48 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy.orm import Session
+from app import db, metrics
+from app.models import User
+
+# Flask-Login loads the user on every request; this long a loaded user is reused instead
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 60))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 1024))
+
+_users = OrderedDict()  # id -> (expires_at, detached User)
+_lock = threading.Lock()
+
+
+def load_user(user_id):
+    """
+    Returns the User with this id for the current request, reading it from the database at
+    most once per USER_CACHE_TTL seconds.
+
+    Cached users are detached copies; each request gets its own instance, merged into its
+    session without a query.
+    """
+    user_id = int(user_id)
+    now = time.monotonic()
+    with _lock:
+        entry = _users.get(user_id)
+        if entry is not None and entry[0] > now:
+            _users.move_to_end(user_id)
+            user = entry[1]
+        else:
+            user = None
+    metrics.inc('cache_requests_total', cache='users', result='miss' if user is None else 'hit')
+
+    if user is None:
+        with Session(db.engine) as session:
+            user = session.get(User, user_id)
+            if user is None:
+                return None
+            session.expunge(user)
+        with _lock:
+            _users[user_id] = (now + USER_CACHE_TTL, user)
+            _users.move_to_end(user_id)
+            while len(_users) > USER_CACHE_SIZE:
+                _users.popitem(last=False)
+    return db.session.merge(user, load=False)
+
@@ -1,226 +1,217 @@
-import moviepy.editor as mp
+import os
+import logging
 import uuid
+import random
 from pathlib import Path
-import whisper
-from flask_socketio import SocketIO, emit
-from moviepy.editor import ImageClip, TextClip, CompositeVideoClip
+from app.whisper_models import transcribe
+from app.alignment import align_subtitles
+from app.gameplay_proxies import get_proxy
+from app.subtitle_renderer import render_caption
+from app.title_overlay import render_title_overlay
+from app.render import Background, Timeline, draft_timeline, render
+from app.render_context import RenderContext
+from app import audio_assets
+from app.artifact_store import artifact_store
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from moviepy.video.VideoClip import ImageClip
 from PIL import Image
-from app.socketio_instance import socketio
+from app.jobs import emit_progress
+from app.metrics import span
 
-last_subtitle_end_time = 0
+# Where backgrounds start playing: 'random' (so videos don't all look the same) or a time in seconds
+BACKGROUND_START_OFFSET = os.getenv('BACKGROUND_START_OFFSET', 'random')
 
+# 'align' aligns the known story text to the narration; 'whisper' always runs a full transcription.
+# Alignment stays opt-in until it is checked against real narration (benchmarks.check_alignment --audio).
+SUBTITLE_ENGINE = os.getenv('SUBTITLE_ENGINE', 'whisper')
 
-def adjust_video_for_tiktok(video_path, duration):
+
+def adjust_video_for_tiktok(video_path, duration, start_offset=None):
     """
     Adjusts the input video to fit TikTok's format, ensuring it matches the desired duration.
     
     Args:
         video_path (str): Path to the video file.
         duration (float): Desired duration of the output video.
+        start_offset (float): Where in the gameplay to start. Defaults to BACKGROUND_START_OFFSET,
+            which picks a random offset unless configured.
     
     Returns:
-        VideoFileClip: Adjusted video clip.
+        Background: The adjusted background, which render backends turn into video.
     """
     try:
-        # socketio.emit('log_update', {'log': "Log: Loading video for adjustment..."})
-        video = mp.VideoFileClip(video_path)
-
-        # Determine the aspect ratio for TikTok (9:16)
-        target_aspect_ratio = 9 / 16
-        video_aspect_ratio = video.w / video.h
-
-        # Crop or pad the video to fit the target aspect ratio
-        if video_aspect_ratio > target_aspect_ratio:
-            # Video is wider than target, crop the sides
-            new_width = int(target_aspect_ratio * video.h)
-            crop_x = (video.w - new_width) // 2
-            video = video.crop(x1=crop_x, width=new_width)
-        else:
-            # Video is taller than target, crop the top and bottom
-            new_height = int(video.w / target_aspect_ratio)
-            crop_y = (video.h - new_height) // 2
-            video = video.crop(y1=crop_y, height=new_height)
-
-        # Resize to TikTok's preferred resolution (1080x1920 for portrait)
-        video = video.resize(newsize=(1080, 1920))
-
-        # Trim or loop the video to match the desired duration
-        if video.duration > duration:
-            video = video.subclip(0, duration)
-        else:
-            repeat_count = int(duration / video.duration) + 1
-            video = mp.concatenate_videoclips([video] * repeat_count).subclip(0, duration)
+        with span('background_adjust'):
+            # socketio.emit('log_update', {'log': "Log: Loading video for adjustment..."})
+            proxy_path = get_proxy(video_path)
+            # The proxy is already cropped and resized to 1080x1920
+            path = proxy_path or video_path
+            infos = ffmpeg_parse_infos(path)
+            source_duration = infos['duration']
+
+            if start_offset is None:
+                start_offset = BACKGROUND_START_OFFSET
+
+            # Trim or loop the video to match the desired duration
+            if source_duration > duration:
+                if start_offset == 'random':
+                    start_offset = random.uniform(0, source_duration - duration)
+                start_offset = min(float(start_offset), source_duration - duration)
+            else:
+                if start_offset == 'random':
+                    start_offset = random.uniform(0, source_duration)
+                start_offset = float(start_offset) % source_duration
 
         # socketio.emit('log_update', {'log': "Log: Video adjusted for TikTok format."})
-        return video
+        return Background(path, start_offset, source_duration, infos['video_fps'], normalized=proxy_path is not None)
     except Exception as e:
         # socketio.emit('log_update', {'log': f"Error adjusting video for TikTok: {e}"})
         return None
     
 
-from moviepy.editor import ImageClip, TextClip, CompositeVideoClip
-from PIL import Image
-
 def create_social_media_overlay(text, username, profile_pic_path, width=1080, height=1920):
     """
     Creates a social media-style overlay with the given text and profile picture.
     Reuses an existing rounded rectangle image and uses the user's uploaded profile picture.
+
+    The overlay is flattened into one cached RGBA image, so it is composited as a single layer.
     
     Args:
         text (str): The main title text.
         username (str): The username to display.
         profile_pic_path (str): Path to the profile picture image.
-        width (int): Width of the overlay.
-        height (int): Height of the overlay.
+        width (int): Width of the video the overlay is centered in.
+        height (int): Height of the video the overlay is centered in.
     
     Returns:
-        ImageClip: A CompositeVideoClip containing the overlay elements.
+        ImageClip: The overlay, positioned in the center of the video.
     """
     try:
-        # Paths to the reused images (you may need to update this path)
-        rounded_rectangle_path = "./app/static/rounded_rectangle.png"
-        profile_pic_path = "./app/static/profpic.png"
-
-        # Create the background box from the existing rounded rectangle image
-        bg_image_clip = ImageClip(rounded_rectangle_path).set_duration(3).set_position(('center', 'center'))
-
-        # Profile picture positioning
-        profpic_height = 140
-        padding = 20
-        profpic = ImageClip(profile_pic_path).resize(height=profpic_height)
-        profpic_x = (width - bg_image_clip.w) // 2 + padding  # Centered within the box with padding
-        profpic_y = (height - bg_image_clip.h) // 2 + (bg_image_clip.h - profpic_height) // 2  # Centered vertically in the box
-        profpic = profpic.set_position((profpic_x, profpic_y))
-
-        if profpic is None:
-            raise ValueError("Profpic creation failed.")
-        
-        # Username positioning
-        username_clip = TextClip(
-            f"@{username}", fontsize=24, color='black', font='Arial-Bold'
-        )
-        username_x = profpic_x + profpic.w + padding  # To the right of the profile picture
-        username_y = profpic_y  # Slightly below the top of the box
-        username_clip = username_clip.set_position((username_x, username_y)).set_duration(3)
-
-        # Calculate available width for the title
-        available_width = bg_image_clip.w - profpic.w - 3 * padding
-
-        # Adjust the title text size to fit within the box
-        max_fontsize = 28
-        title_clip = TextClip(
-            text,
-            fontsize=max_fontsize,
-            color='black',
-            font='Arial-Bold',
-            method='caption',
-            size=(available_width, None)
-        )
-        # Position the title text under the username
-        title_y = username_y + username_clip.h + padding // 2  # Slightly below the username
-        title_clip = title_clip.set_position((username_x, title_y)).set_duration(3)
-
-        # Combine profile picture, background box, username, and title into one overlay
-        overlay = CompositeVideoClip([bg_image_clip, profpic, username_clip, title_clip], size=(width, height)).set_duration(3)
-        return overlay
+        frame = render_title_overlay(text, username, profile_pic_path)
+        overlay_height, overlay_width = frame.shape[:2]
+        position = ((width - overlay_width) // 2, (height - overlay_height) // 2)
+        return ImageClip(frame, transparent=True).set_position(position).set_duration(3)
     except Exception as e:
         print(f"Error creating social media overlay: {e}")
         return None
 
-def overlay_text_on_video(video, title_audio_path, story_audio_path, title, story_text, subtitles, username, profile_pic_path):
-    global last_subtitle_end_time
+def overlay_text_on_video(video, title_audio_path, story_audio_path, title, story_text, subtitles, username, profile_pic_path, backend=None, segments=None, context=None,
+                          title_duration=None, story_duration=None, draft=False, draft_seconds=None):
+    """
+    Renders the final video: the background with the title overlay while the title is read,
+    followed by the story with timed subtitles.
+
+    Args:
+        video (Background): The adjusted background from adjust_video_for_tiktok().
+        title_audio_path (str): Narration of the title.
+        story_audio_path (str): Narration of the story.
+        title (str): The title shown in the overlay.
+        story_text (str): The narrated story.
+        subtitles (List[Tuple[float, float, List[str]]]): Subtitle chunks timed to the story audio.
+        username (str): The username shown in the overlay.
+        profile_pic_path (str): Path to the profile picture.
+        backend (str): Render backend, 'moviepy' or 'ffmpeg'. Defaults to RENDER_BACKEND.
+        segments (int): Number of segments rendered in parallel. Defaults to RENDER_SEGMENTS.
+        context (RenderContext): Owns the subtitle timeline and temporary files of this render.
+            A new one is used for the call if not given.
+        title_duration (float): Duration of the title audio, if already known.
+        story_duration (float): Duration of the story audio, if already known.
+        draft (bool): Render a low-resolution, low-fps preview instead of the final video.
+        draft_seconds (float): Limit a draft to its first draft_seconds seconds.
+
+    Returns:
+        str: Path of the rendered video, or None on failure.
+    """
+    if context is None:
+        with RenderContext() as context:
+            return overlay_text_on_video(video, title_audio_path, story_audio_path, title, story_text, subtitles,
+                                         username, profile_pic_path, backend, segments, context,
+                                         title_duration, story_duration, draft, draft_seconds)
     try:
         # socketio.emit('log_update', {'log': "Log: Overlaying text on video..."})
 
         if not title_audio_path or not story_audio_path:
             raise ValueError("Audio paths for title or story are None.")
 
-        # Load audio files
-        title_audio = mp.AudioFileClip(title_audio_path)
-        story_audio = mp.AudioFileClip(story_audio_path)
-
-        # Create the title overlay with the social media overlay during the title audio
-        title_overlay = create_social_media_overlay(title, username, profile_pic_path)  # Add username and profile picture path here
-        if title_overlay is None:
-            raise ValueError("Title overlay creation failed.")
-
-        # Create a video with the social media overlay for the duration of the title audio
-        title_video = mp.CompositeVideoClip([video.set_duration(title_audio.duration), title_overlay.set_duration(title_audio.duration)])
-        title_video = title_video.set_audio(title_audio)
-        if title_video is None:
-            raise ValueError("Title video creation failed.")
-
-        # Immediate transition to the story video with subtitles
-        subtitle_start_time = 0  # Start subtitles immediately with story audio
-
-        # Create subtitle clips timed to the story audio
-        txt_clips = []
-        for start, end, words_chunk in subtitles:
-            chunk_text = ' '.join(words_chunk)
-
-            # Ensure that the new subtitle starts only after the previous one has ended
-            if last_subtitle_end_time > start:
-                start = last_subtitle_end_time
-            end = start + (end - start)
-
-            # Shorten the end time slightly to avoid overlap
-            end -= 0.1  # Reducing the end time by 0.1 seconds
-
-            # Update the global variable with the new end time
-            last_subtitle_end_time = end
-
-            # Create the main text clip for subtitles
-            txt_clip = mp.TextClip(
-                chunk_text,
-                fontsize=72,  # Adjusted size for readability
-                font='Arial-Bold',
-                color='white',
-                stroke_color='black',
-                stroke_width=1,
-                method='caption',
-                size=(video.w - 200, None)  # Ensure subtitles fit properly
-            ).set_position('center').set_start(start).set_duration(end - start)
-
-            # Add the subtitle text clip to the list of clips
-            txt_clips.append(txt_clip)
-
-        # Combine subtitle clips with the story audio
-        story_video = mp.CompositeVideoClip([video.set_duration(story_audio.duration)] + txt_clips).set_audio(story_audio)
-
-        # Concatenate the title video and the story video
-        final_video = mp.concatenate_videoclips([title_video, story_video.set_start(title_audio.duration)], method="compose")
+        # Read the audio durations unless an earlier stage already did
+        if title_duration is None:
+            title_duration = audio_assets.load(title_audio_path).duration
+        if story_duration is None:
+            story_duration = audio_assets.load(story_audio_path).duration
+
+        with span('overlay_build'):
+            # Create the title overlay with the social media overlay during the title audio
+            title_overlay = render_title_overlay(title, username, profile_pic_path)
+            overlay_height, overlay_width = title_overlay.shape[:2]
+            overlay_position = ((video.w - overlay_width) // 2, (video.h - overlay_height) // 2)
+            layers = [(0, title_duration, title_overlay, overlay_position)]
+
+            # Create subtitle images timed to the story audio, which starts after the title
+            for start, end, words_chunk in subtitles:
+                chunk_text = ' '.join(words_chunk)
+
+                # Start after the previous subtitle has ended, and end slightly early to avoid overlap
+                start, end = context.schedule_subtitle(start, end, chunk_text)
+
+                # Rasterize the subtitle in-process
+                frame = render_caption(
+                    chunk_text,
+                    fontsize=72,  # Adjusted size for readability
+                    color='white',
+                    stroke_color='black',
+                    stroke_width=1,
+                    width=video.w - 200  # Ensure subtitles fit properly
+                )
+                layers.append((title_duration + start, title_duration + end, frame, 'center'))
+
+        audio = [(title_audio_path, 0, title_duration), (story_audio_path, title_duration, story_duration)]
+        timeline = Timeline(video, title_duration + story_duration, layers, audio)
+        if draft:
+            timeline = draft_timeline(timeline, draft_seconds)
 
         # Export the final video
-        output_file = f"./generated_files/tiktok_video_{uuid.uuid4()}.mp4"
-        final_video.write_videofile(output_file, codec='libx264', audio_codec='aac')
+        output_file = artifact_store.path(f"tiktok_{'draft' if draft else 'video'}_{uuid.uuid4()}.mp4")
+        render(timeline, output_file, backend=backend, segments=segments, context=context)
 
-        socketio.emit('log_update', {'log': f"Log: Video generated successfully. Final video path: {output_file}"})
+        emit_progress('log_update', {'log': f"Log: Video generated successfully. Final video path: {output_file}"})
         return output_file
 
     except Exception as e:
-        socketio.emit('log_update', {'log': f"Error overlaying text on video: {e}"})
-        print(f"Error creating social media overlay2: {e}")
+        emit_progress('log_update', {'log': f"Error overlaying text on video: {e}"})
+        logging.error(f"Error creating social media overlay2: {e}")
         return None
 
 
-def generate_subtitles(audio_path):
+def generate_subtitles(audio_path, script=None):
     """
-    Generates subtitles for the given audio file using the Whisper model.
+    Generates subtitles for the given audio file.
+
+    When the narrated script is known and SUBTITLE_ENGINE is 'align', the script is aligned to
+    the audio directly; otherwise (the default) the audio is transcribed with the Whisper model.
     
     Args:
         audio_path (str): Path to the audio file.
+        script (str): The exact text that was sent to text-to-speech, if known.
     
     Returns:
         List[Tuple[float, float, str]]: List of tuples containing start time, end time, and subtitle text.
     """
     try:
-        socketio.emit('log_update', {'log': "Log: Transcribing audio to generate subtitles..."})
+        # Both engines take the narration's shared decoded samples, resampled to 16 kHz
+        samples = audio_assets.load(audio_path).for_whisper()
+
+        if script and SUBTITLE_ENGINE == 'align':
+            emit_progress('log_update', {'log': "Log: Aligning story text to audio to generate subtitles..."})
+            with span('alignment'):
+                subtitles = align_subtitles(samples, script)
+            if subtitles:
+                emit_progress('log_update', {'log': "Log: Subtitles generated successfully."})
+                return subtitles
+            emit_progress('log_update', {'log': "Log: Alignment found no speech, falling back to transcription..."})
 
-        # Load the Whisper model
-        model = whisper.load_model("base")
+        emit_progress('log_update', {'log': "Log: Transcribing audio to generate subtitles..."})
 
-        # Transcribe the audio
-        result = model.transcribe(audio_path)
+        # Transcribe the audio with the worker's shared Whisper model
+        result = transcribe(samples)
 
         # Extract segments to create subtitles with short word groups (up to 3 words at a time)
         subtitles = []
@@ -231,8 +222,8 @@ def generate_subtitles(audio_path):
                 end = segment['start'] + ((i + 3) / len(words)) * (segment['end'] - segment['start'])
                 subtitles.append((start, end, words[i:i + 3]))
 
-        socketio.emit('log_update', {'log': "Log: Subtitles generated successfully."})
+        emit_progress('log_update', {'log': "Log: Subtitles generated successfully."})
         return subtitles
     except Exception as e:
-        socketio.emit('log_update', {'log': f"Error generating subtitles: {e}"})
+        emit_progress('log_update', {'log': f"Error generating subtitles: {e}"})
         return []
\ No newline at end of file
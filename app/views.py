@@ -1,18 +1,30 @@
-from flask import Blueprint, render_template, jsonify, request, send_from_directory
+from flask import Blueprint, render_template, jsonify, request, url_for, abort
 from flask_login import login_required, logout_user, current_user
 from app.reddit_scraper import scrape_reddit_story
-from app.text_to_speech import text_to_speech
-from app.video_processing import adjust_video_for_tiktok, overlay_text_on_video, generate_subtitles
 from app.story_rewriter import rework_story_with_product
+from app.gameplay_proxies import GAMEPLAY_FILES
+from app.jobs import job_queue, QueueFullError, DONE
+from app.socketio_instance import socketio
+from app.metrics import render_prometheus
+from app import story_corpus
+from app.story_history import story_recorder, user_stories
+from app.artifact_store import artifact_store
+from app.artifact_serving import artifact_response
+from flask_socketio import emit
 import uuid
-from .models import Story
 import os
-import moviepy.editor as mp
-from . import db
-from app.socketio_instance import socketio
+import math
+import itertools
+import sqlite3
 
 views = Blueprint('views', __name__)
 
+# Upper bound on the variants of one batch, which all render inside a single job
+MAX_BATCH_VARIANTS = int(os.getenv('MAX_BATCH_VARIANTS', 12))
+
+# Shortest draft that can be asked for; anything shorter has next to nothing to preview
+MIN_DRAFT_SECONDS = 1.0
+
 
 @views.route('/views', methods=['GET', 'POST'])
 @login_required
@@ -21,16 +33,49 @@ def index():
 
 @views.route('/generated_files/<path:filename>')
 def serve_generated_file(filename):
-    return send_from_directory('../generated_files', filename, mimetype='video/mp4')
+    """Serves a generated file, with support for conditional and Range requests so players can seek."""
+    artifact = artifact_store.get(filename)
+    if artifact is None:
+        abort(404)
+    artifact_store.touch(artifact)
+    return artifact_response(artifact)
 
 @views.route('/get_story', methods=['GET'])
 def get_story():
     subreddit_name = request.args.get('subreddit', 'news')
-    title, story_text = scrape_reddit_story(subreddit_name)
+    # Signed-in users are remembered by account, everyone else by address
+    user = current_user.get_id() if current_user.is_authenticated else request.remote_addr
+    title, story_text = scrape_reddit_story(subreddit_name, user)
     if not title or not story_text:
         return jsonify({'error': f"No text-based stories found in /r/{subreddit_name}"}), 500
     return jsonify({'title': title, 'story_text': story_text})
 
+@views.route('/search_stories', methods=['GET'])
+def search_stories():
+    """
+    Searches the story corpus. Query parameters: q (keywords), subreddit, duration (target
+    narration length in seconds), limit and offset.
+    """
+    try:
+        duration = request.args.get('duration', type=float)
+        stories = story_corpus.search(
+            keywords=request.args.get('q', '').strip() or None,
+            subreddit=request.args.get('subreddit') or None,
+            target_seconds=duration if duration and duration > 0 else None,
+            limit=request.args.get('limit', 20, type=int),
+            offset=request.args.get('offset', 0, type=int),
+        )
+    except sqlite3.Error as e:
+        return jsonify({'error': f"Story search failed: {e}"}), 500
+    return jsonify({'stories': [{
+        'id': story['id'],
+        'subreddit': story['subreddit'],
+        'title': story['title'],
+        'story_text': story['body'],
+        'word_count': story['word_count'],
+        'narration_seconds': story['narration_seconds'],
+    } for story in stories]})
+
 @views.route('/modify_story', methods=['POST'])
 def modify_story():
     data = request.get_json()
@@ -43,80 +88,156 @@ def modify_story():
     modified_story = rework_story_with_product(story, product)
     return jsonify({'modified_story': modified_story})
 
-@views.route('/generate', methods=['POST'])
-def generate():
-    """Handles the generation of story, title, text-to-speech, video adjustment, and overlay processes."""
-    gameplay = request.form['gameplay']
-    voice = request.form['voice']
-    title = request.form['title']
-    story_text = request.form['story_text']
-    product = request.form['product']  # Get the product info from the form
-    username = request.form['username']  # Get the username from the form
-    profile_pic = request.files['profilePicture']  # Get profile picture
+@socketio.on('modify_story')
+def modify_story_streaming(data):
+    """Streams the reworked story to the requesting client token by token as it is generated."""
+    story = (data or {}).get('story')
+    product = (data or {}).get('product')
 
-    try:
-        # Save profile picture to a specific path
-        profile_pic_path = f"./generated_files/profile_{uuid.uuid4()}.png"
-        profile_pic.save(profile_pic_path)
-
-        # Call the OpenAI API to rework the story with the product
-        reworked_story = rework_story_with_product(story_text, product)
-
-        new_story = Story(data = story_text, title = title, gptdata = reworked_story, 
-                          user_id = current_user.id)
-        
-        db.session.add(new_story)
-
-        # socketio.emit('log_update', {'log': "Log: Generating text-to-speech for title..."})
-        title_audio_path = text_to_speech(title, voice=voice)
-
-        # socketio.emit('log_update', {'log': "Log: Generating text-to-speech for story..."})
-        story_audio_path = text_to_speech(reworked_story, voice=voice)
-
-        if not title_audio_path or not story_audio_path:
-            raise ValueError("Error: Audio paths for title or story are None.")
-        socketio.emit('log_update', {'log': f"Log: Audio paths verified. Title audio path: {title_audio_path}, Story audio path: {story_audio_path}"})
-
-        if gameplay == 'subway-surfers':
-            video_file = "source_files/subway-surfers.mp4"
-        elif gameplay == 'gta':
-            video_file = "source_files/gta-video.mp4"
-        elif gameplay == 'minecraft':  # Added Minecraft option
-            video_file = "source_files/minecraft.mp4"
-        else:
-            raise ValueError("Invalid gameplay type selected.")
+    if not story or not product:
+        emit('story_error', {'error': 'Story and product are required'})
+        return
 
-        if not video_file:
-            raise ValueError("Error: Video file path is None.")
-        socketio.emit('log_update', {'log': f"Log: Video file selected: {video_file}"})
+    modified_story = rework_story_with_product(story, product, on_token=lambda token: emit('story_token', {'token': token}))
+    emit('story_modified', {'modified_story': modified_story})
 
-        video_duration = mp.AudioFileClip(story_audio_path).duration
+def _user_job(job_id):
+    """Returns the job if the signed-in user queued it, else None."""
+    job = job_queue.get(job_id)
+    if job is None or job.owner != current_user.get_id():
+        return None
+    return job
 
-        socketio.emit('log_update', {'log': "Log: Adjusting video for TikTok..."})
-        adjusted_video = adjust_video_for_tiktok(video_file, video_duration)
+@views.route('/generate', methods=['POST'])
+@login_required
+def generate():
+    """Queues a generation job for the story, title, text-to-speech, video adjustment, and overlay processes."""
+    params = {
+        'gameplay': request.form['gameplay'],
+        'voice': request.form['voice'],
+        'title': request.form['title'],
+        'story_text': request.form['story_text'],
+        'product': request.form['product'],  # Get the product info from the form
+        'username': request.form['username'],  # Get the username from the form
+        # A draft is a quick low-resolution preview that can be promoted to the final video later
+        'draft': request.form.get('draft') in ('1', 'true', 'on'),
+    }
+    profile_pic = request.files['profilePicture']  # Get profile picture
 
-        if not adjusted_video:
-            raise ValueError("Error: Video adjustment failed.")
+    if params['gameplay'] not in GAMEPLAY_FILES:
+        return jsonify({'error': "Invalid gameplay type selected."}), 400
 
-        socketio.emit('log_update', {'log': "Log: Generating subtitles using Whisper..."})
-        subtitles = generate_subtitles(story_audio_path)
+    try:
+        draft_seconds = request.form.get('draft_seconds')
+        params['draft_seconds'] = float(draft_seconds) if draft_seconds else None
+    except ValueError:
+        return jsonify({'error': "draft_seconds must be a number."}), 400
+    if params['draft_seconds'] is not None and not (math.isfinite(params['draft_seconds'])
+                                                    and params['draft_seconds'] >= MIN_DRAFT_SECONDS):
+        return jsonify({'error': f"draft_seconds must be at least {MIN_DRAFT_SECONDS:g} second."}), 400
 
-        if not subtitles:
-            raise ValueError("Error: subtitle creation failed.")
+    # The pipeline pulls in the video stack, so it is imported on the first generation rather than at startup
+    from app.pipeline import generate_video
 
-        socketio.emit('log_update', {'log': "Log: Starting overlay of text on video..."})
-        tiktok_video = overlay_text_on_video(adjusted_video, title_audio_path, story_audio_path, title, reworked_story, subtitles, username, profile_pic_path)
+    try:
+        # Save profile picture to a specific path so the worker can read it
+        params['profile_pic_path'] = artifact_store.path(f"profile_{uuid.uuid4()}.png")
+        profile_pic.save(params['profile_pic_path'])
+
+        job = job_queue.submit(generate_video, params, owner=current_user.get_id(),
+                               on_done=story_recorder(current_user.get_id(), params))
+    except QueueFullError as e:
+        os.remove(params['profile_pic_path'])
+        return jsonify({'error': str(e)}), 429, {'Retry-After': '30'}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        if not tiktok_video:
-            raise ValueError("Error: Video overlay failed.")
+    return jsonify({'job_id': job.id, 'status_url': url_for('views.job_status', job_id=job.id)}), 202
 
-        video_url = f"app/generated_files/{os.path.basename(tiktok_video)}"
-        socketio.emit('video_generated', {'video_url': video_url})
+@views.route('/generate_batch', methods=['POST'])
+@login_required
+def generate_batch_view():
+    """
+    Queues one job that renders a story for every combination of the given products,
+    gameplay backgrounds and voices (each field may be repeated), sharing the work the
+    variants have in common.
+    """
+    products = request.form.getlist('product')
+    gameplays = request.form.getlist('gameplay')
+    voices = request.form.getlist('voice')
+    variants = [{'product': product, 'gameplay': gameplay, 'voice': voice}
+                for product, gameplay, voice in itertools.product(products, gameplays, voices)]
+
+    if not variants:
+        return jsonify({'error': "At least one product, gameplay and voice are required."}), 400
+    if len(variants) > MAX_BATCH_VARIANTS:
+        return jsonify({'error': f"At most {MAX_BATCH_VARIANTS} variants per batch."}), 400
+    if any(gameplay not in GAMEPLAY_FILES for gameplay in gameplays):
+        return jsonify({'error': "Invalid gameplay type selected."}), 400
+
+    params = {
+        'title': request.form['title'],
+        'story_text': request.form['story_text'],
+        'username': request.form['username'],
+        'variants': variants,
+    }
+    profile_pic = request.files['profilePicture']
+    from app.pipeline import generate_batch
 
-        socketio.emit('process_complete', {'video_url': video_url})
-        return jsonify({'full_story': reworked_story, 'title': title, 'story_audio_path': story_audio_path, 'title_audio_path': title_audio_path, 'video_url': video_url})
+    try:
+        params['profile_pic_path'] = artifact_store.path(f"profile_{uuid.uuid4()}.png")
+        profile_pic.save(params['profile_pic_path'])
+
+        job = job_queue.submit(generate_batch, params, owner=current_user.get_id(),
+                               on_done=story_recorder(current_user.get_id(), params))
+    except QueueFullError as e:
+        os.remove(params['profile_pic_path'])
+        return jsonify({'error': str(e)}), 429, {'Retry-After': '30'}
     except Exception as e:
-        socketio.emit('log_update', {'log': f"Error during generation: {e}"})
         return jsonify({'error': str(e)}), 500
 
+    return jsonify({'job_id': job.id, 'status_url': url_for('views.job_status', job_id=job.id),
+                    'variants': variants}), 202
+
+@views.route('/jobs/<job_id>/promote', methods=['POST'])
+@login_required
+def promote(job_id):
+    """Queues the final render of a finished draft, reusing its narration and subtitles."""
+    job = _user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.state != DONE or not job.result.get('draft'):
+        return jsonify({'error': 'Only finished drafts can be promoted'}), 409
+
+    from app.pipeline import promote_video
+    try:
+        promoted = job_queue.submit(promote_video, job.result['artifacts'], owner=current_user.get_id(),
+                                    on_done=story_recorder(current_user.get_id(), {}, promoted_from=job.id))
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 429, {'Retry-After': '30'}
+    job.promoted_to = promoted.id
+
+    return jsonify({'job_id': promoted.id, 'status_url': url_for('views.job_status', job_id=promoted.id)}), 202
 
+@views.route('/jobs/<job_id>', methods=['GET'])
+@login_required
+def job_status(job_id):
+    """Reports the state of one of the signed-in user's jobs: queued, running, done or failed."""
+    job = _user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@views.route('/stories', methods=['GET'])
+@login_required
+def stories():
+    """Lists the signed-in user's generated stories, newest first. Query parameters: page and per_page."""
+    page = user_stories(current_user.id, page=request.args.get('page', 1, type=int),
+                        per_page=request.args.get('per_page', 20, type=int))
+    return jsonify({'stories': [story.to_dict() for story in page.items],
+                    'page': page.page, 'per_page': page.per_page, 'total': page.total, 'pages': page.pages})
+
+@views.route('/metrics', methods=['GET'])
+def metrics():
+    """Exposes pipeline timings, cache and error counters and job queue gauges for Prometheus."""
+    return render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
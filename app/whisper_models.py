@@ -0,0 +1,179 @@
+import os
+import time
+import logging
+import resource
+import threading
+import numpy as np
+from app import metrics
+from app.metrics import span
+from app.audio_assets import WHISPER_SAMPLE_RATE
+
+# Deployment configuration: which model sizes this worker serves, and how many
+# CPU threads torch may use for inference.
+WHISPER_MODEL = os.getenv('WHISPER_MODEL', 'base')
+WHISPER_MODELS = [size.strip() for size in os.getenv('WHISPER_MODELS', WHISPER_MODEL).split(',') if size.strip()]
+WHISPER_THREADS = int(os.getenv('WHISPER_THREADS', 0))  # 0 keeps torch's default
+WHISPER_DEVICE = os.getenv('WHISPER_DEVICE') or None
+
+_models = {}
+_stats = {}
+_worker_stats = {}  # pid -> model_stats() last reported by a worker process
+_registry_lock = threading.Lock()
+_warm_up_lock = threading.Lock()
+_threads_configured = False
+
+
+class _LoadedModel:
+    def __init__(self, model):
+        self.model = model
+        # Whisper's decoder keeps per-call state on the model, so transcriptions
+        # on the same instance are serialized rather than run concurrently.
+        self.lock = threading.Lock()
+
+
+def _current_rss():
+    """Returns the resident set size of this process in bytes."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # ru_maxrss is the peak rather than the current RSS, reported in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _configure_threads():
+    global _threads_configured
+    if not _threads_configured and WHISPER_THREADS > 0:
+        import torch
+        torch.set_num_threads(WHISPER_THREADS)
+    _threads_configured = True
+
+
+def import_whisper():
+    """
+    Imports Whisper (and with it torch), which takes seconds, so it is only done when a
+    model is first needed or when a worker preloads it.
+    """
+    with span('import_whisper'):
+        import whisper
+    return whisper
+
+
+def _get_entry(size):
+    size = size or WHISPER_MODEL
+    entry = _models.get(size)
+    if entry is not None:
+        return entry
+
+    with _registry_lock:
+        entry = _models.get(size)
+        if entry is None:
+            whisper = import_whisper()
+            _configure_threads()
+            rss_before = _current_rss()
+            start = time.perf_counter()
+            with span('model_load'):
+                model = whisper.load_model(size, device=WHISPER_DEVICE)
+            load_seconds = time.perf_counter() - start
+            entry = _LoadedModel(model)
+            _models[size] = entry
+            _stats[size] = {
+                'load_seconds': load_seconds,
+                'rss_delta_bytes': _current_rss() - rss_before,
+                'parameter_bytes': sum(p.numel() * p.element_size() for p in model.parameters()),
+                'transcriptions': 0,
+            }
+            logging.info(f"Loaded Whisper model '{size}' in {load_seconds:.2f}s "
+                         f"(+{_stats[size]['rss_delta_bytes'] / 2**20:.0f} MiB RSS)")
+    return entry
+
+
+def get_model(size=None):
+    """
+    Returns the process-wide Whisper model for the given size, loading it on first use.
+
+    Args:
+        size (str): Whisper model size, e.g. "base". Defaults to WHISPER_MODEL.
+
+    Returns:
+        whisper.Whisper: The shared model instance.
+    """
+    return _get_entry(size).model
+
+
+def transcribe(audio, size=None, **kwargs):
+    """
+    Transcribes audio with the shared model, serializing calls on the same model.
+
+    Args:
+        audio (str | np.ndarray): Path to an audio file, or 16 kHz mono float32 samples.
+        size (str): Whisper model size. Defaults to WHISPER_MODEL.
+        **kwargs: Extra options passed to model.transcribe().
+
+    Returns:
+        dict: Whisper's transcription result.
+    """
+    size = size or WHISPER_MODEL
+    entry = _get_entry(size)
+    with entry.lock, span('transcription'):
+        result = entry.model.transcribe(audio, **kwargs)
+        _stats[size]['transcriptions'] += 1
+    return result
+
+
+def warm_up(sizes=None):
+    """
+    Loads the configured models and runs each one over a second of silence, so the
+    first real request doesn't pay for model load or first-inference setup.
+
+    Args:
+        sizes (list): Model sizes to warm up. Defaults to WHISPER_MODELS.
+    """
+    dummy_clip = np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32)
+    with _warm_up_lock:
+        for size in sizes or WHISPER_MODELS:
+            if 'warm_up_seconds' in _stats.get(size, {}):
+                continue
+            start = time.perf_counter()
+            transcribe(dummy_clip, size=size, fp16=False)
+            _stats[size]['warm_up_seconds'] = time.perf_counter() - start
+
+
+def model_stats():
+    """
+    Reports load time and memory use of the models loaded in this process, for sizing workers.
+
+    Returns:
+        dict: The process's 'pid' and 'rss_bytes', and per-model 'models' statistics.
+    """
+    return {'pid': os.getpid(), 'rss_bytes': _current_rss(),
+            'models': {size: dict(stats) for size, stats in _stats.items()}}
+
+
+def record_worker_stats(stats):
+    """Keeps the model_stats() a worker process reported, so /metrics can export them."""
+    if stats and stats['pid'] != os.getpid():
+        _worker_stats[stats['pid']] = stats
+
+
+def _workers():
+    # Worker processes as last reported, plus this process once it has loaded models itself
+    workers = list(_worker_stats.values())
+    if _stats:
+        workers.append(model_stats())
+    return workers
+
+
+def _model_gauge(field):
+    return lambda: [({'worker': worker['pid'], 'model': size}, stats[field])
+                    for worker in _workers() for size, stats in worker['models'].items() if field in stats]
+
+
+metrics.gauge('whisper_model_load_seconds', 'Time each worker took to load each Whisper model.',
+              _model_gauge('load_seconds'))
+metrics.gauge('whisper_model_warm_up_seconds', 'Time each worker took for its first transcription with each model.',
+              _model_gauge('warm_up_seconds'))
+metrics.gauge('whisper_model_rss_bytes', 'Resident memory each worker gained by loading each Whisper model.',
+              _model_gauge('rss_delta_bytes'))
+metrics.gauge('worker_rss_bytes', 'Resident memory of each job worker, as it last reported it.',
+              lambda: [({'worker': worker['pid']}, worker['rss_bytes']) for worker in _workers()])
@@ -0,0 +1,149 @@
+"""
+Measures how fast finished videos are served when many clients fetch them at once: full
+downloads, seeks (an open-ended Range request whose first chunk is read before the player
+moves on) and revalidations (If-None-Match). Every body is checked against the file.
+
+Runs the app on Werkzeug's threaded server, which has no wsgi.file_wrapper, so this measures
+the Python path; under a server that implements it (e.g. gunicorn) full and open-ended
+responses are sent with sendfile(). --legacy also runs the same load against a plain
+send_from_directory() route for comparison.
+
+Usage:
+    python -m benchmarks.bench_artifact_serving [--clients 16] [--requests 40] [--videos 4]
+        [--video-mb 20] [--legacy]
+"""
+import argparse
+import http.client
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+work = tempfile.mkdtemp(prefix='bench_artifact_serving_')
+os.environ.update({
+    'ARTIFACT_DIR': os.path.join(work, 'generated_files'),
+    'ARTIFACT_SWEEP_INTERVAL': '0',
+    'DATABASE_URL': f"sqlite:///{os.path.join(work, 'database.db')}",
+    'STORY_REFRESHER': '0',
+    'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY', 'offline'),
+    'REDDIT_CLIENT_ID': os.getenv('REDDIT_CLIENT_ID', 'offline'),
+    'REDDIT_CLIENT_SECRET': os.getenv('REDDIT_CLIENT_SECRET', 'offline'),
+})
+
+from flask import send_from_directory
+from werkzeug.serving import make_server
+from app import create_app
+from app.artifact_store import artifact_store
+
+SEEK_READ_BYTES = 512 * 1024
+MIX = ('full', 'seek', 'seek', 'seek', 'revalidate')
+
+
+def run_load(port, prefix, videos, clients, requests, seed=0):
+    """Runs requests per client from clients threads; returns per-request (kind, seconds, bytes) and errors."""
+    results, errors = [], []
+    lock = threading.Lock()
+
+    def client(n):
+        rng = random.Random(seed * 1000 + n)
+        etags = {}
+        for _ in range(requests):
+            name, data = rng.choice(videos)
+            kind = rng.choice(MIX)
+            headers = {}
+            start_byte = 0
+            if kind == 'seek':
+                start_byte = rng.randrange(len(data))
+                headers['Range'] = f"bytes={start_byte}-"
+            elif kind == 'revalidate' and name in etags:
+                headers['If-None-Match'] = etags[name]
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            start = time.perf_counter()
+            try:
+                connection.request('GET', f"{prefix}/{name}", headers=headers)
+                response = connection.getresponse()
+                body = response.read(SEEK_READ_BYTES) if kind == 'seek' else response.read()
+                elapsed = time.perf_counter() - start
+                etags[name] = response.getheader('ETag')
+                if kind == 'seek':
+                    ok = response.status == 206 and body == data[start_byte:start_byte + SEEK_READ_BYTES]
+                elif response.status == 304:
+                    ok = kind == 'revalidate'
+                else:
+                    ok = response.status == 200 and body == data
+                if not ok:
+                    raise ValueError(f"{kind} of {name} returned {response.status} with {len(body)} bytes")
+                with lock:
+                    results.append((kind, elapsed, len(body)))
+            except Exception as e:
+                with lock:
+                    errors.append(f"{prefix}/{name}: {e}")
+            finally:
+                connection.close()
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors, time.perf_counter() - start
+
+
+def report(label, results, errors, elapsed):
+    total_bytes = sum(size for _, _, size in results)
+    print(f"\n{label}: {len(results)} requests in {elapsed:.2f}s, {len(results) / elapsed:,.1f} req/s, "
+          f"{total_bytes / elapsed / 2**20:,.1f} MiB/s, {len(errors)} errors")
+    for kind in sorted(set(MIX)):
+        times = sorted(seconds for k, seconds, _ in results if k == kind)
+        if times:
+            print(f"  {kind:<11} n={len(times):<5} p50 {times[len(times) // 2] * 1e3:8.1f} ms   "
+                  f"p95 {times[int(len(times) * 0.95)] * 1e3:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=40, help="Requests per client")
+    parser.add_argument('--videos', type=int, default=4)
+    parser.add_argument('--video-mb', type=float, default=20)
+    parser.add_argument('--legacy', action='store_true')
+    args = parser.parse_args()
+
+    videos = []
+    for n in range(args.videos):
+        name = f"tiktok_video_bench{n}.mp4"
+        data = os.urandom(int(args.video_mb * 2**20))
+        with open(artifact_store.path(name), 'wb') as f:
+            f.write(data)
+        videos.append((name, data))
+
+    app = create_app()
+    app.add_url_rule('/legacy/<path:filename>', 'legacy', lambda filename: send_from_directory(
+        artifact_store.directory, filename, mimetype='video/mp4'))
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"{args.clients} clients x {args.requests} requests over {args.videos} videos of {args.video_mb:g} MiB")
+
+    try:
+        runs = [('artifact store', '/generated_files')] + ([('send_from_directory', '/legacy')] if args.legacy else [])
+        failed = False
+        for label, prefix in runs:
+            results, errors, elapsed = run_load(server.port, prefix, videos, args.clients, args.requests)
+            report(label, results, errors, elapsed)
+            for error in errors[:5]:
+                print(f"  ERROR {error}")
+            failed = failed or bool(errors)
+    finally:
+        server.shutdown()
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Compares looping a gameplay clip by concatenation against the time-mapped loop used by
+adjust_video_for_tiktok(), for 1-, 5- and 10-minute narrations.
+
+For each narration length it reports clip setup time, Python memory allocated during
+setup, and the time to read one frame per second of output.
+
+Usage:
+    python -m benchmarks.bench_background_loop [gameplay.mp4] [--durations 60 300 600]
+"""
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import moviepy.editor as mp
+from imageio_ffmpeg import get_ffmpeg_exe
+from app.render import loop_clip
+
+
+def make_test_clip(path, seconds=20):
+    subprocess.run([get_ffmpeg_exe(), '-y', '-loglevel', 'error', '-f', 'lavfi',
+                    '-i', 'testsrc=size=540x960:rate=30', '-t', str(seconds), '-pix_fmt', 'yuv420p', path],
+                   check=True)
+
+
+def concatenated(video, duration):
+    repeat_count = int(duration / video.duration) + 1
+    return mp.concatenate_videoclips([video] * repeat_count).subclip(0, duration)
+
+
+def time_mapped(video, duration):
+    return loop_clip(video, duration, start_offset=video.duration / 2)
+
+
+def measure(build, video_path, duration):
+    video = mp.VideoFileClip(video_path, audio=False)
+    tracemalloc.start()
+    start = time.perf_counter()
+    clip = build(video, duration)
+    setup_seconds = time.perf_counter() - start
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for t in range(int(duration)):
+        clip.get_frame(t)
+    read_seconds = time.perf_counter() - start
+    video.close()
+    return setup_seconds, peak_bytes, read_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('video', nargs='?')
+    parser.add_argument('--durations', type=float, nargs='+', default=[60, 300, 600])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        video_path = args.video
+        if not video_path:
+            video_path = os.path.join(tmp, 'gameplay.mp4')
+            make_test_clip(video_path)
+
+        print(f"{'narration':>10} {'method':>12} {'setup':>10} {'setup mem':>12} {'1 fps read':>12}")
+        for duration in args.durations:
+            for name, build in (('concatenate', concatenated), ('time-mapped', time_mapped)):
+                setup_seconds, peak_bytes, read_seconds = measure(build, video_path, duration)
+                print(f"{duration / 60:>9.0f}m {name:>12} {setup_seconds * 1000:>8.2f}ms "
+                      f"{peak_bytes / 1024:>10.1f}KB {read_seconds:>11.2f}s")
+
+
+if __name__ == '__main__':
+    main()
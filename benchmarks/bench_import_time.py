@@ -0,0 +1,116 @@
+"""
+Reports what cold start costs: for each entry point, the time to import it (and, where
+noted, run it) in a fresh interpreter, and the import time of each package it pulls in,
+from `python -X importtime`.
+
+Also checks that the web entry points don't import the heavy dependencies the pipeline
+loads lazily (torch, whisper, openai, praw, moviepy). With --baseline, exits with an error
+if an entry point got slower by more than --tolerance.
+
+Usage:
+    python -m benchmarks.bench_import_time [--runs 3] [--top 12]
+        [--baseline benchmarks/import_baseline.json] [--save-baseline benchmarks/import_baseline.json]
+        [--tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+# Entry point -> (statement to time, packages it must not import)
+HEAVY = ('torch', 'whisper', 'openai', 'praw', 'moviepy')
+TARGETS = {
+    'create_app': ("from app import create_app; create_app()", HEAVY),
+    'first_request': ("from app import create_app; create_app().test_client().get('/login')", HEAVY),
+    'app.views': ("import app.views", HEAVY),
+    'app.pipeline': ("import app.pipeline", ('torch', 'whisper', 'openai', 'praw')),
+    'worker_preload': ("from app.pipeline import preload; preload()", ()),
+}
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def run_target(statement, env):
+    """Runs statement in a fresh interpreter; returns its wall time and {module: self seconds}."""
+    code = f"import time; _start = time.perf_counter(); {statement}; print(time.perf_counter() - _start)"
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], env=env,
+                            capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            modules[match.group(4)] = int(match.group(1)) / 1e6
+    return float(result.stdout.strip().splitlines()[-1]), modules
+
+
+def by_package(modules):
+    packages = defaultdict(float)
+    for name, seconds in modules.items():
+        packages[name.split('.')[0]] += seconds
+    return dict(packages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=3, help="Fresh interpreters per entry point; the fastest counts")
+    parser.add_argument('--top', type=int, default=12, help="Packages listed per entry point")
+    parser.add_argument('--baseline')
+    parser.add_argument('--save-baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='bench_import_time_')
+    env = dict(os.environ, STORY_REFRESHER='0', PRELOAD_WORKERS='0', ARTIFACT_SWEEP_INTERVAL='0',
+               DATABASE_URL=f"sqlite:///{os.path.join(work, 'database.db')}",
+               STORY_CORPUS_PATH=os.path.join(work, 'story_corpus.db'),
+               OPENAI_API_KEY=os.getenv('OPENAI_API_KEY', 'offline'),
+               REDDIT_CLIENT_ID=os.getenv('REDDIT_CLIENT_ID', 'offline'),
+               REDDIT_CLIENT_SECRET=os.getenv('REDDIT_CLIENT_SECRET', 'offline'))
+
+    results = {}
+    problems = []
+    for name, (statement, forbidden) in TARGETS.items():
+        runs = [run_target(statement, env) for _ in range(args.runs)]
+        seconds, modules = min(runs, key=lambda run: run[0])
+        packages = by_package(modules)
+        results[name] = {'seconds': round(seconds, 4)}
+
+        print(f"\n{name}: {seconds:.3f}s  ({len(modules)} modules)")
+        for package, cost in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"  {package:<28} {cost * 1e3:8.1f} ms")
+        imported = sorted(package for package in forbidden if package in packages)
+        if imported:
+            problems.append(f"{name} imports {', '.join(imported)}")
+
+    if args.save_baseline:
+        # Only what --baseline compares; per-package costs are printed above and vary by machine
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nSaved baseline to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\n{'entry point':<20} {'now':>8} {'baseline':>9} {'change':>8}")
+        for name, current in results.items():
+            previous = baseline.get(name)
+            if not previous:
+                continue
+            change = current['seconds'] / max(previous['seconds'], 1e-6) - 1
+            print(f"{name:<20} {current['seconds']:7.3f}s {previous['seconds']:8.3f}s {change:+8.1%}")
+            # Small absolute changes are interpreter noise
+            if change > args.tolerance and current['seconds'] - previous['seconds'] > 0.05:
+                problems.append(f"{name}: {change:+.1%} slower")
+
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
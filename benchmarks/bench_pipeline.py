@@ -0,0 +1,225 @@
+"""
+Benchmarks every pipeline stage and the end-to-end /generate flow offline, against synthetic
+fixtures and local stand-ins for Reddit, OpenAI and the speech API (see benchmarks.fixtures).
+
+Reports wall time, peak RSS of this process and output size per stage. With --baseline, each
+stage is compared against a saved run and the script exits with an error if wall time or
+peak RSS regressed by more than --tolerance.
+
+Usage:
+    python -m benchmarks.bench_pipeline [--story-words 150] [--backend ffmpeg]
+        [--baseline benchmarks/baseline.json] [--save-baseline benchmarks/baseline.json]
+        [--tolerance 0.25] [--whisper]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from benchmarks.fixtures import FakeOpenAI, FakeReddit, StubTTSServer, fake_story, make_gameplay
+
+# Stand-in latencies, roughly what the real services take for one request
+REWRITE_LATENCY = 0.5
+TTS_LATENCY = 0.3
+# A subreddit listing; scrape_cached stays near zero only while the listing cache hits
+REDDIT_LATENCY = 0.4
+
+
+def current_rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class Recorder:
+    """Runs stages, sampling this process's RSS while each one runs."""
+
+    def __init__(self):
+        self.results = {}
+
+    def run(self, name, func, output=None):
+        peak = current_rss()
+        running = True
+
+        def sample():
+            nonlocal peak
+            while running:
+                peak = max(peak, current_rss())
+                time.sleep(0.005)
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            result = func()
+        finally:
+            wall = time.perf_counter() - start
+            running = False
+            sampler.join()
+
+        path = output(result) if output else None
+        self.results[name] = {
+            'wall_seconds': round(wall, 4),
+            'peak_rss_bytes': peak,
+            'output_bytes': os.path.getsize(path) if path and os.path.exists(path) else None,
+        }
+        print(f"{name:<28} {wall:9.3f}s  peak RSS {peak / 2**20:8.1f} MiB"
+              + (f"  output {self.results[name]['output_bytes'] / 2**10:9.1f} KiB" if self.results[name]['output_bytes'] else ''))
+        return result
+
+
+def compare(results, baseline, tolerance):
+    """Prints each stage against the baseline and returns the regressions."""
+    regressions = []
+    print(f"\n{'stage':<28} {'wall':>9} {'baseline':>9} {'change':>8}   {'peak RSS change':>15}")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            print(f"{name:<28} {current['wall_seconds']:8.3f}s {'-':>9}")
+            continue
+        wall_change = current['wall_seconds'] / max(previous['wall_seconds'], 1e-6) - 1
+        rss_change = current['peak_rss_bytes'] / max(previous['peak_rss_bytes'], 1) - 1
+        print(f"{name:<28} {current['wall_seconds']:8.3f}s {previous['wall_seconds']:8.3f}s "
+              f"{wall_change:+8.1%}   {rss_change:+15.1%}")
+        # Sub-10ms stages are noise-dominated; only flag them when they grow by 10ms or more
+        if wall_change > tolerance and current['wall_seconds'] - previous['wall_seconds'] > 0.01:
+            regressions.append(f"{name}: wall time {wall_change:+.1%}")
+        if rss_change > tolerance:
+            regressions.append(f"{name}: peak RSS {rss_change:+.1%}")
+    return regressions
+
+
+def wait_for_job(job_queue, job_id, timeout=1800):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = job_queue.get(job_id)
+        if job.finished:
+            if job.error:
+                raise RuntimeError(f"Job failed: {job.error}")
+            return job.result
+        time.sleep(0.05)
+    raise TimeoutError(f"Job {job_id} did not finish in {timeout}s")
+
+
+def run_stages(args, work):
+    """Runs every stage with its caches, proxies and outputs in work; returns the Recorder."""
+    with StubTTSServer(latency=TTS_LATENCY) as tts_server:
+        # Caches and proxies start cold in a scratch directory; set before the app modules read them
+        os.environ.update({
+            'TTS_API_URL': tts_server.url,
+            'TTS_CACHE_DIR': os.path.join(work, 'tts_cache'),
+            'REWRITE_CACHE_DIR': os.path.join(work, 'rewrite_cache'),
+            'GAMEPLAY_PROXY_DIR': os.path.join(work, 'proxies'),
+            'RENDER_BACKEND': args.backend,
+            # Whisper weights may not be available offline; the baseline was recorded with alignment
+            'SUBTITLE_ENGINE': 'align',
+            'ARTIFACT_DIR': os.path.join(work, 'artifacts'),
+            'ARTIFACT_SWEEP_INTERVAL': '0',
+            'DATABASE_URL': f"sqlite:///{os.path.join(work, 'database.db')}",
+            'STORY_CORPUS_PATH': os.path.join(work, 'story_corpus.db'),
+            'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY', 'offline'),
+            'REDDIT_CLIENT_ID': os.getenv('REDDIT_CLIENT_ID', 'offline'),
+            'REDDIT_CLIENT_SECRET': os.getenv('REDDIT_CLIENT_SECRET', 'offline'),
+        })
+        from app import reddit_scraper, story_rewriter
+        from app.gameplay_proxies import GAMEPLAY_FILES
+        from app.text_to_speech import text_to_speech
+        from app.video_processing import (adjust_video_for_tiktok, create_social_media_overlay,
+                                          generate_subtitles, overlay_text_on_video)
+        from app import audio_assets
+        from app.whisper_models import transcribe
+
+        reddit_scraper.story_cache = reddit_scraper.SubredditCache(FakeReddit(words=args.story_words, latency=REDDIT_LATENCY))
+        story_rewriter.client = FakeOpenAI(latency=REWRITE_LATENCY)
+        gameplay = make_gameplay(os.path.join(work, 'gameplay.mp4'), seconds=20, size='1280x720')
+        GAMEPLAY_FILES['subway-surfers'] = gameplay
+
+        recorder = Recorder()
+        title, story = recorder.run('scrape', lambda: reddit_scraper.scrape_reddit_story('news'))
+        recorder.run('scrape_cached', lambda: reddit_scraper.scrape_reddit_story('news'))
+        story = story or fake_story(args.story_words)
+        reworked = recorder.run('rework_story_with_product',
+                                lambda: story_rewriter.rework_story_with_product(story, 'Acme Cola'))
+        title_audio = recorder.run('text_to_speech_title', lambda: text_to_speech(title), output=lambda path: path)
+        story_audio = recorder.run('text_to_speech_story', lambda: text_to_speech(reworked), output=lambda path: path)
+        recorder.run('text_to_speech_story_cached', lambda: text_to_speech(reworked))
+        duration = audio_assets.load(title_audio).duration + audio_assets.load(story_audio).duration
+
+        background = recorder.run('adjust_video_for_tiktok_cold', lambda: adjust_video_for_tiktok(gameplay, duration, 0))
+        recorder.run('adjust_video_for_tiktok', lambda: adjust_video_for_tiktok(gameplay, duration, 0))
+        subtitles = recorder.run('generate_subtitles', lambda: generate_subtitles(story_audio, script=reworked))
+        if args.whisper:
+            recorder.run('whisper_transcription', lambda: transcribe(audio_assets.load(story_audio).for_whisper()))
+        recorder.run('create_social_media_overlay', lambda: create_social_media_overlay(title, 'benchmark', None))
+
+        recorder.run('overlay_text_on_video',
+                     lambda: overlay_text_on_video(background, title_audio, story_audio, title, reworked,
+                                                   subtitles, 'benchmark', None),
+                     output=lambda path: path)
+
+        # End to end through the Flask app and the job queue, with the caches now warm
+        from werkzeug.security import generate_password_hash
+        from app import create_app, db
+        from app.artifact_store import artifact_store
+        from app.jobs import job_queue
+        from app.models import User
+        from app.socketio_instance import init_socketio
+        flask_app = create_app()
+        init_socketio(flask_app)
+        with flask_app.app_context():
+            db.session.add(User(email='benchmark@example.com', first_name='Benchmark',
+                                password=generate_password_hash('password', method='pbkdf2:sha256')))
+            db.session.commit()
+        client = flask_app.test_client()
+        client.post('/login', data={'email': 'benchmark@example.com', 'password': 'password'})
+
+        def generate():
+            profile_picture = open('./app/static/profpic.png', 'rb')
+            response = client.post('/generate', data={
+                'gameplay': 'subway-surfers', 'voice': 'alloy', 'title': title, 'story_text': story,
+                'product': 'Acme Cola', 'username': 'benchmark', 'profilePicture': (profile_picture, 'profpic.png'),
+            }, content_type='multipart/form-data')
+            if response.status_code != 202:
+                raise RuntimeError(f"/generate returned {response.status_code}: {response.get_json()}")
+            return wait_for_job(job_queue, response.get_json()['job_id'])
+
+        recorder.run('generate_end_to_end', generate,
+                     output=lambda result: artifact_store.path(os.path.basename(result['video_url'])))
+    return recorder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--story-words', type=int, default=150)
+    parser.add_argument('--backend', default='ffmpeg')
+    parser.add_argument('--baseline')
+    parser.add_argument('--save-baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--whisper', action='store_true',
+                        help="Also time Whisper transcription (needs the model weights available offline)")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='bench_pipeline_')
+    try:
+        recorder = run_stages(args, work)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(recorder.results, f, indent=2, sort_keys=True)
+        print(f"\nSaved baseline to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(recorder.results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Compares single-pass rendering with segmented parallel rendering of the same synthetic
+timeline, and checks that the segmented output keeps the duration and audio sync.
+
+Usage:
+    python -m benchmarks.bench_segmented_render [--backend ffmpeg] [--segments 2 4] [--story-seconds 40]
+"""
+import argparse
+import os
+import tempfile
+import time
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from app.render import Background, render
+from benchmarks.check_render_backends import make_fixtures, story_onset, synthetic_timeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--backend', default='ffmpeg')
+    parser.add_argument('--segments', nargs='+', type=int, default=[2, 4])
+    parser.add_argument('--story-seconds', type=float, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        gameplay, title_audio, story_audio = make_fixtures(directory, args.story_seconds)
+        background = Background(gameplay, 3.0, 8.0, 30, normalized=True)
+        timeline = synthetic_timeline(background, title_audio, story_audio)
+        title_duration = timeline.audio[1][1]
+
+        baseline = None
+        for segments in [1] + args.segments:
+            output = os.path.join(directory, f"segments_{segments}.mp4")
+            start = time.perf_counter()
+            render(timeline, output, backend=args.backend, segments=segments)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            duration = ffmpeg_parse_infos(output)['duration']
+            print(f"{segments:>2} segment(s): {elapsed:7.2f}s  speedup {baseline / elapsed:4.2f}x  "
+                  f"duration {duration:.2f}s  story onset {story_onset(output, title_duration):.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Bulk-ingests synthetic stories into a scratch story corpus, checks that reposts are
+deduplicated, and times keyword, subreddit and duration searches against it.
+
+Usage:
+    python -m benchmarks.bench_story_corpus [--stories 20000] [--batch 100] [--searches 200]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from app import story_corpus
+from benchmarks.fixtures import fake_story
+
+SUBREDDITS = ['stories', 'confession', 'nosleep', 'tifu']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--stories', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=100, help="Stories per ingest call, like one listing")
+    parser.add_argument('--searches', type=int, default=200)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='bench_corpus_'), 'corpus.db')
+    rng = random.Random(0)
+    stories = [(f"post{n}", f"Story {n}", fake_story(rng.randint(80, 600), seed=n)) for n in range(args.stories)]
+
+    start = time.perf_counter()
+    added = 0
+    for i in range(0, len(stories), args.batch):
+        added += story_corpus.ingest(SUBREDDITS[i // args.batch % len(SUBREDDITS)], stories[i:i + args.batch], path=path)
+    elapsed = time.perf_counter() - start
+    print(f"ingested {added} stories in {elapsed:.2f}s ({added / elapsed:,.0f}/s)")
+
+    reposts = [(f"repost{n}", title.upper(), f"  {body}  ") for n, (_, title, body) in enumerate(stories[:args.batch])]
+    duplicates = story_corpus.ingest('stories', reposts, path=path)
+    print(f"re-ingesting {len(reposts)} reposts added {duplicates}")
+
+    queries = {
+        'keyword': lambda: story_corpus.search(rng.choice(['hospital', 'neighbor coffee', 'morning door']), path=path),
+        'keyword+subreddit+duration': lambda: story_corpus.search(
+            'hospital', subreddit=rng.choice(SUBREDDITS), target_seconds=rng.randint(40, 200), path=path),
+        'duration': lambda: story_corpus.search(target_seconds=rng.randint(40, 200), path=path),
+        'subreddit+duration': lambda: story_corpus.search(
+            subreddit=rng.choice(SUBREDDITS), target_seconds=rng.randint(40, 200), path=path),
+    }
+    for name, query in queries.items():
+        start = time.perf_counter()
+        for _ in range(args.searches):
+            query()
+        print(f"{name:<28} {(time.perf_counter() - start) / args.searches * 1e3:8.2f} ms per search")
+
+    if added != args.stories or duplicates:
+        print("FAIL: expected every story once and no reposts")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Compares subtitle preparation with the Pillow renderer against one ImageMagick TextClip
+per subtitle chunk.
+
+The Pillow renderer caches rendered lines and captions, so it is timed twice: cold, with
+the caches cleared as in a fresh worker, and warm, rendering the same story again. The
+speedup compares the cold time. The default story is generated (fixtures.fake_story) rather
+than repeated text, so chunks rarely repeat within it.
+
+Usage:
+    python -m benchmarks.bench_subtitle_render [story.txt] [--words 1200] [--skip-textclip]
+"""
+import argparse
+import time
+import moviepy.editor as mp
+from app.subtitle_renderer import load_font, render_caption, render_line, subtitle_clip, cache_info
+from benchmarks.fixtures import fake_story
+
+
+def chunks(text):
+    words = text.split()
+    return [' '.join(words[i:i + 3]) for i in range(0, len(words), 3)]
+
+
+def textclip_subtitles(texts, width):
+    return [mp.TextClip(text, fontsize=72, font='Arial-Bold', color='white', stroke_color='black',
+                        stroke_width=1, method='caption', size=(width, None)) for text in texts]
+
+
+def pillow_subtitles(texts, width):
+    return [subtitle_clip(text, fontsize=72, width=width) for text in texts]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('story', nargs='?')
+    parser.add_argument('--words', type=int, default=1200, help="Length of the generated story")
+    parser.add_argument('--skip-textclip', action='store_true', help="Skip the ImageMagick path")
+    args = parser.parse_args()
+
+    text = fake_story(args.words)
+    if args.story:
+        with open(args.story) as f:
+            text = f.read()
+    texts = chunks(text)
+    width = 1080 - 200
+
+    print(f"{len(texts)} subtitle chunks, {len(set(texts))} distinct")
+    for cached in (load_font, render_line, render_caption):
+        cached.cache_clear()
+    start = time.perf_counter()
+    pillow_subtitles(texts, width)
+    pillow_seconds = time.perf_counter() - start
+    print(f"pillow (cold): {pillow_seconds:8.3f}s  cache: {cache_info()['captions']}")
+
+    start = time.perf_counter()
+    pillow_subtitles(texts, width)
+    print(f"pillow (warm): {time.perf_counter() - start:8.3f}s  cache: {cache_info()['captions']}")
+
+    if not args.skip_textclip:
+        start = time.perf_counter()
+        textclip_subtitles(texts, width)
+        textclip_seconds = time.perf_counter() - start
+        print(f"textclip:      {textclip_seconds:8.3f}s")
+        print(f"speedup:       {textclip_seconds / pillow_seconds:8.1f}x (cold)")
+
+
+if __name__ == '__main__':
+    main()
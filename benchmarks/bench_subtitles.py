@@ -0,0 +1,60 @@
+"""
+Compares subtitle generation by forced alignment against full Whisper transcription.
+
+Usage:
+    python -m benchmarks.bench_subtitles narration.mp3 script.txt [--model base] [--repeat 3]
+"""
+import argparse
+import time
+import whisper
+from app.alignment import align_subtitles
+from app.whisper_models import transcribe, warm_up
+
+
+def transcription_subtitles(samples, model):
+    # Same chunking as generate_subtitles() uses for the Whisper engine
+    result = transcribe(samples, size=model)
+    subtitles = []
+    for segment in result['segments']:
+        words = segment['text'].split()
+        for i in range(0, len(words), 3):
+            start = segment['start'] + (i / len(words)) * (segment['end'] - segment['start'])
+            end = segment['start'] + ((i + 3) / len(words)) * (segment['end'] - segment['start'])
+            subtitles.append((start, end, words[i:i + 3]))
+    return subtitles
+
+
+def best_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('audio')
+    parser.add_argument('script')
+    parser.add_argument('--model', default='base')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.script) as f:
+        script = f.read()
+    # Decode once up front so both paths are timed on the same samples
+    samples = whisper.load_audio(args.audio)
+    warm_up([args.model])
+
+    align_time, aligned = best_time(lambda: align_subtitles(samples, script), args.repeat)
+    whisper_time, transcribed = best_time(lambda: transcription_subtitles(samples, args.model), args.repeat)
+
+    print(f"audio duration:   {len(samples) / whisper.audio.SAMPLE_RATE:8.2f}s")
+    print(f"whisper ({args.model}):   {whisper_time:8.3f}s  {len(transcribed)} chunks")
+    print(f"alignment:        {align_time:8.3f}s  {len(aligned)} chunks")
+    print(f"speedup:          {whisper_time / align_time:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
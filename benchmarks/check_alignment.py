@@ -0,0 +1,122 @@
+"""
+Measures how far the word onsets found by forced alignment are from reference onsets.
+
+By default the narration comes from the speech API stand-in with irregular timing (see
+fixtures.narration_timings), so word lengths don't follow the letter counts the aligner
+assumes and many words run together without a pause; the reference is the stand-in's exact
+timing. The narration goes through an MP3 file and the same decode as in the pipeline.
+
+With --audio and --text, a real narration and the script it was synthesized from are used
+instead, and the reference is Whisper's word timestamps (word_timestamps=True). Script words
+are paired with the words Whisper heard by matching their spelling; unmatched words are left
+out and counted. This needs the Whisper model (WHISPER_MODEL), downloaded on first use.
+
+Fails if the mean onset error, the worst onset error or the worst sentence-start error
+exceeds its limit. Subtitles show three words at a time, so errors well under a second
+keep each chunk on screen while its words are spoken.
+
+Usage:
+    python -m benchmarks.check_alignment [--stories 5] [--story-words 200]
+        [--audio narration.mp3 --text script.txt]
+        [--max-mean 0.25] [--max-error 1.0] [--max-sentence-error 0.1]
+"""
+import argparse
+import difflib
+import os
+import re
+import sys
+import tempfile
+import numpy as np
+from app import audio_assets
+from app.alignment import align_words
+from benchmarks.fixtures import TTS_SAMPLE_RATE, fake_story, make_narration, narration_timings
+
+
+def _normalize(word):
+    return re.sub(r'[^a-z0-9]', '', word.lower())
+
+
+def whisper_reference(samples, words):
+    """
+    Returns the onset Whisper heard for each script word, or NaN where its transcript has no
+    matching word.
+    """
+    from app.whisper_models import transcribe
+    result = transcribe(samples, word_timestamps=True)
+    heard = [word for segment in result['segments'] for word in segment.get('words', [])]
+    onsets = np.full(len(words), np.nan)
+    matcher = difflib.SequenceMatcher(None, [_normalize(w) for w in words],
+                                      [_normalize(w['word']) for w in heard], autojunk=False)
+    for block in matcher.get_matching_blocks():
+        for i in range(block.size):
+            onsets[block.a + i] = heard[block.b + i]['start']
+    return onsets
+
+
+def narrations(args, directory):
+    """Yields (label, words, decoded samples, reference onsets) for each narration to check."""
+    if args.audio:
+        with open(args.text) as f:
+            words = f.read().split()
+        samples = audio_assets.load(args.audio).for_whisper()
+        yield os.path.basename(args.audio), words, samples, whisper_reference(samples, words)
+        return
+    for seed in range(args.stories):
+        text = fake_story(args.story_words, seed=seed)
+        path = make_narration(os.path.join(directory, f"narration_{seed}.mp3"), text, seed=seed)
+        truth = np.array([start for start, _ in narration_timings(text, seed=seed)]) / TTS_SAMPLE_RATE
+        yield f"story {seed}", text.split(), audio_assets.load(path).for_whisper(), truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--stories', type=int, default=5)
+    parser.add_argument('--story-words', type=int, default=200)
+    parser.add_argument('--audio', help="A real narration to check against Whisper's word timestamps")
+    parser.add_argument('--text', help="The script --audio was synthesized from")
+    parser.add_argument('--max-mean', type=float, default=0.25, help="Seconds")
+    parser.add_argument('--max-error', type=float, default=1.0, help="Seconds")
+    parser.add_argument('--max-sentence-error', type=float, default=0.1, help="Seconds")
+    args = parser.parse_args()
+    if bool(args.audio) != bool(args.text):
+        parser.error("--audio and --text go together")
+
+    errors, sentence_errors, chunk_errors = [], [], []
+    with tempfile.TemporaryDirectory() as directory:
+        for label, words, samples, reference in narrations(args, directory):
+            aligned = align_words(samples, words)
+            if len(aligned) != len(words):
+                print(f"FAIL {label}: {len(aligned)} of {len(words)} words aligned")
+                sys.exit(1)
+
+            error = np.abs(np.array([start for start, _, _ in aligned]) - reference)
+            is_sentence_start = np.zeros(len(words), dtype=bool)
+            is_sentence_start[[0] + [i + 1 for i, word in enumerate(words[:-1]) if word[-1] in '.!?']] = True
+            matched = ~np.isnan(error)
+            errors.append(error[matched])
+            sentence_errors.append(error[matched & is_sentence_start])
+            chunk_errors.append(error[::3][matched[::3]])
+            print(f"{label}: {len(words)} words ({matched.sum()} with a reference), {is_sentence_start.sum()} sentences, "
+                  f"onset error mean {error[matched].mean() * 1e3:6.1f} ms, max {error[matched].max() * 1e3:6.1f} ms")
+
+    errors, sentence_errors, chunk_errors = (np.concatenate(e) for e in (errors, sentence_errors, chunk_errors))
+    print(f"\n{'':<18} {'mean':>9} {'p95':>9} {'max':>9}")
+    for label, values in (('word onsets', errors), ('subtitle chunks', chunk_errors), ('sentence starts', sentence_errors)):
+        print(f"{label:<18} {values.mean() * 1e3:6.1f} ms {np.percentile(values, 95) * 1e3:6.1f} ms "
+              f"{values.max() * 1e3:6.1f} ms")
+
+    failures = []
+    if errors.mean() > args.max_mean:
+        failures.append(f"mean onset error {errors.mean():.3f}s exceeds {args.max_mean}s")
+    if errors.max() > args.max_error:
+        failures.append(f"worst onset error {errors.max():.3f}s exceeds {args.max_error}s")
+    if sentence_errors.max() > args.max_sentence_error:
+        failures.append(f"worst sentence-start error {sentence_errors.max():.3f}s exceeds {args.max_sentence_error}s")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Checks the artifact store's eviction in a scratch directory: artifacts past the age limit
+go first, then the least recently used until the quota is met; serving an artifact makes
+it recent; cache subdirectories and files the app didn't write are left alone; nothing an in-flight job refers to, or
+wrote since it was queued, is evicted; and a finished draft keeps its artifacts despite the
+quota until it is promoted or they expire.
+
+Usage:
+    python -m benchmarks.check_artifact_store
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+work = tempfile.mkdtemp(prefix='check_artifact_store_')
+os.environ.update({
+    'ARTIFACT_DIR': os.path.join(work, 'generated_files'),
+    'ARTIFACT_SWEEP_INTERVAL': '0',
+    'DATABASE_URL': f"sqlite:///{os.path.join(work, 'database.db')}",
+    'STORY_REFRESHER': '0',
+    'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY', 'offline'),
+    'REDDIT_CLIENT_ID': os.getenv('REDDIT_CLIENT_ID', 'offline'),
+    'REDDIT_CLIENT_SECRET': os.getenv('REDDIT_CLIENT_SECRET', 'offline'),
+})
+
+from werkzeug.security import generate_password_hash
+from app import create_app, db, pipeline
+from app.artifact_store import ArtifactStore, artifact_store
+from app.jobs import job_queue
+from app.models import User
+from app.socketio_instance import init_socketio
+
+KIB = 1024
+HOUR = 3600
+
+
+def write(store, name, size, accessed_ago, modified_ago=None):
+    path = store.path(name)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    now = time.time()
+    modified_ago = accessed_ago if modified_ago is None else modified_ago
+    os.utime(path, (now - accessed_ago, now - modified_ago))
+    return path
+
+
+def draft_job(paths, video):
+    """Stands in for a draft render: returns the result generate_video() gives for a draft."""
+    return {'draft': True, 'video_url': f"/generated_files/{os.path.basename(video)}",
+            'artifacts': {'title_audio_path': paths[0], 'story_audio_path': paths[1], 'profile_pic_path': paths[2],
+                          'title_duration': 2.0, 'story_duration': 40.0}}
+
+
+def promote_job(artifacts):
+    """Stands in for promote_video(): fails, as the final render would, if an input is missing."""
+    missing = [path for path in (artifacts['title_audio_path'], artifacts['story_audio_path'],
+                                 artifacts['profile_pic_path']) if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"Missing draft artifacts: {missing}")
+    return {'draft': False, 'video_url': '/generated_files/tiktok_video_final.mp4', 'artifacts': artifacts}
+
+
+def wait(job_id):
+    while not job_queue.get(job_id).finished:
+        time.sleep(0.05)
+    return job_queue.get(job_id)
+
+
+def main():
+    failures = []
+
+    def check(condition, message):
+        print(f"{'ok  ' if condition else 'FAIL'} {message}")
+        if not condition:
+            failures.append(message)
+
+    store = ArtifactStore(os.path.join(work, 'quota'), quota_bytes=300 * KIB, max_age=24 * HOUR, in_use=set)
+    write(store, 'speech_stale.mp3', 10 * KIB, accessed_ago=48 * HOUR)
+    write(store, 'tiktok_video_a.mp4', 100 * KIB, accessed_ago=5 * HOUR)
+    write(store, 'tiktok_video_b.mp4', 100 * KIB, accessed_ago=4 * HOUR)
+    write(store, 'tiktok_video_c.mp4', 100 * KIB, accessed_ago=3 * HOUR)
+    write(store, 'tiktok_video_d.mp4', 100 * KIB, accessed_ago=2 * HOUR)
+    # Rewatched recently, though written first
+    write(store, 'tiktok_video_old.mp4', 100 * KIB, accessed_ago=60, modified_ago=20 * HOUR)
+    os.makedirs(store.path('tts_cache'))
+    write(store, 'tts_cache/ab.pcm', 500 * KIB, accessed_ago=72 * HOUR)
+    write(store, 'placeholder.txt', 1 * KIB, accessed_ago=72 * HOUR)
+
+    evicted = store.sweep()
+    check(evicted[0] == 'speech_stale.mp3', f"the expired artifact is evicted first ({evicted})")
+    check(evicted[1:] == ['tiktok_video_a.mp4', 'tiktok_video_b.mp4'], "then the least recently used, until under quota")
+    check(store.total_bytes <= store.quota_bytes, f"store is {store.total_bytes // KIB} KiB of {store.quota_bytes // KIB} KiB")
+    check(os.path.exists(store.path('tiktok_video_old.mp4')), "recency follows access, not the write time")
+    check(os.path.exists(store.path('tts_cache/ab.pcm')), "cache subdirectories are left alone")
+    check(os.path.exists(store.path('placeholder.txt')), "files the app didn't write are left alone")
+    check(store.sweep() == [], "a second sweep has nothing to do")
+
+    protected = ArtifactStore(os.path.join(work, 'protected'), quota_bytes=100 * KIB, max_age=24 * HOUR,
+                              in_use=lambda: {'tiktok_video_keep.mp4'})
+    write(protected, 'tiktok_video_keep.mp4', 100 * KIB, accessed_ago=48 * HOUR)
+    write(protected, 'tiktok_video_drop.mp4', 100 * KIB, accessed_ago=1 * HOUR)
+    check(protected.sweep() == ['tiktok_video_drop.mp4'], "artifacts in use are skipped, even when expired")
+
+    # Through the app: serving makes an artifact recent, and in-flight jobs protect theirs
+    app = create_app()
+    init_socketio(app)
+    with app.app_context():
+        user = User(email='check@example.com', first_name='Check',
+                    password=generate_password_hash('password', method='pbkdf2:sha256'))
+        db.session.add(user)
+        db.session.commit()
+        user_id = str(user.id)
+    client = app.test_client()
+    client.post('/login', data={'email': 'check@example.com', 'password': 'password'})
+    artifact_store.quota_bytes, artifact_store.max_age = 300 * KIB, 24 * HOUR
+    write(artifact_store, 'tiktok_video_watched.mp4', 100 * KIB, accessed_ago=10 * HOUR)
+    write(artifact_store, 'tiktok_video_unwatched.mp4', 100 * KIB, accessed_ago=5 * HOUR)
+    response = client.get('/generated_files/tiktok_video_watched.mp4', headers={'Range': 'bytes=0-1023'})
+    check(response.status_code == 206, f"range request answered with {response.status_code}")
+    profile = write(artifact_store, 'profile_in_flight.png', 100 * KIB, accessed_ago=30 * HOUR)
+
+    release = threading.Event()
+    job = job_queue.submit(lambda params: release.wait(30), {'profile_pic_path': profile})
+    produced = write(artifact_store, 'speech_produced.mp3', 100 * KIB, accessed_ago=0)
+    evicted = artifact_store.sweep()
+    check('profile_in_flight.png' not in evicted, "a file an in-flight job's arguments refer to is kept")
+    check(os.path.exists(produced), "a file written while a job is in flight is kept")
+    check(evicted == ['tiktok_video_unwatched.mp4'], f"the unwatched video is evicted, not the watched one ({evicted})")
+    release.set()
+    wait(job.id)
+    check('profile_in_flight.png' in artifact_store.sweep(), "once the job finishes, its expired profile picture goes")
+
+    # A finished draft keeps what promotion needs, even with the store over quota
+    inputs = [write(artifact_store, name, 100 * KIB, accessed_ago=12 * HOUR)
+              for name in ('speech_draft_title.mp3', 'speech_draft_story.mp3', 'profile_draft.png')]
+    video = write(artifact_store, 'tiktok_video_draft.mp4', 100 * KIB, accessed_ago=12 * HOUR)
+    draft = wait(job_queue.submit(draft_job, inputs, video, owner=user_id).id)
+    expired_inputs = [write(artifact_store, name, 100 * KIB, accessed_ago=48 * HOUR)
+                      for name in ('speech_expired_title.mp3', 'speech_expired_story.mp3', 'profile_expired.png')]
+    wait(job_queue.submit(draft_job, expired_inputs, expired_inputs[0], owner=user_id).id)
+    artifact_store.quota_bytes = 0
+    evicted = artifact_store.sweep()
+    check(all(os.path.exists(path) for path in inputs + [video]), f"an unpromoted draft's artifacts are kept ({evicted})")
+    check(not any(os.path.exists(path) for path in expired_inputs), "unless they expired")
+
+    pipeline.promote_video = promote_job
+    response = client.post(f"/jobs/{draft.id}/promote")
+    promoted = wait(response.get_json()['job_id']) if response.status_code == 202 else None
+    check(promoted is not None and promoted.error is None,
+          f"the draft is promoted after the sweep ({promoted.error if promoted else response.status_code})")
+    evicted = artifact_store.sweep()
+    check(all(os.path.basename(path) in evicted for path in inputs + [video]),
+          "once promoted, the draft's artifacts are evicted by quota")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
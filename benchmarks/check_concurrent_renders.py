@@ -0,0 +1,87 @@
+"""
+Renders several videos at once on threads of one process and checks that each render's
+subtitle timings are exactly what it would get rendered alone, so renders don't share state.
+
+Usage:
+    python -m benchmarks.check_concurrent_renders [--renders 4] [--backend ffmpeg] [--story-seconds 6]
+"""
+import argparse
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from app.render import Background
+from app.render_context import RenderContext
+from app.video_processing import overlay_text_on_video
+from benchmarks.check_render_backends import make_fixtures
+
+DURATION_TOLERANCE = 0.1
+
+
+def subtitles_for(n, story_duration):
+    """Subtitle chunks that differ per render, so mixed-up timelines are caught."""
+    step = 0.5 + 0.25 * n
+    chunks = []
+    t = 0.0
+    while t + step <= story_duration:
+        chunks.append((t, t + step, [f"render{n}", f"chunk{len(chunks)}"]))
+        t += step
+    return chunks
+
+
+def expected_schedule(subtitles):
+    context = RenderContext()
+    for start, end, words in subtitles:
+        context.schedule_subtitle(start, end, ' '.join(words))
+    return context.subtitles
+
+
+def render_one(n, background, title_audio, story_audio, subtitles, backend):
+    with RenderContext(job_id=f"check{n}") as context:
+        output = overlay_text_on_video(background, title_audio, story_audio, f"Title {n}", "", subtitles,
+                                       "benchmark", None, backend=backend, context=context)
+        return output, context.subtitles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--renders', type=int, default=4)
+    parser.add_argument('--backend', default='ffmpeg')
+    parser.add_argument('--story-seconds', type=float, default=6)
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        gameplay, title_audio, story_audio = make_fixtures(directory, args.story_seconds)
+        expected_duration = ffmpeg_parse_infos(title_audio)['duration'] + ffmpeg_parse_infos(story_audio)['duration']
+        background = Background(gameplay, 3.0, 8.0, 30, normalized=True)
+        inputs = [subtitles_for(n, args.story_seconds) for n in range(args.renders)]
+
+        with ThreadPoolExecutor(max_workers=args.renders) as executor:
+            futures = [executor.submit(render_one, n, background, title_audio, story_audio, subtitles, args.backend)
+                       for n, subtitles in enumerate(inputs)]
+            results = [future.result() for future in futures]
+
+        for n, ((output, scheduled), subtitles) in enumerate(zip(results, inputs)):
+            if output is None:
+                failures.append(f"render {n}: failed")
+                continue
+            duration = ffmpeg_parse_infos(output)['duration']
+            os.remove(output)
+            if abs(duration - expected_duration) > DURATION_TOLERANCE:
+                failures.append(f"render {n}: duration {duration:.2f}s != {expected_duration:.2f}s")
+            if scheduled != expected_schedule(subtitles):
+                failures.append(f"render {n}: subtitle timings differ from a render on its own")
+            print(f"render {n}: {len(scheduled)} subtitles, first at {scheduled[0][0]:.2f}s, "
+                  f"last ends {scheduled[-1][1]:.2f}s, duration {duration:.2f}s")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK: concurrent renders are independent")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Checks the job queue through the app, with a stand-in for the pipeline: a job is queued,
+running, done or failed as /jobs/<id> reports it; a full queue answers 429 with Retry-After
+and removes the uploaded picture; unusable draft lengths are rejected; a job's status and
+its Socket.IO events are only for the user who queued it; and one event the relay can't
+handle doesn't stop the ones after it.
+
+Usage:
+    python -m benchmarks.check_jobs
+"""
+import io
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+work = tempfile.mkdtemp(prefix='check_jobs_')
+os.environ.update({
+    'ARTIFACT_DIR': os.path.join(work, 'generated_files'),
+    'ARTIFACT_SWEEP_INTERVAL': '0',
+    'DATABASE_URL': f"sqlite:///{os.path.join(work, 'database.db')}",
+    'STORY_REFRESHER': '0',
+    'JOB_WORKERS': '1',
+    'JOB_QUEUE_DEPTH': '2',
+    'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY', 'offline'),
+    'REDDIT_CLIENT_ID': os.getenv('REDDIT_CLIENT_ID', 'offline'),
+    'REDDIT_CLIENT_SECRET': os.getenv('REDDIT_CLIENT_SECRET', 'offline'),
+})
+
+from werkzeug.security import generate_password_hash
+from app import create_app, db, pipeline
+from app.artifact_store import artifact_store
+from app.jobs import Job, JobQueue, RUNNING, _JOB_METRICS, _JOB_STARTED, emit_progress
+from app.models import User
+from app.socketio_instance import init_socketio, socketio
+
+release = threading.Event()
+
+
+def fake_generate_video(params):
+    """Stands in for generate_video(): reports progress, then waits to be released."""
+    emit_progress('log_update', {'log': f"Log: Rendering {params['title']}"})
+    release.wait(30)
+    if params['title'] == 'fail':
+        raise RuntimeError("Rendering failed")
+    return {'title': params['title'], 'full_story': params['story_text'], 'draft': False,
+            'video_url': '/generated_files/tiktok_video_check.mp4'}
+
+
+def sign_in(app, email):
+    with app.app_context():
+        db.session.add(User(email=email, first_name='Check',
+                            password=generate_password_hash('password', method='pbkdf2:sha256')))
+        db.session.commit()
+    client = app.test_client()
+    client.post('/login', data={'email': email, 'password': 'password'})
+    return client
+
+
+def generate(client, title, **fields):
+    return client.post('/generate', data={
+        'gameplay': 'minecraft', 'voice': 'alloy', 'title': title, 'story_text': "A short story.",
+        'product': 'A product', 'username': 'check', 'profilePicture': (io.BytesIO(b'picture'), 'profile.png'),
+        **fields,
+    }, content_type='multipart/form-data')
+
+
+def state(client, job_id):
+    response = client.get(f"/jobs/{job_id}")
+    return response.get_json()['state'] if response.status_code == 200 else response.status_code
+
+
+def wait_for(client, job_id, states):
+    deadline = time.time() + 30
+    while state(client, job_id) not in states and time.time() < deadline:
+        time.sleep(0.05)
+    return state(client, job_id)
+
+
+def main():
+    failures = []
+
+    def check(condition, message):
+        print(f"{'ok  ' if condition else 'FAIL'} {message}")
+        if not condition:
+            failures.append(message)
+
+    pipeline.generate_video = fake_generate_video
+    app = create_app()
+    init_socketio(app)
+    owner = sign_in(app, 'owner@example.com')
+    other = sign_in(app, 'other@example.com')
+
+    check(app.test_client().post('/generate').status_code == 302, "anonymous generation is sent to sign in")
+    statuses = [generate(owner, 'draft', draft='1', draft_seconds=value).status_code
+                for value in ('-5', '0', '0.0001', 'nan', 'inf', 'ten')]
+    check(statuses == [400] * 6, f"draft lengths that aren't at least a second are rejected ({statuses})")
+
+    # One worker and a queue depth of two: one job runs, two wait, the next is turned away
+    jobs = [generate(owner, title).get_json()['job_id'] for title in ('first', 'fail', 'third')]
+    check(wait_for(owner, jobs[0], (RUNNING,)) == 'running', "the first job is running")
+    check([state(owner, job_id) for job_id in jobs[1:]] == ['queued', 'queued'], "the next two are queued")
+    pictures = len([name for name in os.listdir(artifact_store.directory) if name.startswith('profile_')])
+    response = generate(owner, 'fourth')
+    check(response.status_code == 429 and response.headers.get('Retry-After') == '30',
+          f"a full queue answers 429 with Retry-After ({response.status_code})")
+    check(len([name for name in os.listdir(artifact_store.directory) if name.startswith('profile_')]) == pictures,
+          "the turned-away job's picture is removed")
+
+    check(other.get(f"/jobs/{jobs[0]}").status_code == 404, "another user's job is not found")
+    check(app.test_client().get(f"/jobs/{jobs[0]}").status_code == 302, "anonymous status requests are sent to sign in")
+    owner_socket = socketio.test_client(app, flask_test_client=owner)
+    other_socket = socketio.test_client(app, flask_test_client=other)
+    owner_socket.emit('join_job', {'job_id': jobs[0]})
+    other_socket.emit('join_job', {'job_id': jobs[0]})
+    check([event['name'] for event in owner_socket.get_received()] == ['log_update'],
+          "joining its own job replays the progress so far")
+    check(other_socket.get_received() == [], "joining another user's job replays nothing")
+
+    release.set()
+    states = [wait_for(owner, job_id, ('done', 'failed')) for job_id in jobs]
+    check(states == ['done', 'failed', 'done'], f"jobs finish done or failed ({states})")
+    failed = owner.get(f"/jobs/{jobs[1]}").get_json()
+    check(failed['error'] == "Rendering failed", f"the failed job reports its error ({failed['error']})")
+    received = [event['name'] for event in owner_socket.get_received()]
+    check(received == ['process_complete'] and other_socket.get_received() == [],
+          f"completion goes to the owner's room only ({received})")
+    response = generate(owner, 'after')
+    check(response.status_code == 202, f"the drained queue takes jobs again ({response.status_code})")
+
+    # The relay of the process backend, fed directly: a malformed event is logged and skipped
+    relayed = JobQueue(backend='process')
+    relayed._jobs['relayed'] = Job('relayed')
+    channel = queue.Queue()
+    channel.put(('relayed', _JOB_METRICS, None))
+    channel.put(('relayed', _JOB_STARTED, None))
+    threading.Thread(target=relayed._relay, args=(channel,), daemon=True).start()
+    deadline = time.time() + 5
+    while relayed.get('relayed').state != RUNNING and time.time() < deadline:
+        time.sleep(0.05)
+    check(relayed.get('relayed').state == RUNNING, "the relay keeps going after an event it can't handle")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Renders the same synthetic timeline with every render backend and checks that the outputs
+agree with the moviepy reference on duration, resolution and audio sync.
+
+Audio sync is checked by narrating the title and the story with tones separated by silence
+and finding where the story tone starts in each output.
+
+Usage:
+    python -m benchmarks.check_render_backends [--backends moviepy ffmpeg] [--story-seconds 20]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from imageio_ffmpeg import get_ffmpeg_exe
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from app.render import Background, Timeline, render
+from app.subtitle_renderer import render_caption
+from app.title_overlay import render_title_overlay
+
+DURATION_TOLERANCE = 0.1
+SYNC_TOLERANCE = 0.05
+
+
+def ffmpeg(*args):
+    subprocess.run([get_ffmpeg_exe(), '-y', '-loglevel', 'error', *args], check=True)
+
+
+def make_fixtures(directory, story_seconds):
+    gameplay = os.path.join(directory, 'gameplay.mp4')
+    ffmpeg('-f', 'lavfi', '-i', 'testsrc=size=1080x1920:rate=30', '-t', '8', '-pix_fmt', 'yuv420p', gameplay)
+    title_audio = os.path.join(directory, 'title.mp3')
+    ffmpeg('-f', 'lavfi', '-i', 'sine=frequency=440:duration=2', title_audio)
+    # Silence, then a tone: the tone's onset marks a known point in the story audio
+    story_audio = os.path.join(directory, 'story.mp3')
+    ffmpeg('-f', 'lavfi', '-i', f'aevalsrc=if(gt(t\\,1)\\,sin(2*PI*880*t)\\,0):d={story_seconds}', story_audio)
+    return gameplay, title_audio, story_audio
+
+
+def story_onset(path, title_duration):
+    """Returns the time of the first loud sample after the title, in seconds."""
+    pcm = subprocess.run([get_ffmpeg_exe(), '-loglevel', 'error', '-i', path, '-f', 's16le', '-ac', '1',
+                          '-ar', '8000', '-'], check=True, capture_output=True).stdout
+    samples = np.abs(np.frombuffer(pcm, dtype=np.int16) / 32768.0)
+    after_title = samples[int((title_duration + 0.2) * 8000):]
+    return title_duration + 0.2 + np.argmax(after_title > 0.1) / 8000
+
+
+def synthetic_timeline(background, title_audio, story_audio):
+    """Builds a timeline shaped like a real render: title overlay, then one subtitle per second."""
+    title_duration = ffmpeg_parse_infos(title_audio)['duration']
+    story_duration = ffmpeg_parse_infos(story_audio)['duration']
+    overlay = render_title_overlay("A synthetic title for the render check", "benchmark", None)
+    layers = [(0, title_duration, overlay, (40, 860))]
+    layers += [(title_duration + t, title_duration + t + 0.9, render_caption(f"subtitle number {int(t)}", width=880), 'center')
+               for t in np.arange(0, story_duration - 1, 1.0)]
+    audio = [(title_audio, 0, title_duration), (story_audio, title_duration, story_duration)]
+    return Timeline(background, title_duration + story_duration, layers, audio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--backends', nargs='+', default=['moviepy', 'ffmpeg'])
+    parser.add_argument('--story-seconds', type=float, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        gameplay, title_audio, story_audio = make_fixtures(directory, args.story_seconds)
+        title_duration = ffmpeg_parse_infos(title_audio)['duration']
+        background = Background(gameplay, 3.0, 8.0, 30, normalized=True)
+        timeline = synthetic_timeline(background, title_audio, story_audio)
+
+        results = {}
+        for backend in args.backends:
+            output = os.path.join(directory, f"{backend}.mp4")
+            start = time.perf_counter()
+            render(timeline, output, backend=backend)
+            elapsed = time.perf_counter() - start
+            infos = ffmpeg_parse_infos(output)
+            results[backend] = (infos['duration'], tuple(infos['video_size']), story_onset(output, title_duration))
+            print(f"{backend:>8}: {elapsed:7.2f}s  duration {results[backend][0]:.2f}s  "
+                  f"size {results[backend][1]}  story onset {results[backend][2]:.3f}s")
+
+    reference = results[args.backends[0]]
+    failures = []
+    for backend, (duration, size, onset) in results.items():
+        if abs(duration - reference[0]) > DURATION_TOLERANCE:
+            failures.append(f"{backend}: duration {duration:.2f}s != {reference[0]:.2f}s")
+        if size != reference[1]:
+            failures.append(f"{backend}: size {size} != {reference[1]}")
+        if abs(onset - reference[2]) > SYNC_TOLERANCE:
+            failures.append(f"{backend}: story audio starts at {onset:.3f}s, not {reference[2]:.3f}s")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK: backends agree")
+
+
+if __name__ == '__main__':
+    main()
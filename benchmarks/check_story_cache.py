@@ -0,0 +1,96 @@
+"""
+Checks the subreddit listing cache against a fake PRAW source with network-like latency:
+concurrent first requests share one fetch, cached picks answer from memory, a user is not
+served the same story twice until the listing is exhausted, the background refresher
+fetches subreddits concurrently, and an expired listing is fetched again.
+
+Usage:
+    python -m benchmarks.check_story_cache [--posts 20] [--latency 0.5]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+for name in ('REDDIT_CLIENT_ID', 'REDDIT_CLIENT_SECRET'):
+    os.environ.setdefault(name, 'offline')
+
+from app.reddit_scraper import SubredditCache
+from benchmarks.fixtures import FakeReddit
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--posts', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.5)
+    args = parser.parse_args()
+    failures = []
+
+    def check(condition, message):
+        print(f"{'ok  ' if condition else 'FAIL'} {message}")
+        if not condition:
+            failures.append(message)
+
+    source = FakeReddit(posts=args.posts, words=30, latency=args.latency)
+    clock = Clock()
+    cache = SubredditCache(source, ttl=60, clock=clock)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: cache.pick('stories'), range(8)))
+    check(source.fetches == 1, f"8 concurrent cold requests made {source.fetches} fetch(es)")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        cache.pick('stories', user='alice')
+    per_pick = (time.perf_counter() - start) / 1000
+    check(per_pick < 0.001, f"cached pick takes {per_pick * 1e6:.0f}us (fetch takes {args.latency * 1e3:.0f}ms)")
+
+    fresh = SubredditCache(source, ttl=60, clock=clock)
+    served = [fresh.pick('stories', user='bob')[0] for _ in range(args.posts)]
+    check(len(set(served)) == args.posts, f"{len(set(served))} distinct stories in {args.posts} picks for one user")
+    check(fresh.pick('stories', user='bob')[0] in served, "an exhausted user starts over")
+    other = {fresh.pick('stories', user='carol')[0] for _ in range(args.posts)}
+    check(len(other) == args.posts, "other users are tracked separately")
+
+    source.fetches = 0
+    names = ['stories', 'confession', 'nosleep', 'tifu']
+    refreshing = SubredditCache(source, ttl=60, clock=clock)
+    start = time.perf_counter()
+    refreshing.refresh(names)
+    elapsed = time.perf_counter() - start
+    check(source.fetches == len(names), f"refresh fetched {source.fetches} of {len(names)} subreddits")
+    check(elapsed < args.latency * 2, f"refresh of {len(names)} subreddits took {elapsed:.2f}s (one fetch {args.latency:.2f}s)")
+    refreshing.refresh(names)
+    check(source.fetches == len(names), "refresh skips listings that are not due")
+
+    clock.now += 61
+    source.fetches = 0
+    refreshing.pick('stories')
+    check(source.fetches == 1, "an expired listing is fetched again")
+
+    source.latency = 0
+    source.fetches = 0
+    live = SubredditCache(source, ttl=2)
+    live.start_refresher(['stories'])
+    time.sleep(3.5)
+    live.stop_refresher()
+    refreshes = source.fetches
+    live.pick('stories')
+    check(refreshes >= 2 and source.fetches == refreshes,
+          f"the background refresher fetched {refreshes} times in 3.5s and the listing never went cold")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Load-tests the story history against a scratch database: several writer threads commit
+finished-job Story rows at once, as the job queue's on_done callbacks do, while a signed-in
+client pages through /stories. Fails if any write or page request errors, if rows go
+missing, or if the user loader reads the user table more than once per USER_CACHE_TTL.
+
+Usage:
+    python -m benchmarks.check_story_history [--writers 8] [--stories 200] [--users 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+work = tempfile.mkdtemp(prefix='check_story_history_')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(work, 'database.db')}",
+    'STORY_REFRESHER': '0',
+    'ARTIFACT_SWEEP_INTERVAL': '0',
+    'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY', 'offline'),
+    'REDDIT_CLIENT_ID': os.getenv('REDDIT_CLIENT_ID', 'offline'),
+    'REDDIT_CLIENT_SECRET': os.getenv('REDDIT_CLIENT_SECRET', 'offline'),
+})
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+from app import create_app, db
+from app.models import Story, User
+from app.socketio_instance import init_socketio
+from app.story_history import story_recorder
+
+
+def fake_job(n):
+    now = time.time()
+    return SimpleNamespace(id=f"job{n:06d}", started_at=now - 30, finished_at=now, result={
+        'title': f"Story {n}", 'full_story': "Reworked story " * 50, 'draft': False,
+        'video_url': f"/generated_files/tiktok_video_{n}.mp4",
+        'stage_timings': {'rewrite': [0, 2.5], 'render': [6, 30]},
+        'artifacts': {'title_duration': 2.1, 'story_duration': 41.7,
+                      'title_audio_path': f"./generated_files/speech_{n}.mp3",
+                      'story_audio_path': f"./generated_files/speech_{n}_story.mp3"},
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--stories', type=int, default=200, help="Stories committed per writer")
+    parser.add_argument('--users', type=int, default=4)
+    args = parser.parse_args()
+
+    app = create_app()
+    init_socketio(app)
+    with app.app_context():
+        users = [User(email=f"user{n}@example.com", first_name=f"User{n}",
+                      password=generate_password_hash('password', method='pbkdf2:sha256'))
+                 for n in range(args.users)]
+        db.session.add_all(users)
+        db.session.commit()
+        user_ids = [user.id for user in users]
+
+    recorders = {}
+    with app.test_request_context():
+        for user_id in user_ids:
+            recorders[user_id] = story_recorder(str(user_id), {
+                'title': 'Story', 'story_text': "Original story " * 50,
+                'product': 'Acme Cola', 'gameplay': 'minecraft', 'voice': 'alloy'})
+
+    errors = []
+
+    def writer(w):
+        for i in range(args.stories):
+            n = w * args.stories + i
+            try:
+                recorders[user_ids[n % len(user_ids)]](fake_job(n))
+            except Exception as e:
+                errors.append(f"write {n}: {e}")
+
+    client = app.test_client()
+    response = client.post('/login', data={'email': 'user0@example.com', 'password': 'password'})
+    if response.status_code != 302:
+        print(f"FAIL login returned {response.status_code}")
+        sys.exit(1)
+
+    with app.app_context():
+        user_reads = []
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *rest: user_reads.append(statement)
+                     if 'FROM user' in statement else None)
+
+    writing = True
+    page_times = []
+
+    def reader():
+        while writing:
+            start = time.perf_counter()
+            response = client.get('/stories?page=1&per_page=20')
+            page_times.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(f"/stories returned {response.status_code}")
+
+    threads = [threading.Thread(target=writer, args=(w,)) for w in range(args.writers)]
+    reading = threading.Thread(target=reader)
+    start = time.perf_counter()
+    reading.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    writing = False
+    reading.join()
+
+    total = args.writers * args.stories
+    print(f"{args.writers} writers committed {total} stories in {elapsed:.2f}s ({total / elapsed:,.0f}/s)")
+    page_times.sort()
+    print(f"{len(page_times)} /stories pages meanwhile, median {page_times[len(page_times) // 2] * 1e3:.1f} ms, "
+          f"max {page_times[-1] * 1e3:.1f} ms")
+    print(f"user table read {len(user_reads)} times for {len(page_times)} signed-in requests")
+
+    with app.app_context():
+        stored = db.session.query(Story).count()
+        mine = client.get('/stories?page=2&per_page=50').get_json()
+    print(f"{stored} rows stored; user0 has {mine['total']} stories in {mine['pages']} pages")
+
+    expected_mine = len(range(0, total, len(user_ids)))
+    failures = errors[:10]
+    if stored != total:
+        failures.append(f"expected {total} rows, found {stored}")
+    if mine['total'] != expected_mine or len(mine['stories']) != min(50, max(0, expected_mine - 50)):
+        failures.append(f"pagination returned {len(mine['stories'])} of {mine['total']} stories")
+    if len(user_reads) > 1:
+        failures.append(f"user loader queried the database {len(user_reads)} times")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
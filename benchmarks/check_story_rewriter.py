@@ -0,0 +1,54 @@
+"""
+Checks the story rewrite cache with a stand-in for the OpenAI client: a story is rewritten
+once per product, and the previewed rewrite maps to itself even when a form resubmits it
+with CRLF line breaks or other whitespace changes, so /generate doesn't rewrite it again.
+
+Usage:
+    python -m benchmarks.check_story_rewriter
+"""
+import os
+import sys
+import tempfile
+
+from benchmarks.fixtures import FakeOpenAI, fake_story
+
+work = tempfile.mkdtemp(prefix='check_story_rewriter_')
+os.environ.update({
+    'REWRITE_CACHE_DIR': os.path.join(work, 'rewrite_cache'),
+    'TTS_CACHE_DIR': os.path.join(work, 'tts_cache'),
+})
+
+from app import story_rewriter
+
+
+def main():
+    failures = []
+
+    def check(condition, message):
+        print(f"{'ok  ' if condition else 'FAIL'} {message}")
+        if not condition:
+            failures.append(message)
+
+    fake = story_rewriter.client = FakeOpenAI()
+    story = '\n\n'.join(fake_story(40, seed=n) for n in range(3))
+    streamed = []
+    reworked = story_rewriter.rework_story_with_product(story, 'Acme Cola', on_token=streamed.append)
+    check(fake.calls == 1 and ''.join(streamed) == reworked, "the preview streams one rewrite")
+
+    # What a multipart form submits for the previewed text in a hidden input
+    submitted = reworked.replace('\n', '\r\n') + '\r\n'
+    check(story_rewriter.get_cached_rewrite(submitted, 'Acme Cola') == reworked,
+          "the CRLF form of the previewed rewrite hits the cache")
+    check(story_rewriter.rework_story_with_product(submitted, 'Acme Cola') == reworked and fake.calls == 1,
+          f"generating from the submitted preview made {fake.calls - 1} more rewrite calls")
+    check(story_rewriter.rework_story_with_product(story.replace('\n', '\r\n'), 'Acme Cola') == reworked
+          and fake.calls == 1, "the original story in CRLF form hits the cache")
+    story_rewriter.rework_story_with_product(story, 'Other Soda')
+    check(fake.calls == 2, "another product is rewritten separately")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
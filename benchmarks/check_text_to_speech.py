@@ -0,0 +1,94 @@
+"""
+Checks text-to-speech against a local stand-in for the speech API:
+
+- text is split per paragraph even when it would fit in one request, so editing one
+  paragraph changes only that chunk's cache key, and narrating the edited story synthesizes
+  only that chunk again, and sentences keep their closing quotes and brackets;
+- 429 and 503 answers are retried with backoff and counted in retries_total, and the
+  concurrently synthesized chunks are joined in their original order.
+
+Usage:
+    python -m benchmarks.check_text_to_speech
+"""
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from benchmarks.fixtures import StubTTSServer, fake_story, narration_samples
+
+work = tempfile.mkdtemp(prefix='check_text_to_speech_')
+os.environ.update({
+    'ARTIFACT_DIR': os.path.join(work, 'generated_files'),
+    'TTS_CACHE_DIR': os.path.join(work, 'tts_cache'),
+    'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY', 'offline'),
+})
+
+
+def tts_retries():
+    from app.metrics import render_prometheus
+    for line in render_prometheus().splitlines():
+        if line.startswith('retries_total{') and 'service="tts"' in line:
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+
+def main():
+    failures = []
+
+    def check(condition, message):
+        print(f"{'ok  ' if condition else 'FAIL'} {message}")
+        if not condition:
+            failures.append(message)
+
+    with StubTTSServer() as tts_server:
+        os.environ['TTS_API_URL'] = tts_server.url
+        from app.audio_cache import cache_key
+        from app.text_to_speech import split_text, text_to_speech
+
+        paragraphs = [fake_story(40, seed=n) for n in range(3)]
+        story = '\n\n'.join(paragraphs)
+        chunks = split_text(story)
+        check(len(story) < 4096 and chunks == paragraphs, f"a short story is split per paragraph ({len(chunks)} chunks)")
+        check(split_text('Para one. Sentence two.\n\nPara two here. And more.')
+              == ['Para one. Sentence two.', 'Para two here. And more.'], "chunks never span paragraphs")
+        quoted = 'He said "Stop." Then he left (quietly.) The end!'
+        check(split_text(quoted) == [quoted], "closing quotes and brackets stay in their sentence")
+        check(split_text(quoted, max_length=25) == ['He said "Stop."', 'Then he left (quietly.)', 'The end!'],
+              "sentences split after closing quotes and brackets")
+
+        edited = '\n\n'.join([paragraphs[0], paragraphs[1].replace('.', '!', 1), paragraphs[2]])
+        keys = [cache_key(chunk, 'alloy', 'pcm', 'tts-1') for chunk in split_text(story)]
+        edited_keys = [cache_key(chunk, 'alloy', 'pcm', 'tts-1') for chunk in split_text(edited)]
+        changed = [n for n, (key, edited_key) in enumerate(zip(keys, edited_keys)) if key != edited_key]
+        check(len(edited_keys) == len(keys) and changed == [1], f"editing the second paragraph changes only its key ({changed})")
+
+        text_to_speech(story)
+        first = tts_server.requests
+        text_to_speech(edited)
+        check(first == 3 and tts_server.requests - first == 1,
+              f"narrating the edit synthesized {tts_server.requests - first} of {len(edited_keys)} chunks again")
+
+    # Paragraphs of different lengths, so chunks joined out of order would not match
+    story = '\n\n'.join(fake_story(words, seed=10 + n) for n, words in enumerate((12, 40, 25, 7)))
+    with StubTTSServer(latency=0.05, errors=[429, 503]) as tts_server:
+        import app.text_to_speech as tts
+        from app import audio_assets
+        tts.TTS_API_URL = tts_server.url
+        retries = tts_retries()
+        path = tts.text_to_speech(story)
+        chunks = tts.split_text(story)
+        check(os.path.exists(path) and tts_server.requests == len(chunks) + 2,
+              f"one narration after {tts_server.requests} requests for {len(chunks)} chunks")
+        check(tts_retries() - retries == 2, f"both errors were retried and counted ({tts_retries() - retries:g})")
+        expected = np.concatenate([audio_assets.pcm16_to_samples(narration_samples(chunk).tobytes()) for chunk in chunks])
+        samples = audio_assets.load(path).samples
+        check(len(samples) == len(expected) and np.array_equal(samples, expected), "chunks are joined in order")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+Synthetic fixtures and offline stand-ins for the services the pipeline calls, so benchmarks
+run without network access or API keys:
+
+- make_gameplay() and make_narration() write test media with ffmpeg,
+- fake_story() builds story text of a given length,
+- StubTTSServer answers the speech API with tone "words" timed like narration,
+- FakeOpenAI mimics the chat completions client, streaming or not,
+- FakeReddit mimics the part of PRAW that scrape_reddit_story uses.
+"""
+import json
+import random
+import subprocess
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+import numpy as np
+from imageio_ffmpeg import get_ffmpeg_exe
+
+TTS_SAMPLE_RATE = 24000
+WORD_SECONDS = 0.25
+GAP_SECONDS = 0.08
+SENTENCE_GAP_SECONDS = 0.35
+
+_WORDS = ("the morning my neighbor knocked on the door everything changed and I still think about "
+          "what she said when we sat down for coffee after the long night at the hospital").split()
+
+
+def ffmpeg(*args):
+    subprocess.run([get_ffmpeg_exe(), '-y', '-loglevel', 'error', *args], check=True)
+
+
+def make_gameplay(path, seconds=30, size='1080x1920', fps=30):
+    """Writes a moving test pattern video with a keyframe every second and no audio."""
+    ffmpeg('-f', 'lavfi', '-i', f'testsrc=size={size}:rate={fps}', '-t', str(seconds),
+           '-g', str(fps), '-pix_fmt', 'yuv420p', path)
+    return path
+
+
+def narration_timings(text, sample_rate=TTS_SAMPLE_RATE, seed=None):
+    """
+    Returns the start and end sample of each word of text in narration_samples(): longer
+    words take longer to say, around WORD_SECONDS for a four-letter word, and sentences are
+    followed by longer pauses.
+
+    With a seed, the timing is irregular instead, like real speech: word lengths vary
+    independently of their letters, and half the words within a sentence run into the next
+    one with no gap.
+    """
+    rng = random.Random(seed)
+    timings = []
+    position = 0
+    for token in text.split():
+        letters = sum(c.isalnum() for c in token)
+        if seed is None:
+            length = int(WORD_SECONDS * (0.4 + 0.15 * letters) * sample_rate)
+            gap = SENTENCE_GAP_SECONDS if token[-1] in '.!?' else GAP_SECONDS
+        else:
+            length = int(WORD_SECONDS * rng.uniform(0.4, 1.6) * sample_rate)
+            gap = SENTENCE_GAP_SECONDS * rng.uniform(0.6, 1.4) if token[-1] in '.!?' else rng.choice((0, GAP_SECONDS))
+        timings.append((position, position + length))
+        position += length + int(gap * sample_rate)
+    return timings
+
+
+def narration_samples(text, sample_rate=TTS_SAMPLE_RATE, seed=None):
+    """
+    Returns int16 samples that sound like narration to the aligner: one short tone per word,
+    timed by narration_timings().
+    """
+    timings = narration_timings(text, sample_rate, seed)
+    if not timings:
+        return np.zeros(sample_rate // 10, dtype=np.int16)
+    samples = np.zeros(timings[-1][1] + int(SENTENCE_GAP_SECONDS * sample_rate), dtype=np.int16)
+    for start, end in timings:
+        t = np.arange(end - start) / sample_rate
+        samples[start:end] = (np.sin(2 * np.pi * 220 * t) * np.hanning(end - start) * 12000).astype(np.int16)
+    return samples
+
+
+def make_narration(path, text, seed=None):
+    """Writes narration-like audio for text to path, in the format of its extension."""
+    command = [get_ffmpeg_exe(), '-y', '-loglevel', 'error', '-f', 's16le', '-ar', str(TTS_SAMPLE_RATE),
+               '-ac', '1', '-i', '-', path]
+    subprocess.run(command, input=narration_samples(text, seed=seed).tobytes(), check=True)
+    return path
+
+
+def fake_story(words=200, seed=0):
+    """Returns deterministic story-like text of the given number of words."""
+    rng = random.Random(seed)
+    sentences = []
+    remaining = words
+    while remaining > 0:
+        length = min(remaining, rng.randint(6, 16))
+        sentence = ' '.join(rng.choice(_WORDS) for _ in range(length))
+        sentences.append(sentence.capitalize() + '.')
+        remaining -= length
+    return ' '.join(sentences)
+
+
+class StubTTSServer:
+    """
+    Local stand-in for the speech API. Answers every request with narration-like audio for
+    its input, after an optional delay per request to model network and synthesis time.
+    The first requests can be answered with the error statuses in `errors` instead, in order,
+    to exercise retries.
+
+    Use as a context manager; `url` is the endpoint to set as TTS_API_URL.
+    """
+
+    def __init__(self, latency=0.0, errors=()):
+        self.latency = latency
+        self.errors = list(errors)
+        self.requests = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with server._lock:
+                    server.requests += 1
+                    error = server.errors.pop(0) if server.errors else None
+                time.sleep(server.latency)
+                if error is not None:
+                    self.send_response(error)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                samples = narration_samples(body['input'])
+                if body.get('response_format', 'mp3') == 'pcm':
+                    data = samples.tobytes()
+                else:
+                    command = [get_ffmpeg_exe(), '-loglevel', 'error', '-f', 's16le', '-ar', str(TTS_SAMPLE_RATE),
+                               '-ac', '1', '-i', '-', '-f', body['response_format'], '-']
+                    data = subprocess.run(command, input=samples.tobytes(), capture_output=True, check=True).stdout
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self._httpd.server_port}/v1/audio/speech"
+
+    def __enter__(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class FakeOpenAI:
+    """
+    Stand-in for the OpenAI client's chat completions. The "rewrite" appends a sentence
+    mentioning the product to the story found in the prompt.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, stream=False, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        prompt = messages[-1]['content']
+        story = prompt.split("Here's the original story:\n\n", 1)[-1].strip()
+        product = prompt.split("the product '", 1)[-1].split("'", 1)[0]
+        content = f"{story} Later that day I opened a {product} and felt better."
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+        return (SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece + ' '))])
+                for piece in content.split(' '))
+
+
+class FakeReddit:
+    """
+    Stand-in for praw.Reddit: every subreddit lists the same synthetic posts, after an
+    optional delay per listing. `fetches` counts the listings requested.
+    """
+
+    def __init__(self, posts=50, words=200, latency=0.0):
+        self.latency = latency
+        self.fetches = 0
+        self.posts = [SimpleNamespace(id=f"post{n}", title=f"Story number {n}", is_self=True,
+                                      selftext=fake_story(words, seed=n))
+                      for n in range(posts)]
+
+    def subreddit(self, name):
+        return SimpleNamespace(display_name=name, hot=lambda limit=100: self._listing(limit))
+
+    def _listing(self, limit):
+        self.fetches += 1
+        time.sleep(self.latency)
+        return iter(self.posts[:limit])